@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DataportalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dataPortal'
+
+    def ready(self):
+        from . import signals
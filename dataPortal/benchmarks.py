@@ -0,0 +1,143 @@
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .matchIngest import MatchImporter
+from .models import Game, Teams
+from .objectiveData import getObjectiveData
+from .syntheticData import syntheticLeague
+from .teamDataSearch import teamDataSearch, getDraftData, getEndGameDataStats, getTeamTimestampData
+
+'''
+Benchmarks of teamDataSearch and of each aggregator on synthetic leagues. They run on a database of their own, created
+from the migrations next to the site's and destroyed at the end, and every size is imported the way a real import is,
+committing batch by batch, so the searches are timed on committed data (with their worker threads) and the site's data
+is never touched.
+'''
+
+# prefix of the name of the benchmark database, an in-memory database being used on SQLite
+BENCHMARK_DB_PREFIX = 'benchmark_'
+
+
+class SearchParameters:
+    '''
+    The cleaned_data of a CommonDataSearchForm, without the form
+    '''
+
+    def __init__(self, **cleaned_data):
+        self.cleaned_data = {'patch': None, 'competition': None, 'team': None, 'role': 'any', 'player': None,
+                             'teammate': None, 'opponent': None, 'patchFrom': None, 'patchTo': None, 'dateFrom': None,
+                             'dateTo': None, 'draftQuery': None, **cleaned_data}
+
+
+def searchScenarios():
+    return {
+        'all': SearchParameters(),
+        'team': SearchParameters(team=Teams.objects.order_by('pk').values_list('triCode', flat=True).first()),
+        'patch': SearchParameters(patch=Game.objects.order_by('pk').values_list('patch', flat=True).first()),
+    }
+
+
+def searchStages(search):
+    games = Game.objects.all()
+    if search.cleaned_data['patch']:
+        games = games.filter(patch=search.cleaned_data['patch'])
+    if search.cleaned_data['team']:
+        games = games.filter(teamB__triCode=search.cleaned_data['team']) | games.filter(
+            teamR__triCode=search.cleaned_data['team'])
+    games = games.values('pk')
+    role = search.cleaned_data['role']
+    return {
+        'teamDataSearch': lambda: teamDataSearch(search),
+        'getDraftData': lambda: getDraftData(games, role).nested(),
+        'getEndGameDataStats': lambda: getEndGameDataStats(games, role).nested(),
+        'getTeamTimestampData': lambda: getTeamTimestampData(games, role).nested(),
+        'getObjectiveData': lambda: getObjectiveData(games, games.count()),
+    }
+
+
+@contextmanager
+def benchmarkDatabase(verbosity=0):
+    '''
+    Switches the default connection to a new, migrated benchmark database for the duration of the block, then destroys
+    it and switches back
+    '''
+    testSettings = connection.settings_dict['TEST']
+    testName = testSettings.get('NAME')
+    if connection.vendor != 'sqlite':
+        testSettings['NAME'] = BENCHMARK_DB_PREFIX + connection.settings_dict['NAME']
+    siteName = connection.settings_dict['NAME']
+    try:
+        connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(siteName, verbosity=verbosity)
+    finally:
+        testSettings['NAME'] = testName
+
+
+def measure(function, repeats):
+    '''
+    Runs a function `repeats` times and reports its median wall time, the queries of one run and its peak Python memory
+    '''
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        function()
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'medianSeconds': statistics.median(timings),
+        'minSeconds': min(timings),
+        'queries': len(queries.captured_queries),
+        'queriesSeconds': sum(float(query['time']) for query in queries.captured_queries),
+        'peakMemoryBytes': peakMemory,
+    }
+
+
+def runBenchmarks(sizes=(1000, 10000, 100000), teams=10, playersPerTeam=5, timestampsPerGame=4, repeats=3, seed=0,
+                  log=None):
+    report = {
+        'database': connection.vendor,
+        'parameters': {'teams': teams, 'playersPerTeam': playersPerTeam, 'timestampsPerGame': timestampsPerGame,
+                       'repeats': repeats, 'seed': seed},
+        'sizes': {},
+    }
+
+    with benchmarkDatabase():
+        for size in sizes:
+            # every size starts from an empty league
+            call_command('flush', interactive=False, verbosity=0)
+            importer = MatchImporter(batchSize=500)
+            started = time.perf_counter()
+            importer.importMatches(syntheticLeague(games=size, teams=teams, playersPerTeam=playersPerTeam,
+                                                   timestampsPerGame=timestampsPerGame, seed=seed))
+            sizeReport = {
+                'import': {'seconds': time.perf_counter() - started, 'rows': importer.rowsWritten},
+                'scenarios': {},
+            }
+
+            for scenario, search in searchScenarios().items():
+                sizeReport['scenarios'][scenario] = {}
+                for stage, function in searchStages(search).items():
+                    try:
+                        result = measure(function, repeats)
+                    except Exception as error:
+                        result = {'error': '%s: %s' % (type(error).__name__, error)}
+                    sizeReport['scenarios'][scenario][stage] = result
+                    if log:
+                        log('%d games, %s, %s: %s' % (size, scenario, stage, result))
+
+            report['sizes'][str(size)] = sizeReport
+
+    return report
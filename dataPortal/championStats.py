@@ -0,0 +1,130 @@
+import numpy as np
+from django.db.models import QuerySet
+from .forms import CommonDataSearchForm
+from .instrumentation import timedStage
+from .models import Game, DraftPick
+from .searchCache import cacheable, getDataVersion, getSearchCache, searchCacheKey
+from .teamDataSearch import getSearchedGames
+
+'''
+Champion analytics over the filtered games. The drafts and winners are loaded once into NumPy arrays, with champions
+mapped to integer ids, and every statistic is then computed on whole arrays: pick, ban and win counts per champion and
+the champion x champion matrix of lane matchups (the champions of the same role on opposite sides).
+'''
+
+ROLES = ('top', 'jgl', 'mid', 'bot', 'sup')
+BANS = ('ban1', 'ban2', 'ban3', 'ban4', 'ban5')
+
+
+class DraftArrays:
+    '''
+    The drafts of a set of games: champions[i] is the name of champion id i, picks[game, side, role] and
+    bans[game, side, ban] are champion ids (-1 where the slot is empty) and winningSide[game] is 0 for blue, 1 for red
+    '''
+
+    def __init__(self, champions, picks, bans, winningSide):
+        self.champions = champions
+        self.picks = picks
+        self.bans = bans
+        self.winningSide = winningSide
+
+    @property
+    def games(self):
+        return len(self.winningSide)
+
+
+def loadDraftArrays(games: QuerySet):
+    gameRows = np.array(list(Game.objects.filter(pk__in=games).order_by('pk').values_list('pk', 'winnerTeam', 'teamB')),
+                        dtype=np.int64).reshape(-1, 3)
+    slots = ROLES + BANS
+    slotIDs = {slot: i for i, slot in enumerate(slots)}
+    picks = list(DraftPick.objects.filter(gameID__in=games, slot__in=slots).values_list('gameID', 'side', 'slot',
+                                                                                          'champion'))
+    gameIDs, sides, slotNames, championNames = zip(*picks) if picks else ((), (), (), ())
+
+    champions, championIDs = np.unique(np.array(championNames, dtype=str), return_inverse=True)
+    table = np.full((len(gameRows), 2, len(slots)), -1, dtype=np.int64)
+    table[np.searchsorted(gameRows[:, 0], np.array(gameIDs, dtype=np.int64)),
+          (np.array(sides, dtype=str) == 'R').astype(np.int64),
+          np.fromiter((slotIDs[slot] for slot in slotNames), dtype=np.int64, count=len(slotNames))] = championIDs
+    # an empty slot (a missing ban, a remake...) is stored as an empty name, which must not count as a champion
+    if len(champions) and champions[0] == '':
+        champions = champions[1:]
+        table[table == 0] = -1
+        table[table > 0] -= 1
+
+    return DraftArrays(champions.tolist(), table[:, :, :len(ROLES)], table[:, :, len(ROLES):],
+                       (gameRows[:, 1] != gameRows[:, 2]).astype(np.int64))
+
+
+def _counts(ids, size):
+    ids = ids[ids >= 0]
+    return np.bincount(ids, minlength=size)
+
+
+def _rates(numerators, denominators):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = numerators / denominators
+    return [None if np.isnan(rate) else float(rate) for rate in rates]
+
+
+@timedStage
+def getChampionStats(games: QuerySet, roleSearched: str = 'any'):
+    '''
+    Pick, ban and win counts and rates of every champion in the games, and the win rates of their lane matchups.
+    With a role searched, picks, wins and matchups only count that role
+    '''
+    draft = loadDraftArrays(games)
+    size = len(draft.champions)
+    roles = slice(None) if roleSearched.lower() == 'any' else slice(ROLES.index(roleSearched.lower()),
+                                                                    ROLES.index(roleSearched.lower()) + 1)
+    picks = draft.picks[:, :, roles]
+
+    won = np.zeros(picks.shape, dtype=bool)
+    won[np.arange(draft.games), draft.winningSide] = True
+    pickCounts = _counts(picks.ravel(), size)
+    winCounts = _counts(picks[won], size)
+    banCounts = _counts(draft.bans.ravel(), size)
+
+    # blue's champion against red's in every role, counted from both sides: matchupGames[a, b] is the number of
+    # times a met b in lane and matchupWins[a, b] the number of those a won
+    blue, red = picks[:, 0, :].ravel(), picks[:, 1, :].ravel()
+    blueWon = np.repeat(draft.winningSide == 0, picks.shape[2])
+    played = (blue >= 0) & (red >= 0)
+    blue, red, blueWon = blue[played], red[played], blueWon[played]
+    matchupGames = np.zeros((size, size), dtype=np.int64)
+    matchupWins = np.zeros((size, size), dtype=np.int64)
+    np.add.at(matchupGames, (blue, red), 1)
+    np.add.at(matchupGames, (red, blue), 1)
+    np.add.at(matchupWins, (blue[blueWon], red[blueWon]), 1)
+    np.add.at(matchupWins, (red[~blueWon], blue[~blueWon]), 1)
+
+    champions, opponents = np.nonzero(matchupGames)
+    return {
+        'games': draft.games,
+        'champions': draft.champions,
+        'picks': pickCounts.tolist(),
+        'bans': banCounts.tolist(),
+        'wins': winCounts.tolist(),
+        'pickRate': _rates(pickCounts, draft.games) if draft.games else [None] * size,
+        'banRate': _rates(banCounts, draft.games) if draft.games else [None] * size,
+        'presence': _rates(pickCounts + banCounts, draft.games) if draft.games else [None] * size,
+        'winRate': _rates(winCounts, pickCounts),
+        # [champion, opponent, games, wins of champion] for every pair that met in lane, indices into champions
+        'matchups': np.stack([champions, opponents, matchupGames[champions, opponents],
+                              matchupWins[champions, opponents]], axis=1).tolist(),
+    }
+
+
+def cachedChampionStats(form: CommonDataSearchForm):
+    '''
+    getChampionStats of the games matching the form, cached under the search (so per patch) and the data version
+    '''
+    version = getDataVersion()
+    key = searchCacheKey(form.cleaned_data, version, prefix='championStats')
+    championStats = getSearchCache().get(key)
+    if championStats is None:
+        championStats = getChampionStats(getSearchedGames(form).values('pk'), form.cleaned_data['role'] or 'any')
+        if cacheable(form.cleaned_data, version):
+            getSearchCache().set(key, championStats)
+    return championStats
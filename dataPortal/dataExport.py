@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from django.db.models import QuerySet, Model
+from .forms import CommonDataSearchForm
+from .models import Game, PlayerEndGameStats, PlayerTimeData, Draft, ObjectiveEvent, DRAFT_SLOTS
+from .teamDataSearch import getSearchedGames
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+'''
+Bulk export of the games matching a search: one table of games and one per fact table, flattened to plain columns
+(teams, players and games by their names instead of their pks) and written as CSV or Parquet. Rows are read in pages
+of chunkSize by primary key (keyset pagination, so every page is an indexed range scan and the driver never buffers
+more than a page) and each page becomes one Parquet row group, so memory stays flat whatever the size of the export.
+'''
+
+EXPORT_FORMATS = ('csv', 'parquet')
+DEFAULT_CHUNK_SIZE = 10000
+
+# table: (model, [(column, lookup)]), the lookups being read with values_list
+EXPORT_TABLES = {
+    'games': (Game, [
+        ('game', 'gameID'), ('competition', 'competitionID__name'), ('date', 'date'), ('patch', 'patch'),
+        ('gameLength', 'gameLength'), ('blueTeam', 'teamB__triCode'), ('redTeam', 'teamR__triCode'),
+        ('winner', 'winnerTeam__triCode'),
+    ]),
+    'endGameStats': (PlayerEndGameStats, [
+        ('game', 'gameID__gameID'), ('team', 'team__triCode'), ('side', 'side'), ('role', 'role'),
+        ('player', 'player__summonerName'), ('kills', 'kills'), ('deaths', 'deaths'), ('assists', 'assists'),
+        ('gold', 'gold'), ('minions', 'minions'), ('wardPlaced', 'wardPlaced'), ('wardKilled', 'wardKilled'),
+        ('visionScore', 'visionScore'), ('DMGtoChamps', 'DMGtoChamps'), ('DMGtoTowers', 'DMGtoTowers'),
+        ('gameSeconds', 'gameSeconds'), ('gpm', 'gpm'), ('cspm', 'cspm'), ('vspm', 'vspm'), ('dpm', 'dpm'),
+    ]),
+    'timeData': (PlayerTimeData, [
+        ('game', 'gameID__gameID'), ('team', 'team__triCode'), ('side', 'side'), ('role', 'role'),
+        ('player', 'player__summonerName'), ('champ', 'champ'), ('time', 'time'), ('kills', 'kills'),
+        ('deaths', 'deaths'), ('assists', 'assists'), ('gold', 'gold'), ('minions', 'minions'), ('exp', 'exp'),
+        ('goldDiff', 'goldDiff'), ('expDiff', 'expDiff'),
+    ]),
+    'draft': (Draft, [('game', 'gameID__gameID'), ('side', 'side')] + [(slot, slot) for slot in DRAFT_SLOTS]),
+    'objectives': (ObjectiveEvent, [
+        ('game', 'gameID__gameID'), ('type', 'type'), ('team', 'team__triCode'), ('side', 'side'),
+        ('detail', 'detail'), ('killer', 'killer__summonerName'), ('assistants', 'assistants'), ('first', 'first'),
+        ('time', 'time'),
+    ]),
+}
+
+
+def exportQuerySet(table: str, games: QuerySet, roleSearched: str = 'any'):
+    model, _ = EXPORT_TABLES[table]
+    if model is Game:
+        return Game.objects.filter(pk__in=games)
+    rows = model.objects.filter(gameID__in=games)
+    if roleSearched.lower() != 'any' and any(field.name == 'role' for field in model._meta.fields):
+        rows = rows.filter(role=roleSearched.lower())
+    return rows
+
+
+def _exportValue(value):
+    # durations in seconds and JSON as text, so both formats hold plain scalars
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def iterExportChunks(rows: QuerySet, lookups, chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Yields the rows of a queryset as lists of at most chunkSize tuples of the lookups, in primary key order
+    '''
+    last = None
+    while True:
+        page = rows.order_by('pk') if last is None else rows.filter(pk__gt=last).order_by('pk')
+        chunk = list(page.values_list('pk', *lookups)[:chunkSize])
+        if not chunk:
+            return
+        last = chunk[-1][0]
+        yield [tuple(_exportValue(value) for value in row[1:]) for row in chunk]
+        if len(chunk) < chunkSize:
+            return
+
+
+def _fieldOf(model: Model, lookup: str):
+    field = None
+    for name in lookup.split('__'):
+        field = model._meta.get_field(name)
+        model = field.related_model
+    return field
+
+
+def parquetSchema(table: str):
+    model, columns = EXPORT_TABLES[table]
+    types = {
+        'IntegerField': pyarrow.int64(), 'BigAutoField': pyarrow.int64(), 'FloatField': pyarrow.float64(),
+        'BooleanField': pyarrow.bool_(), 'DateField': pyarrow.date32(), 'DurationField': pyarrow.float64(),
+    }
+    return pyarrow.schema([(column, types.get(_fieldOf(model, lookup).get_internal_type(), pyarrow.string()))
+                           for column, lookup in columns])
+
+
+class _StreamBuffer(io.RawIOBase):
+    '''
+    Write-only file that hands back what was written since the last drain, so a writer's output can be streamed
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iterCSV(table: str, rows: QuerySet, chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Yields a table as CSV text, the header first and then one piece per chunk
+    '''
+    _, columns = EXPORT_TABLES[table]
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow([column for column, _ in columns])
+    for chunk in iterExportChunks(rows, [lookup for _, lookup in columns], chunkSize):
+        writer.writerows(chunk)
+        yield text.getvalue()
+        text.seek(0)
+        text.truncate()
+    if text.tell():
+        yield text.getvalue()
+
+
+def iterParquet(table: str, rows: QuerySet, chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Yields a table as the bytes of a Parquet file with one row group per chunk
+    '''
+    _, columns = EXPORT_TABLES[table]
+    schema = parquetSchema(table)
+    stream = _StreamBuffer()
+    writer = pyarrow.parquet.ParquetWriter(stream, schema)
+    for chunk in iterExportChunks(rows, [lookup for _, lookup in columns], chunkSize):
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=column.type) for values, column in zip(zip(*chunk), schema)], schema=schema))
+        yield stream.drain()
+    writer.close()
+    yield stream.drain()
+
+
+def iterExport(form: CommonDataSearchForm, table: str, exportFormat='csv', chunkSize=DEFAULT_CHUNK_SIZE):
+    '''
+    Streams one table of the games matching the search in the given format. Raises ValueError when the format cannot
+    be written
+    '''
+    if exportFormat not in EXPORT_FORMATS:
+        raise ValueError('Unknown export format: %s' % exportFormat)
+    if exportFormat == 'parquet' and pyarrow is None:
+        raise ValueError('Parquet exports need pyarrow to be installed.')
+    rows = exportQuerySet(table, getSearchedGames(form).values('pk'), form.cleaned_data['role'] or 'any')
+    if exportFormat == 'parquet':
+        return iterParquet(table, rows, chunkSize)
+    return iterCSV(table, rows, chunkSize)
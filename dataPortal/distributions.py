@@ -0,0 +1,122 @@
+from django.db.models import QuerySet
+from .instrumentation import timedStage
+from .models import PlayerEndGameRollup, PlayerEndGameStats, PlayerTimeData, PlayerTimeRollup
+from .rollups import getRollupCells, gameKDA, TIME_SKETCHES, END_SKETCHES
+from .sketches import TDigest, mergeSketches
+from .flatSection import FlatSection
+
+'''
+Distribution sections of the team search: quantiles of the gold and experience differentials at each timestamp and of
+the per game KDA and per minute stats. Searches the rollups can express merge the sketches stored in the cells; any
+other search streams the raw rows of its games into fresh sketches.
+'''
+
+DISTRIBUTION_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+DISTRIBUTION_SECTIONS = ('timeStampDistribution', 'endDistribution')
+DISTRIBUTION_FIELDS = {
+    'timeStampDistribution': ('goldDiff', 'expDiff'),
+    'endDistribution': ('KDA', 'GPM', 'CSPM', 'VSPM', 'DPM'),
+}
+
+
+def summarize(digest: TDigest):
+    '''
+    The number of values of a sketch and its DISTRIBUTION_QUANTILES, as {"count": n, "p10": ..., "p90": ...}
+    '''
+    if not digest.count:
+        return None
+    return {'count': digest.count, **{'p%d' % round(q * 100): digest.quantile(q) for q in DISTRIBUTION_QUANTILES}}
+
+
+def _projected(sectionFields, fields):
+    return [field for field in sectionFields if not fields or field in fields]
+
+
+@timedStage
+def getTimestampDistributions(games: QuerySet, roleSearched: str, fields=None, rollupSearch=None):
+    '''
+    Quantiles of goldDiff and expDiff of every player at each timestamp, keyed like getTeamTimestampData. The
+    sketches of a group are released as soon as it is summarized
+    '''
+    stats = _projected(DISTRIBUTION_FIELDS['timeStampDistribution'], fields)
+    groups = {}
+    if rollupSearch is not None:
+        cells = getRollupCells(rollupSearch, PlayerTimeRollup)
+        sketchFields = [sketch for stat, sketch in zip(DISTRIBUTION_FIELDS['timeStampDistribution'], TIME_SKETCHES)
+                        if stat in stats]
+    else:
+        cells = PlayerTimeData.objects.filter(gameID__in=games)
+        sketchFields = stats
+    if roleSearched.lower() != 'any':
+        cells = cells.filter(role=roleSearched.lower())
+
+    rows = cells.values_list('side', 'team__triCode', 'role', 'player__summonerName', 'champ', 'time', *sketchFields)
+    for row in rows.iterator(chunk_size=5000):
+        key, values = row[:6], row[6:]
+        if rollupSearch is not None:
+            group = groups.setdefault(key, [[] for _ in stats])
+            for sketches, sketch in zip(group, values):
+                sketches.append(sketch)
+        else:
+            group = groups.setdefault(key, [TDigest() for _ in stats])
+            for digest, value in zip(group, values):
+                digest.add(value)
+
+    timeStampDistribution = FlatSection(stats, suffixed=stats)
+    while groups:
+        key, group = groups.popitem()
+        digests = [mergeSketches(sketches) for sketches in group] if rollupSearch is not None else group
+        timeStampDistribution[key] = tuple(summarize(digest) for digest in digests)
+    return timeStampDistribution
+
+
+@timedStage
+def getEndGameDistributions(games: QuerySet, roleSearched: str, fields=None, rollupSearch=None):
+    '''
+    Quantiles of the per game KDA (deathless games counting one death) and per minute stats of every player, keyed
+    like getEndGameDataStats
+    '''
+    stats = _projected(DISTRIBUTION_FIELDS['endDistribution'], fields)
+    groups = {}
+    if rollupSearch is not None:
+        cells = getRollupCells(rollupSearch, PlayerEndGameRollup)
+        columns = [sketch for stat, sketch in zip(DISTRIBUTION_FIELDS['endDistribution'], END_SKETCHES)
+                   if stat in stats]
+    else:
+        cells = PlayerEndGameStats.objects.filter(gameID__in=games)
+        columns = ['kills', 'deaths', 'assists', 'gpm', 'cspm', 'vspm', 'dpm']
+    if roleSearched.lower() != 'any':
+        cells = cells.filter(role=roleSearched.lower())
+
+    rows = cells.values_list('team__triCode', 'side', 'role', 'player__summonerName', *columns)
+    for row in rows.iterator(chunk_size=5000):
+        key, values = row[:4], row[4:]
+        if rollupSearch is not None:
+            group = groups.setdefault(key, [[] for _ in stats])
+            for sketches, sketch in zip(group, values):
+                sketches.append(sketch)
+        else:
+            kills, deaths, assists, *perMinute = values
+            values = dict(zip(DISTRIBUTION_FIELDS['endDistribution'], (gameKDA(kills, deaths, assists), *perMinute)))
+            group = groups.setdefault(key, [TDigest() for _ in stats])
+            for digest, stat in zip(group, stats):
+                digest.add(values[stat])
+
+    endDistribution = FlatSection(stats)
+    while groups:
+        key, group = groups.popitem()
+        digests = [mergeSketches(sketches) for sketches in group] if rollupSearch is not None else group
+        endDistribution[key] = tuple(summarize(digest) for digest in digests)
+    return endDistribution
+
+
+def getDistributions(games: QuerySet, roleSearched: str, sections=None, fields=None, rollupSearch=None):
+    fields = fields or {}
+    distributions = {}
+    if sections is None or 'timeStampDistribution' in sections:
+        distributions['timeStampDistribution'] = getTimestampDistributions(
+            games, roleSearched, fields.get('timeStampDistribution'), rollupSearch)
+    if sections is None or 'endDistribution' in sections:
+        distributions['endDistribution'] = getEndGameDistributions(games, roleSearched, fields.get('endDistribution'),
+                                                                   rollupSearch)
+    return distributions
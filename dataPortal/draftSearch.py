@@ -0,0 +1,264 @@
+import json
+import re
+import threading
+import numpy as np
+from django.db import NotSupportedError, connection
+from django.db.models.expressions import RawSQL
+from .models import Game, DraftPick, DRAFT_SLOTS
+
+'''
+Draft search: queries such as "enemy:Azir AND enemy:Rell" or "us.pick1:Orianna AND NOT ban:Rell" resolved against an
+inverted index of the drafts. The index keeps, for every (champion, side, slot), the sorted positions of the games
+that champion was drafted in; a query turns each of its terms into a boolean array over all the games and combines
+them with array AND/OR/NOT, so it never touches the database. The index lives in memory and is rebuilt once the data
+version changed, before the next query is answered, so the games a query returns are always those of the current data.
+Callers that prefer speed to freshness can ask for the previous index (stale=True) while a background thread rebuilds
+it.
+
+A term is [qualifiers:]champion, the qualifiers being separated by dots:
+    us, enemy     the searched team's side or the other one (needs a team)
+    blue, red     a side; either side when no side is given
+    pick, ban     any pick or any ban; a champion means a pick when no slot is given
+    pick1..pick5, ban1..ban5, top, jgl, mid, bot, sup   one slot of the draft
+Champion names are matched ignoring case, spaces and punctuation, and are quoted when they hold spaces ("Lee Sin").
+'''
+
+SCOPES = ('us', 'enemy', 'blue', 'red')
+SLOT_GROUPS = {
+    'pick': ('pick1', 'pick2', 'pick3', 'pick4', 'pick5'),
+    'ban': ('ban1', 'ban2', 'ban3', 'ban4', 'ban5'),
+}
+
+_TOKEN = re.compile(r'\s*(\(|\)|[^\s()"]*"[^"]*"|[^\s()"]+)')
+_TERM = re.compile(r'^(?:([\w.]+):)?(?:"([^"]*)"|([^":]+))$')
+
+
+def championKey(champion: str):
+    return re.sub(r'[^a-z0-9]', '', champion.lower())
+
+
+def _slotsOf(qualifier):
+    if qualifier in SLOT_GROUPS:
+        return SLOT_GROUPS[qualifier]
+    if qualifier in DRAFT_SLOTS:
+        return (qualifier,)
+    return None
+
+
+def parseTerm(token: str):
+    match = _TERM.match(token)
+    if not match or not (match.group(2) or match.group(3) or '').strip():
+        raise ValueError('"%s" is not a champion term.' % token)
+    scope, slots = None, None
+    for qualifier in match.group(1).lower().split('.') if match.group(1) else ():
+        if qualifier in SCOPES and scope is None:
+            scope = qualifier
+        elif _slotsOf(qualifier) and slots is None:
+            slots = _slotsOf(qualifier)
+        else:
+            raise ValueError('Unknown or repeated qualifier "%s" in "%s".' % (qualifier, token))
+    return ('term', scope, slots or SLOT_GROUPS['pick'], championKey(match.group(2) or match.group(3)))
+
+
+def parseDraftQuery(query: str):
+    '''
+    Parses a draft query into nested tuples: ('and', left, right), ('or', left, right), ('not', operand) and
+    ('term', scope, slots, championKey). AND binds tighter than OR. Raises ValueError on a malformed query
+    '''
+    tokens, position = [], 0
+    while query[position:].strip():
+        match = _TOKEN.match(query, position)
+        if not match:
+            raise ValueError('Unbalanced quote in the draft query.')
+        tokens.append(match.group(1))
+        position = match.end()
+
+    def peek():
+        return tokens[0].upper() if tokens else None
+
+    def parseOr():
+        node = parseAnd()
+        while peek() == 'OR':
+            tokens.pop(0)
+            node = ('or', node, parseAnd())
+        return node
+
+    def parseAnd():
+        node = parseNot()
+        while peek() == 'AND':
+            tokens.pop(0)
+            node = ('and', node, parseNot())
+        return node
+
+    def parseNot():
+        if peek() == 'NOT':
+            tokens.pop(0)
+            return ('not', parseNot())
+        return parseAtom()
+
+    def parseAtom():
+        if not tokens:
+            raise ValueError('The draft query ends too early.')
+        token = tokens.pop(0)
+        if token == '(':
+            node = parseOr()
+            if not tokens or tokens.pop(0) != ')':
+                raise ValueError('Missing closing parenthesis in the draft query.')
+            return node
+        if token == ')' or token.upper() in ('AND', 'OR', 'NOT'):
+            raise ValueError('Unexpected "%s" in the draft query.' % token)
+        return parseTerm(token)
+
+    node = parseOr()
+    if tokens:
+        raise ValueError('Unexpected "%s" in the draft query.' % tokens[0])
+    return node
+
+
+def usesTeamScope(node):
+    if node[0] == 'term':
+        return node[1] in ('us', 'enemy')
+    return any(usesTeamScope(operand) for operand in node[1:])
+
+
+class DraftIndex:
+    '''
+    gamePKs[i] is the pk of game position i, blueTeams and redTeams the triCodes of its teams, and
+    postings[(championKey, side, slot)] the sorted positions of the games where that side drafted the champion in
+    that slot
+    '''
+
+    def __init__(self, gamePKs, blueTeams, redTeams, postings):
+        self.gamePKs = gamePKs
+        self.blueTeams = blueTeams
+        self.redTeams = redTeams
+        self.postings = postings
+
+    def drafted(self, champion, side, slots):
+        mask = np.zeros(len(self.gamePKs), dtype=bool)
+        for slot in slots:
+            positions = self.postings.get((champion, side, slot))
+            if positions is not None:
+                mask[positions] = True
+        return mask
+
+    def evaluate(self, node, team=None):
+        '''
+        The boolean array over gamePKs of the games matching a parsed query, us and enemy being relative to team
+        '''
+        if node[0] == 'and':
+            return self.evaluate(node[1], team) & self.evaluate(node[2], team)
+        if node[0] == 'or':
+            return self.evaluate(node[1], team) | self.evaluate(node[2], team)
+        if node[0] == 'not':
+            return ~self.evaluate(node[1], team)
+
+        _, scope, slots, champion = node
+        blue, red = self.drafted(champion, 'B', slots), self.drafted(champion, 'R', slots)
+        if scope == 'blue':
+            return blue
+        if scope == 'red':
+            return red
+        if scope in ('us', 'enemy'):
+            teamBlue, teamRed = self.blueTeams == team, self.redTeams == team
+            if scope == 'us':
+                return (blue & teamBlue) | (red & teamRed)
+            return (blue & teamRed) | (red & teamBlue)
+        return blue | red
+
+    def games(self, node, team=None):
+        return self.gamePKs[self.evaluate(node, team)].tolist()
+
+
+def buildDraftIndex():
+    games = list(Game.objects.order_by('pk').values_list('pk', 'teamB__triCode', 'teamR__triCode'))
+    gamePKs = np.array([game[0] for game in games], dtype=np.int64)
+    blueTeams = np.array([game[1] for game in games], dtype=object)
+    redTeams = np.array([game[2] for game in games], dtype=object)
+
+    positions = {}
+    picks = DraftPick.objects.exclude(champion='').values_list('gameID', 'side', 'slot', 'champion')
+    for game, side, slot, champion in picks.iterator(chunk_size=5000):
+        positions.setdefault((championKey(champion), side, slot), []).append(game)
+    postings = {key: np.searchsorted(gamePKs, np.array(sorted(pks), dtype=np.int64)).astype(np.int32) for key, pks in positions.items()}
+    return DraftIndex(gamePKs, blueTeams, redTeams, postings)
+
+
+_indexLock = threading.Lock()
+# held while an index is built, so that concurrent queries wait for one build instead of each running their own
+_buildLock = threading.Lock()
+_index = {'version': None, 'index': None, 'building': None}
+
+
+def _storeDraftIndex(index, version):
+    with _indexLock:
+        if _index['version'] is None or version >= _index['version']:
+            _index['index'], _index['version'] = index, version
+
+
+def _buildCurrentDraftIndex(version):
+    with _buildLock:
+        if _index['version'] is not None and _index['version'] >= version:
+            return _index['index']
+        index = buildDraftIndex()
+        _storeDraftIndex(index, version)
+        return index
+
+
+def _rebuildDraftIndex(version):
+    try:
+        _buildCurrentDraftIndex(version)
+    finally:
+        with _indexLock:
+            _index['building'] = None
+        connection.close()
+
+
+def getDraftIndex(stale=False):
+    '''
+    The draft index at the current data version, rebuilt first when the data changed since it was built. With stale
+    set, the previous index is returned instead while a background thread rebuilds it, unless there is none yet or
+    inside a transaction (whose rows another connection cannot see)
+    '''
+    from .searchCache import getDataVersion
+    version = getDataVersion()
+    with _indexLock:
+        if _index['version'] == version:
+            return _index['index']
+        if _index['index'] is not None and stale and not connection.in_atomic_block:
+            if _index['building'] is None:
+                _index['building'] = version
+                threading.Thread(target=_rebuildDraftIndex, args=(version,), name='draftIndex', daemon=True).start()
+            return _index['index']
+    return _buildCurrentDraftIndex(version)
+
+
+def draftIndexVersion():
+    '''
+    The data version the draft index answering queries was built at
+    '''
+    return _index['version']
+
+
+def draftQueryGames(query: str, team=None, stale=False):
+    '''
+    The pks of the games matching a draft query, us and enemy being the sides of the team with this triCode. stale is
+    passed to getDraftIndex
+    '''
+    return getDraftIndex(stale).games(parseDraftQuery(query), team)
+
+
+def gamePKsSubquery(pks):
+    '''
+    A list of pks as a subquery reading a single JSON parameter, so that filtering on thousands of games does not
+    become an IN list of thousands of parameters (which SQLite caps). Raises NotSupportedError on other databases
+    '''
+    if connection.vendor == 'sqlite':
+        sql = 'SELECT value FROM json_each(%s)'
+    elif connection.vendor == 'mysql':
+        sql = "SELECT pk FROM JSON_TABLE(%s, '$[*]' COLUMNS (pk BIGINT PATH '$')) AS draftGames"
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT jsonb_array_elements_text(%s::jsonb)::bigint'
+    else:
+        raise NotSupportedError('Draft queries need a JSON table function, which %s lacks.' % connection.vendor)
+    return RawSQL(sql, [json.dumps(pks)])
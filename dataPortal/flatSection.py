@@ -0,0 +1,45 @@
+'''
+The sections of teamData are computed flat: one entry per group of the aggregation, keyed by the tuple of its
+dimension values and holding the tuple of its values, instead of a tree of nested dicts (a dict per node and a dict
+per leaf). The nested shape served by the templates, the API and the cache is only built by nested(), once the
+section is complete.
+'''
+
+
+class FlatSection:
+    '''
+    rows maps (dimension values, outermost first) to the tuple of the values named by fields, or to a single value when
+    fields is None. The fields listed in suffixed are named field@time, time being the last dimension
+    '''
+    __slots__ = ('fields', 'suffixed', 'rows', 'dimensionValues')
+
+    def __init__(self, fields=None, suffixed=()):
+        self.fields = tuple(fields) if fields is not None else None
+        self.suffixed = tuple(suffixed)
+        self.rows = {}
+        # every row read from the database brings its own copy of each team, player... name: keys share one instead
+        self.dimensionValues = {}
+
+    def __setitem__(self, key, values):
+        self.rows[tuple(self.dimensionValues.setdefault(value, value) for value in key)] = values
+
+    def __len__(self):
+        return len(self.rows)
+
+    def labels(self, key):
+        return [f'{field}@{key[-1]}' if field in self.suffixed else field for field in self.fields]
+
+    def nested(self):
+        nested = {}
+        labels = {}
+        for key, values in self.rows.items():
+            node = nested
+            for dimension in key[:-1]:
+                node = node.setdefault(dimension, {})
+            if self.fields is None:
+                node[key[-1]] = values
+            else:
+                if key[-1] not in labels:
+                    labels[key[-1]] = self.labels(key)
+                node[key[-1]] = dict(zip(labels[key[-1]], values))
+        return nested
@@ -1,11 +1,19 @@
+from datetime import date, timedelta
 from django import forms
-from .models import Game, Player, Teams
+from .draftSearch import parseDraftQuery, usesTeamScope
+from .models import patchKey
+from .searchChoices import searchChoicesFor
 
 
 class CommonDataSearchForm(forms.Form):
-    patch = forms.ModelChoiceField(queryset=Game.objects.values_list('patch', flat=True).distinct(), required=False)
-    competition = forms.ModelChoiceField(queryset=Game.objects.values_list('competition', flat=True).distinct(), required=False)
-    team = forms.ModelChoiceField(queryset=Teams.objects.values_list('triCode', flat=True).distinct(), required=False)
+    patch = forms.ChoiceField(choices=searchChoicesFor('patch'), required=False)
+    patchFrom = forms.ChoiceField(choices=searchChoicesFor('patch'), required=False)
+    patchTo = forms.ChoiceField(choices=searchChoicesFor('patch'), required=False)
+    dateFrom = forms.DateField(required=False)
+    dateTo = forms.DateField(required=False)
+    lastDays = forms.IntegerField(min_value=1, required=False)
+    competition = forms.ChoiceField(choices=searchChoicesFor('competition'), required=False)
+    team = forms.ChoiceField(choices=searchChoicesFor('team'), required=False)
     role = forms.ChoiceField(choices=[
         ('any', 'Any'),
         ('top', 'Toplane'),
@@ -14,7 +22,34 @@ class CommonDataSearchForm(forms.Form):
         ('bot', 'Botlane'),
         ('sup', 'Support'),
     ], required=False)
-    player = forms.ModelChoiceField(queryset=Player.objects.values_list('summonerName', flat=True).distinct(),
-                                    required=False)
+    player = forms.ChoiceField(choices=searchChoicesFor('player'), required=False)
+    teammate = forms.ChoiceField(choices=searchChoicesFor('player'), required=False)
+    opponent = forms.ChoiceField(choices=searchChoicesFor('player'), required=False)
+    draftQuery = forms.CharField(max_length=500, required=False)
 
 
+    def clean(self):
+        cleaned_data = super().clean()
+        patchFrom, patchTo = cleaned_data.get('patchFrom'), cleaned_data.get('patchTo')
+        if patchFrom and patchTo and patchKey(patchFrom) > patchKey(patchTo):
+            self.add_error('patchTo', 'The last patch comes before the first one.')
+
+        # "last N days" is resolved into dateFrom and dropped here, so the search and its cache key only ever see a
+        # date range
+        lastDays = cleaned_data.pop('lastDays', None)
+        if lastDays:
+            since = date.today() - timedelta(days=lastDays)
+            cleaned_data['dateFrom'] = max(cleaned_data['dateFrom'], since) if cleaned_data.get('dateFrom') else since
+        dateFrom, dateTo = cleaned_data.get('dateFrom'), cleaned_data.get('dateTo')
+        if dateFrom and dateTo and dateFrom > dateTo:
+            self.add_error('dateTo', 'The end date comes before the start date.')
+
+        if cleaned_data.get('draftQuery'):
+            try:
+                query = parseDraftQuery(cleaned_data['draftQuery'])
+            except ValueError as error:
+                self.add_error('draftQuery', str(error))
+            else:
+                if usesTeamScope(query) and not cleaned_data.get('team'):
+                    self.add_error('draftQuery', 'us and enemy need a team to be searched.')
+        return cleaned_data
@@ -0,0 +1,180 @@
+import functools
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+'''
+Per-stage timing of the search: every function decorated with timedStage records its wall time, the number of database
+queries it ran and the time spent in them. Totals are kept as in-process Prometheus histograms (rendered by
+renderMetrics), and the stages of the current request are sent back by StageTimingMiddleware as a Server-Timing header.
+The headers of a streaming response leave before its content is produced, so its Server-Timing header only covers the
+time to the response (the stages run while streaming are missing from it) and its request duration is observed once
+the stream is closed.
+'''
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+_requestStages = ContextVar('requestStages', default=None)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            counts, total, observations = self.series.get(label, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.series[label] = (counts, total + value, observations + 1)
+
+    def render(self, labelName):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            for label, (counts, total, observations) in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append('%s_bucket{%s="%s",le="%s"} %d' % (self.name, labelName, label, bound, count))
+                lines.append('%s_bucket{%s="%s",le="+Inf"} %d' % (self.name, labelName, label, observations))
+                lines.append('%s_sum{%s="%s"} %s' % (self.name, labelName, label, total))
+                lines.append('%s_count{%s="%s"} %d' % (self.name, labelName, label, observations))
+        return lines
+
+
+stageDuration = Histogram('dataportal_stage_duration_seconds', 'Wall time of a search stage.', SECONDS_BUCKETS)
+stageQueries = Histogram('dataportal_stage_db_queries', 'Database queries run by a search stage.', QUERY_BUCKETS)
+stageDBDuration = Histogram('dataportal_stage_db_duration_seconds', 'Database time of a search stage.', SECONDS_BUCKETS)
+requestDuration = Histogram('dataportal_request_duration_seconds', 'Wall time of a request.', SECONDS_BUCKETS)
+
+
+class QueryCounter:
+    '''
+    Database execute wrapper counting the queries run through the current thread's connection and their duration
+    '''
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+def timedStage(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            stageDuration.observe(function.__name__, elapsed)
+            stageQueries.observe(function.__name__, counter.queries)
+            stageDBDuration.observe(function.__name__, counter.seconds)
+
+            stages = _requestStages.get()
+            if stages is not None:
+                stages.append((function.__name__, elapsed, counter.queries, counter.seconds))
+    return wrapper
+
+
+class StageTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stages = []
+        token = _requestStages.set(stages)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                response = self.get_response(request)
+        finally:
+            _requestStages.reset(token)
+        return self.addTimings(request, response, stages, time.perf_counter() - started, counter)
+
+    async def __acall__(self, request):
+        # under ASGI the queries run in worker threads, so they are only counted by the stages themselves
+        stages = []
+        token = _requestStages.set(stages)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _requestStages.reset(token)
+        return self.addTimings(request, response, stages, time.perf_counter() - started, None)
+
+    def addTimings(self, request, response, stages, elapsed, counter):
+        view = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        if response.streaming:
+            self.observeWhenClosed(response, view, time.perf_counter() - elapsed)
+        else:
+            requestDuration.observe(view, elapsed)
+
+        timings = ['%s;dur=%.1f;desc="%d queries"' % (name, seconds * 1000, queries)
+                   for name, seconds, queries, _ in stages]
+        if counter is not None:
+            timings.append('db;dur=%.1f;desc="%d queries"' % (counter.seconds * 1000, counter.queries))
+        timings.append('total;dur=%.1f' % (elapsed * 1000))
+        response['Server-Timing'] = ', '.join(timings)
+        return response
+
+    def observeWhenClosed(self, response, view, started):
+        # the content is wrapped rather than given a closer, so the duration is observed once whether the client read
+        # the whole stream or went away
+        content = response.streaming_content
+
+        def observe():
+            requestDuration.observe(view, time.perf_counter() - started)
+
+        if response.is_async:
+            async def timedContent():
+                try:
+                    async for chunk in content:
+                        yield chunk
+                finally:
+                    observe()
+        else:
+            def timedContent():
+                try:
+                    yield from content
+                finally:
+                    observe()
+        response.streaming_content = timedContent()
+
+
+def renderMetrics():
+    from .searchCache import getCacheStats
+
+    lines = stageDuration.render('stage') + stageQueries.render('stage') + stageDBDuration.render('stage') + \
+        requestDuration.render('view')
+
+    cacheStats = getCacheStats()
+    for outcome in ('hits', 'misses'):
+        name = 'dataportal_search_cache_%s_total' % outcome
+        lines += ['# HELP %s Search cache %s.' % (name, outcome), '# TYPE %s counter' % name,
+                  '%s %d' % (name, cacheStats[outcome])]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from dataPortal.matchIngest import pairLaneOpponents
+from dataPortal.models import Game
+from dataPortal.rollups import applyGames, refreshSketches
+from dataPortal.searchCache import bumpDataVersion
+
+
+class Command(BaseCommand):
+    help = "Pairs lane opponents and stores goldDiff/expDiff on PlayerTimeData for games imported before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="games paired per transaction")
+        parser.add_argument('--all', action='store_true', help="recompute every game, not only unpaired ones")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        games = Game.objects.order_by('pk')
+        if not options['all']:
+            games = games.filter(playertimedata__goldDiff__isnull=True).distinct()
+        gamePKs = list(games.values_list('pk', flat=True))
+
+        paired = 0
+        for i in range(0, len(gamePKs), options['batch_size']):
+            batch = gamePKs[i:i + options['batch_size']]
+            with transaction.atomic():
+                # the rollup cells sum goldDiff and expDiff, so the batch is taken out of them and added back once paired
+                timeKeys, endKeys = applyGames(batch, sign=-1)
+                paired += pairLaneOpponents(batch)
+                applyGames(batch)
+                refreshSketches(timeKeys, endKeys)
+        bumpDataVersion()
+
+        self.stdout.write(self.style.SUCCESS('%d rows paired over %d games in %.1fs' % (
+            paired, len(gamePKs), time.monotonic() - started)))
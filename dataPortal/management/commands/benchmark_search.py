@@ -0,0 +1,30 @@
+import json
+from django.core.management.base import BaseCommand
+from dataPortal.benchmarks import runBenchmarks
+
+
+class Command(BaseCommand):
+    help = "Times teamDataSearch and each aggregator on synthetic leagues and writes a JSON report"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="games per league")
+        parser.add_argument('--teams', type=int, default=10)
+        parser.add_argument('--players-per-team', type=int, default=5)
+        parser.add_argument('--timestamps-per-game', type=int, default=4)
+        parser.add_argument('--repeats', type=int, default=3, help="timed runs per stage, the median is reported")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='bench_output.json', help="report path, '-' for stdout")
+
+    def handle(self, *args, **options):
+        report = runBenchmarks(
+            sizes=options['sizes'], teams=options['teams'], playersPerTeam=options['players_per_team'],
+            timestampsPerGame=options['timestamps_per_game'], repeats=options['repeats'], seed=options['seed'],
+            log=lambda message: self.stdout.write(message) if options['verbosity'] > 1 else None)
+
+        content = json.dumps(report, indent=2, sort_keys=True)
+        if options['output'] == '-':
+            self.stdout.write(content)
+        else:
+            with open(options['output'], 'w') as output:
+                output.write(content + '\n')
+            self.stdout.write(self.style.SUCCESS('Report written to %s' % options['output']))
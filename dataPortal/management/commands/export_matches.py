@@ -0,0 +1,38 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from dataPortal.dataExport import iterExport, EXPORT_FORMATS, EXPORT_TABLES, DEFAULT_CHUNK_SIZE
+from dataPortal.forms import CommonDataSearchForm
+
+
+class Command(BaseCommand):
+    help = "Exports the games matching the search filters and their stats, drafts and objectives as CSV or Parquet files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="where <table>.<format> files are written")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--table', action='append', choices=list(EXPORT_TABLES),
+                            help="table to export, may be repeated (every table by default)")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows read per query and per row group")
+        for field in CommonDataSearchForm.base_fields:
+            parser.add_argument('--%s' % field, dest='search_%s' % field, help="search filter, as in the team search")
+
+    def handle(self, *args, **options):
+        form = CommonDataSearchForm({field: options['search_%s' % field] for field in CommonDataSearchForm.base_fields
+                                     if options['search_%s' % field] is not None})
+        if not form.is_valid():
+            raise CommandError('invalid search: %s' % form.errors.as_json())
+        os.makedirs(options['directory'], exist_ok=True)
+
+        for table in options['table'] or EXPORT_TABLES:
+            started = time.monotonic()
+            path = os.path.join(options['directory'], '%s.%s' % (table, options['format']))
+            try:
+                content = iterExport(form, table, options['format'], options['chunk_size'])
+            except ValueError as error:
+                raise CommandError(error)
+            output = open(path, 'w', newline='') if options['format'] == 'csv' else open(path, 'wb')
+            with output:
+                for piece in content:
+                    output.write(piece)
+            self.stdout.write('%s written in %.1fs' % (path, time.monotonic() - started))
@@ -0,0 +1,24 @@
+import time
+from itertools import chain
+from django.core.management.base import BaseCommand
+from dataPortal.matchIngest import MatchImporter, readMatches
+
+
+class Command(BaseCommand):
+    help = "Imports match files (.json or .ndjson/.jsonl, or directories of them) in batches, skipping known games"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="match files or directories of match files")
+        parser.add_argument('--batch-size', type=int, default=200, help="games written per transaction")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        importer = MatchImporter(batchSize=options['batch_size'],
+                                 log=lambda message: self.stdout.write(message) if options['verbosity'] > 1 else None)
+        importer.importMatches(chain.from_iterable(readMatches(path) for path in options['paths']))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            '%d games imported, %d already present, %d rows in %.1fs (%.0f rows/s)' % (
+                importer.gamesImported, importer.gamesSkipped, importer.rowsWritten, elapsed,
+                importer.rowsWritten / elapsed if elapsed else 0)))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from dataPortal.rollups import rebuildRollups, verifyRollups
+from dataPortal.searchCache import bumpDataVersion
+
+
+class Command(BaseCommand):
+    help = "Recomputes the rollup cells from PlayerTimeData and PlayerEndGameStats and checks them against a full recompute"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="games summed per query")
+        parser.add_argument('--verify-only', action='store_true', help="only compare the stored cells, change nothing")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if not options['verify_only']:
+            cells = rebuildRollups(options['batch_size'])
+            bumpDataVersion()
+            self.stdout.write('%d cells rebuilt in %.1fs' % (cells, time.monotonic() - started))
+
+        mismatched = verifyRollups()
+        if mismatched:
+            for key in mismatched[:20]:
+                self.stderr.write('cell differs from the recompute: %s' % (key,))
+            raise CommandError('%d rollup cells differ from the raw tables' % len(mismatched))
+        self.stdout.write(self.style.SUCCESS('every rollup cell matches the raw tables'))
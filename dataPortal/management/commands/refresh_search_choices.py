@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from dataPortal.models import SearchChoice
+from dataPortal.searchChoices import refreshSearchChoices
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the choice lists of the search form from the match tables (import_matches already does it)"
+
+    def handle(self, *args, **options):
+        refreshSearchChoices()
+        self.stdout.write(self.style.SUCCESS('%d search choices stored' % SearchChoice.objects.count()))
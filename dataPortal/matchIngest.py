@@ -0,0 +1,304 @@
+import json
+import re
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from django.db import transaction
+from .models import Competition, Teams, Player, Game, PlayerEndGameStats, Draft, DraftPick, PlayerTimeData, Drakes, Heralds, Barons, \
+    FirstBlood, Plates, Towers, ObjectiveEvent, DRAFT_SLOTS, patchKey, perMinuteStats
+from .rollups import applyGames
+from .searchCache import bumpDataVersion
+from .searchChoices import refreshSearchChoices
+
+'''
+Bulk import of match files. A match is one JSON object:
+
+{
+    "gameID": "ESPORTSTMNT01_3264722",
+    "competition": "LCK 2023 Summer",                          # or {"name": ..., "season": ..., "split": ..., "region": ...}
+    "date": "2023-06-07",
+    "patch": "13.10",
+    "gameLength": 1834,                                         # seconds
+    "teams": {"B": "T1", "R": "GEN"},
+    "winner": "B",
+    "players": [
+        {"summonerName": "Faker", "playerCode": "...", "side": "B", "role": "mid", "champ": "Azir",
+         "stats": {"kills": 3, "deaths": 1, "assists": 7, "gold": 13250, "minions": 301, "wardPlaced": 12,
+                   "wardKilled": 4, "visionScore": 38, "DMGtoChamps": 21034, "DMGtoTowers": 4120},
+         "timeline": [{"time": 10, "kills": 0, "deaths": 0, "assists": 1, "gold": 3650, "minions": 92, "exp": 4800}]},
+        ...
+    ],
+    "draft": {"B": {"bans": ["Rell", ...], "picks": ["Azir", ...]}, "R": {...}},
+    "objectives": [
+        {"type": "drake", "side": "B", "time": 380, "first": true, "drakeType": "infernal"},
+        {"type": "tower", "side": "R", "time": 802, "first": true, "lane": "bot", "killer": "Peyz", "assistants": []},
+        ...
+    ]
+}
+
+Files are either .json (one match or a list of matches) or .ndjson/.jsonl (one match per line) and are read one match
+at a time. Matches whose gameID is already stored are skipped, so a season can be re-imported safely.
+'''
+
+GAME_PLAYER_FIELDS = {
+    ('top', 'B'): 'topB', ('jgl', 'B'): 'jglB', ('mid', 'B'): 'midB', ('bot', 'B'): 'botB', ('sup', 'B'): 'supB',
+    ('top', 'R'): 'topR', ('jgl', 'R'): 'jglR', ('mid', 'R'): 'midR', ('bot', 'R'): 'botR', ('sup', 'R'): 'supR',
+}
+
+END_GAME_STATS = ('kills', 'deaths', 'assists', 'gold', 'minions', 'wardPlaced', 'wardKilled', 'visionScore',
+                  'DMGtoChamps', 'DMGtoTowers')
+
+TIME_STATS = ('kills', 'deaths', 'assists', 'gold', 'minions', 'exp')
+
+# objective type: (legacy model, detail key, legacy model needs a killer)
+OBJECTIVE_MODELS = {
+    'drake': (Drakes, 'drakeType', False),
+    'herald': (Heralds, None, False),
+    'baron': (Barons, None, False),
+    'firstBlood': (FirstBlood, None, True),
+    'plate': (Plates, 'lane', True),
+    'tower': (Towers, 'lane', True),
+}
+
+
+def parseCompetition(competition):
+    '''
+    Splits a competition as stored in match files ("LCK 2023 Summer", or an object with any of name, season, split and
+    region) into the fields of Competition. Returns None for a missing competition
+    '''
+    if not competition:
+        return None
+    if isinstance(competition, dict):
+        given = {field: str(competition[field]) for field in ('name', 'season', 'split', 'region')
+                 if competition.get(field)}
+        fields = parseCompetition(given.get('name') or ' '.join(given[field] for field in ('region', 'season', 'split')
+                                                                 if field in given))
+        return {**fields, **given} if fields else None
+    if isinstance(competition, (list, tuple)):
+        competition = ' '.join(str(part) for part in competition)
+
+    name = ' '.join(str(competition).split())
+    if not name:
+        return None
+    words = name.split(' ')
+    seasons = [word for word in words if re.fullmatch(r'(19|20)\d\d', word)]
+    season = seasons[0] if seasons else ''
+    rest = [word for word in words if word != season]
+    return {'name': name, 'season': season, 'region': rest[0] if rest else '', 'split': ' '.join(rest[1:])}
+
+
+def readMatches(path):
+    '''
+    Yields the matches of a file, or of every match file in a directory, one at a time
+    '''
+    path = Path(path)
+    if path.is_dir():
+        for child in sorted(path.iterdir()):
+            if child.suffix in ('.json', '.ndjson', '.jsonl'):
+                yield from readMatches(child)
+        return
+
+    with path.open(encoding='utf-8') as matchFile:
+        if path.suffix in ('.ndjson', '.jsonl'):
+            for line in matchFile:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            content = json.load(matchFile)
+            yield from content if isinstance(content, list) else [content]
+
+
+class MatchImporter:
+    '''
+    Imports matches in batches: teams and players are resolved through in-memory lookups, every table of a batch is
+    written with bulk_create and each batch is its own transaction
+    '''
+
+    def __init__(self, batchSize=200, log=None):
+        self.batchSize = batchSize
+        self.log = log
+        self.competitions = dict(Competition.objects.values_list('name', 'pk'))
+        # a triCode (or a player name within a team) stored more than once resolves to its oldest row
+        self.teams = dict(Teams.objects.order_by('-pk').values_list('triCode', 'pk'))
+        self.players = {(summonerName, team): pk for summonerName, team, pk in
+                        Player.objects.order_by('-pk').values_list('summonerName', 'team', 'pk')}
+        self.seenGameIDs = set()
+        self.gamesImported = 0
+        self.gamesSkipped = 0
+        self.rowsWritten = 0
+        self.started = None
+
+    def importMatches(self, matches):
+        self.started = time.monotonic()
+        batch = []
+        for match in matches:
+            batch.append(match)
+            if len(batch) >= self.batchSize:
+                self.importBatch(batch)
+                batch = []
+        if batch:
+            self.importBatch(batch)
+        if self.gamesImported:
+            refreshSearchChoices()
+
+    @property
+    def rowsPerSecond(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return self.rowsWritten / elapsed if elapsed else 0.0
+
+    def competitionID(self, competition):
+        fields = parseCompetition(competition)
+        if fields is None:
+            return None
+        if fields['name'] not in self.competitions:
+            self.competitions[fields['name']] = Competition.objects.get_or_create(name=fields['name'],
+                                                                                  defaults=fields)[0].pk
+        return self.competitions[fields['name']]
+
+    def teamID(self, triCode):
+        if triCode not in self.teams:
+            self.teams[triCode] = Teams.objects.create(triCode=triCode).pk
+        return self.teams[triCode]
+
+    def playerID(self, player, team):
+        key = (player['summonerName'], team)
+        if key not in self.players:
+            self.players[key] = Player.objects.create(
+                summonerName=player['summonerName'], playerCode=player.get('playerCode', ''), team_id=team,
+                role=player.get('role', '')).pk
+        return self.players[key]
+
+    def importBatch(self, matches):
+        gameIDs = [match['gameID'] for match in matches]
+        existing = set(Game.objects.filter(gameID__in=gameIDs).values_list('gameID', flat=True))
+
+        newMatches = []
+        for match in matches:
+            if match['gameID'] in existing or match['gameID'] in self.seenGameIDs:
+                self.gamesSkipped += 1
+                continue
+            self.seenGameIDs.add(match['gameID'])
+            newMatches.append(match)
+
+        if newMatches:
+            with transaction.atomic():
+                self.rowsWritten += self.writeMatches(newMatches)
+                bumpDataVersion()
+            self.gamesImported += len(newMatches)
+
+        if self.log:
+            self.log('%d games imported, %d skipped, %.0f rows/s' % (self.gamesImported, self.gamesSkipped,
+                                                                      self.rowsPerSecond))
+
+    def writeMatches(self, matches):
+        games = []
+        for match in matches:
+            sideTeams = {side: self.teamID(triCode) for side, triCode in match['teams'].items()}
+            match['sideTeams'] = sideTeams
+            match['playerIDs'] = [self.playerID(player, sideTeams[player['side']]) for player in match['players']]
+
+            rolePlayers = {GAME_PLAYER_FIELDS[(player['role'], player['side'])] + '_id': playerID
+                           for player, playerID in zip(match['players'], match['playerIDs'])}
+            games.append(Game(
+                gameID=match['gameID'],
+                competition=match.get('competition'),
+                competitionID_id=self.competitionID(match.get('competition')),
+                date=date.fromisoformat(match['date']),
+                patch=match['patch'],
+                patchKey=patchKey(match['patch']),
+                gameLength=timedelta(seconds=match['gameLength']),
+                winnerTeam_id=sideTeams[match['winner']] if match['winner'] in sideTeams else self.teamID(match['winner']),
+                teamB_id=sideTeams['B'],
+                teamR_id=sideTeams['R'],
+                **rolePlayers,
+            ))
+        Game.objects.bulk_create(games)
+        # bulk_create does not return primary keys on every backend, so they are read back by gameID
+        gamePKs = dict(Game.objects.filter(gameID__in=[game.gameID for game in games]).values_list('gameID', 'pk'))
+
+        endStats, drafts, draftPicks, timeData, events = [], [], [], [], []
+        legacyObjectives = {model: [] for model, _, _ in OBJECTIVE_MODELS.values()}
+        for match in matches:
+            game = gamePKs[match['gameID']]
+            sideTeams = match['sideTeams']
+            playersByName = {}
+
+            for player, playerID in zip(match['players'], match['playerIDs']):
+                team = sideTeams[player['side']]
+                playersByName[player['summonerName']] = playerID
+                stats = {stat: player.get('stats', {}).get(stat, 0) for stat in END_GAME_STATS}
+                endStats.append(PlayerEndGameStats(
+                    gameID_id=game, player_id=playerID, team_id=team, role=player['role'], side=player['side'],
+                    **stats, **perMinuteStats(match['gameLength'], stats['gold'], stats['minions'],
+                                              stats['visionScore'], stats['DMGtoChamps'])))
+                for point in player.get('timeline', []):
+                    timeData.append(PlayerTimeData(
+                        gameID_id=game, player_id=playerID, team_id=team, side=player['side'], role=player['role'],
+                        champ=player['champ'], time=point['time'], **{stat: point.get(stat, 0) for stat in TIME_STATS}))
+
+            for side, sideDraft in match.get('draft', {}).items():
+                champions = {f'ban{i + 1}': champ for i, champ in enumerate(sideDraft.get('bans', [])[:5])}
+                champions.update({f'pick{i + 1}': champ for i, champ in enumerate(sideDraft.get('picks', [])[:5])})
+                champions.update({player['role']: player['champ'] for player in match['players']
+                                  if player['side'] == side})
+                champions = {slot: champions.get(slot, '') for slot in DRAFT_SLOTS}
+                drafts.append(Draft(gameID_id=game, side=side, **champions))
+                draftPicks.extend(DraftPick(gameID_id=game, side=side, team_id=sideTeams[side], slot=slot,
+                                            champion=champion) for slot, champion in champions.items())
+
+            for objective in match.get('objectives', []):
+                model, detail, needsKiller = OBJECTIVE_MODELS[objective['type']]
+                side = objective['side']
+                killer = playersByName.get(objective.get('killer'))
+                first = objective.get('first', objective['type'] == 'firstBlood')
+                objectiveTime = timedelta(seconds=objective['time'])
+                events.append(ObjectiveEvent(
+                    gameID_id=game, type=objective['type'], team_id=sideTeams[side], side=side,
+                    detail=objective.get(detail, '') if detail else '', killer_id=killer,
+                    assistants=objective.get('assistants'), first=first, time=objectiveTime))
+
+                if needsKiller and killer is None:
+                    continue
+                fields = {'gameID_id': game, 'team_id': sideTeams[side], 'side': side, 'time': objectiveTime}
+                if detail:
+                    fields[detail] = objective.get(detail, '')
+                if needsKiller:
+                    fields['killer_id'] = killer
+                    fields['assistants'] = objective.get('assistants')
+                if model in (Drakes, Heralds, Towers):
+                    fields['first'] = first
+                legacyObjectives[model].append(model(**fields))
+
+        PlayerEndGameStats.objects.bulk_create(endStats, batch_size=1000)
+        Draft.objects.bulk_create(drafts, batch_size=1000)
+        DraftPick.objects.bulk_create(draftPicks, batch_size=1000)
+        PlayerTimeData.objects.bulk_create(timeData, batch_size=1000)
+        ObjectiveEvent.objects.bulk_create(events, batch_size=1000)
+        for model, rows in legacyObjectives.items():
+            model.objects.bulk_create(rows, batch_size=1000)
+        opponentsPaired = pairLaneOpponents(gamePKs.values())
+        applyGames(gamePKs.values())
+
+        return (len(games) + len(endStats) + len(drafts) + len(draftPicks) + len(timeData) + len(events) +
+                sum(len(rows) for rows in legacyObjectives.values()) + opponentsPaired)
+
+
+def pairLaneOpponents(games):
+    '''
+    Points every PlayerTimeData row of the given games to the row of the same role and time on the other side and
+    stores the gold and experience differentials against it
+    '''
+    rows = {}
+    for pk, game, role, side, minute, gold, exp in PlayerTimeData.objects.filter(gameID__in=list(games)).values_list(
+            'pk', 'gameID', 'role', 'side', 'time', 'gold', 'exp'):
+        rows[(game, role, minute, side)] = (pk, gold, exp)
+
+    paired = []
+    for (game, role, minute, side), (pk, gold, exp) in rows.items():
+        opponent = rows.get((game, role, minute, 'R' if side == 'B' else 'B'))
+        if opponent is not None:
+            opponentPK, opponentGold, opponentExp = opponent
+            paired.append(PlayerTimeData(pk=pk, opponent_id=opponentPK, goldDiff=gold - opponentGold,
+                                         expDiff=exp - opponentExp))
+    PlayerTimeData.objects.bulk_update(paired, ['opponent', 'goldDiff', 'expDiff'], batch_size=1000)
+    return len(paired)
@@ -0,0 +1,194 @@
+import json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+'''
+0001_initial predates models.py: Game stored team triCodes and player codes as text, the fact tables stored team
+triCodes, the objective tables had no side or first flag and Draft had a team. This migration brings the state (and
+the data of an existing database) in line with models.py before any later migration reads it.
+'''
+
+BATCH_SIZE = 2000
+
+GAME_TEAMS = ('winnerTeam', 'teamB', 'teamR')
+GAME_PLAYERS = {
+    'topB': ('B', 'top'), 'jglB': ('B', 'jgl'), 'midB': ('B', 'mid'), 'botB': ('B', 'bot'), 'supB': ('B', 'sup'),
+    'topR': ('R', 'top'), 'jlgR': ('R', 'jgl'), 'midR': ('R', 'mid'), 'botR': ('R', 'bot'), 'supR': ('R', 'sup'),
+}
+OBJECTIVE_MODELS = ('drakes', 'heralds', 'barons', 'firstblood', 'plates', 'towers')
+# objectives whose first of the game is flagged
+FIRST_FLAGGED = ('drakes', 'heralds', 'towers')
+ASSISTANT_MODELS = ('firstblood', 'plates', 'towers')
+FACT_TEAMS = ('playertimedata', 'playerendgamestats')
+SIDES = [('B', 'blue'), ('R', 'red')]
+
+
+def legacy(name):
+    return 'legacy' + name[0].upper() + name[1:]
+
+
+def parseAssistants(text):
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return [name.strip() for name in text.split(',') if name.strip()] or None
+
+
+class LegacyResolver:
+    '''
+    Maps the triCodes and player codes of the old text columns onto Teams and Player rows, creating the missing ones.
+    A triCode maps to its oldest team, the way matchIngest.MatchImporter.teamID resolves it
+    '''
+
+    def __init__(self, apps):
+        self.Teams = apps.get_model('dataPortal', 'Teams')
+        self.Player = apps.get_model('dataPortal', 'Player')
+        self.teams = {}
+        self.players = {}
+
+    def team(self, triCode):
+        if triCode not in self.teams:
+            team = self.Teams.objects.filter(triCode=triCode).order_by('pk').first()
+            self.teams[triCode] = (team or self.Teams.objects.create(triCode=triCode)).pk
+        return self.teams[triCode]
+
+    def player(self, code, team, role):
+        key = (code, team)
+        if key not in self.players:
+            players = self.Player.objects.filter(models.Q(playerCode=code) | models.Q(summonerName=code))
+            player = players.filter(team_id=team).order_by('pk').first() or players.order_by('pk').first()
+            if player is None:
+                player = self.Player.objects.create(summonerName=code[:32], playerCode=code, role=role, team_id=team)
+            self.players[key] = player.pk
+        return self.players[key]
+
+
+def convertGames(apps, schema_editor):
+    Game = apps.get_model('dataPortal', 'Game')
+    resolver = LegacyResolver(apps)
+    batch = []
+    fields = ['competition'] + [name + '_id' for name in GAME_TEAMS + tuple(GAME_PLAYERS)]
+    for game in Game.objects.all().iterator(chunk_size=BATCH_SIZE):
+        game.competition = game.legacyCompetition or None
+        for name in GAME_TEAMS:
+            setattr(game, name + '_id', resolver.team(getattr(game, legacy(name))))
+        for name, (side, role) in GAME_PLAYERS.items():
+            team = game.teamB_id if side == 'B' else game.teamR_id
+            setattr(game, name + '_id', resolver.player(getattr(game, legacy(name)), team, role))
+        batch.append(game)
+        if len(batch) >= BATCH_SIZE:
+            Game.objects.bulk_update(batch, fields)
+            batch = []
+    Game.objects.bulk_update(batch, fields)
+
+    for modelName in FACT_TEAMS:
+        model = apps.get_model('dataPortal', modelName)
+        batch = []
+        for row in model.objects.only('pk', 'legacyTeam').iterator(chunk_size=BATCH_SIZE):
+            row.team_id = resolver.team(row.legacyTeam)
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ['team'])
+                batch = []
+        model.objects.bulk_update(batch, ['team'])
+
+
+def convertObjectives(apps, schema_editor):
+    Game = apps.get_model('dataPortal', 'Game')
+    blueTeams = dict(Game.objects.values_list('pk', 'teamB'))
+
+    for modelName in OBJECTIVE_MODELS:
+        model = apps.get_model('dataPortal', modelName)
+        flagged = modelName in FIRST_FLAGGED
+        withAssistants = modelName in ASSISTANT_MODELS
+        earliest = {}
+        if flagged:
+            for row in model.objects.order_by('gameID', 'time', 'pk').values('gameID', 'pk').iterator(
+                    chunk_size=BATCH_SIZE):
+                earliest.setdefault(row['gameID'], row['pk'])
+
+        fields = ['side'] + (['first'] if flagged else []) + (['assistants'] if withAssistants else [])
+        batch = []
+        for row in model.objects.all().iterator(chunk_size=BATCH_SIZE):
+            row.side = 'B' if row.team_id == blueTeams.get(row.gameID_id) else 'R'
+            if flagged:
+                row.first = earliest.get(row.gameID_id) == row.pk
+            if withAssistants:
+                row.assistants = parseAssistants(row.legacyAssistants)
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, fields)
+                batch = []
+        model.objects.bulk_update(batch, fields)
+
+
+def moveToLegacy(modelName, name):
+    return migrations.RenameField(model_name=modelName, old_name=name, new_name=legacy(name))
+
+
+def dropLegacy(modelName, name):
+    return migrations.RemoveField(model_name=modelName, name=legacy(name))
+
+
+def foreignKey(to, null):
+    return models.ForeignKey(null=null, on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                             to='dataPortal.' + to)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='teams',
+            name='competition',
+            field=models.CharField(blank=True, default='', max_length=511),
+        ),
+        migrations.RemoveField(
+            model_name='draft',
+            name='team',
+        ),
+        migrations.AddField(
+            model_name='playertimedata',
+            name='opponent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    to='dataPortal.playertimedata'),
+        ),
+
+        # text columns become foreign keys: the old column is kept under a legacy name until its data is converted
+        moveToLegacy('game', 'competition'),
+        migrations.AddField(model_name='game', name='competition', field=models.JSONField(blank=True, null=True)),
+        *[moveToLegacy('game', name) for name in GAME_TEAMS + tuple(GAME_PLAYERS)],
+        *[migrations.AddField(model_name='game', name=name, field=foreignKey('teams', True)) for name in GAME_TEAMS],
+        *[migrations.AddField(model_name='game', name=name, field=foreignKey('player', True)) for name in GAME_PLAYERS],
+        *[moveToLegacy(modelName, 'team') for modelName in FACT_TEAMS],
+        *[migrations.AddField(model_name=modelName, name='team', field=models.ForeignKey(
+            null=True, on_delete=django.db.models.deletion.CASCADE, to='dataPortal.teams')) for modelName in FACT_TEAMS],
+        migrations.RunPython(convertGames, migrations.RunPython.noop),
+        dropLegacy('game', 'competition'),
+        *[dropLegacy('game', name) for name in GAME_TEAMS + tuple(GAME_PLAYERS)],
+        *[migrations.AlterField(model_name='game', name=name, field=foreignKey('teams', False)) for name in GAME_TEAMS],
+        *[migrations.AlterField(model_name='game', name=name, field=foreignKey('player', False))
+          for name in GAME_PLAYERS],
+        *[dropLegacy(modelName, 'team') for modelName in FACT_TEAMS],
+        *[migrations.AlterField(model_name=modelName, name='team', field=models.ForeignKey(
+            on_delete=django.db.models.deletion.CASCADE, to='dataPortal.teams')) for modelName in FACT_TEAMS],
+
+        # objectives get their side, their first flag and JSON assistants
+        *[migrations.AddField(model_name=modelName, name='side', preserve_default=False,
+                              field=models.CharField(choices=SIDES, default='B', max_length=1))
+          for modelName in OBJECTIVE_MODELS],
+        *[migrations.AddField(model_name=modelName, name='first', preserve_default=False,
+                              field=models.BooleanField(default=False)) for modelName in FIRST_FLAGGED],
+        *[moveToLegacy(modelName, 'assistants') for modelName in ASSISTANT_MODELS],
+        *[migrations.AddField(model_name=modelName, name='assistants', field=models.JSONField(blank=True, null=True))
+          for modelName in ASSISTANT_MODELS],
+        migrations.RunPython(convertObjectives, migrations.RunPython.noop),
+        *[dropLegacy(modelName, 'assistants') for modelName in ASSISTANT_MODELS],
+    ]
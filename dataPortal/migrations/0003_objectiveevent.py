@@ -0,0 +1,74 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 2000
+
+# type: (model name, detail column, how "first" is known)
+OBJECTIVE_SOURCES = {
+    'drake': ('Drakes', 'drakeType', 'first'),
+    'herald': ('Heralds', None, 'first'),
+    'baron': ('Barons', None, None),
+    'firstBlood': ('FirstBlood', None, 'all'),
+    'plate': ('Plates', 'lane', None),
+    'tower': ('Towers', 'lane', 'first'),
+}
+
+
+def backfillObjectiveEvents(apps, schema_editor):
+    ObjectiveEvent = apps.get_model('dataPortal', 'ObjectiveEvent')
+
+    for objectiveType, (modelName, detail, first) in OBJECTIVE_SOURCES.items():
+        model = apps.get_model('dataPortal', modelName)
+        fields = [f.name for f in model._meta.get_fields() if f.concrete]
+
+        batch = []
+        for row in model.objects.all().iterator(chunk_size=BATCH_SIZE):
+            batch.append(ObjectiveEvent(
+                gameID_id=row.gameID_id,
+                type=objectiveType,
+                team_id=row.team_id,
+                side=row.side,
+                detail=getattr(row, detail) if detail else '',
+                killer_id=row.killer_id if 'killer' in fields else None,
+                assistants=row.assistants if 'assistants' in fields else None,
+                first=row.first if first == 'first' else first == 'all',
+                time=row.time,
+            ))
+            if len(batch) >= BATCH_SIZE:
+                ObjectiveEvent.objects.bulk_create(batch)
+                batch = []
+        ObjectiveEvent.objects.bulk_create(batch)
+
+
+def clearObjectiveEvents(apps, schema_editor):
+    apps.get_model('dataPortal', 'ObjectiveEvent').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0002_reconcile_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObjectiveEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('drake', 'drake'), ('herald', 'herald'), ('baron', 'baron'), ('firstBlood', 'first blood'), ('plate', 'plate'), ('tower', 'tower')], max_length=16)),
+                ('side', models.CharField(choices=[('B', 'blue'), ('R', 'red')], max_length=1)),
+                ('detail', models.CharField(blank=True, max_length=24)),
+                ('assistants', models.JSONField(blank=True, null=True)),
+                ('first', models.BooleanField(default=False)),
+                ('time', models.DurationField()),
+                ('gameID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dataPortal.game')),
+                ('killer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dataPortal.player')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dataPortal.teams')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['gameID', 'type', 'team', 'side'], name='objective_game_type_team_side')],
+            },
+        ),
+        migrations.RunPython(backfillObjectiveEvents, clearObjectiveEvents),
+    ]
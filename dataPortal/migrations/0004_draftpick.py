@@ -0,0 +1,56 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 2000
+
+DRAFT_SLOTS = ('ban1', 'ban2', 'ban3', 'ban4', 'ban5', 'pick1', 'pick2', 'pick3', 'pick4', 'pick5', 'top', 'jgl', 'mid', 'bot',
+               'sup')
+
+
+def backfillDraftPicks(apps, schema_editor):
+    Draft = apps.get_model('dataPortal', 'Draft')
+    DraftPick = apps.get_model('dataPortal', 'DraftPick')
+
+    batch = []
+    # teamB and teamR are the Teams foreign keys of 0002_reconcile_models, so these are team pks
+    drafts = Draft.objects.values('gameID', 'gameID__teamB', 'gameID__teamR', 'side', *DRAFT_SLOTS)
+    for draft in drafts.iterator(chunk_size=BATCH_SIZE):
+        team = draft['gameID__teamB'] if draft['side'] == 'B' else draft['gameID__teamR']
+        for slot in DRAFT_SLOTS:
+            batch.append(DraftPick(gameID_id=draft['gameID'], side=draft['side'], team_id=team, slot=slot,
+                                   champion=draft[slot]))
+        if len(batch) >= BATCH_SIZE:
+            DraftPick.objects.bulk_create(batch)
+            batch = []
+    DraftPick.objects.bulk_create(batch)
+
+
+def clearDraftPicks(apps, schema_editor):
+    apps.get_model('dataPortal', 'DraftPick').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0003_objectiveevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DraftPick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('side', models.CharField(choices=[('B', 'blue'), ('R', 'red')], max_length=1)),
+                ('slot', models.CharField(choices=[('ban1', 'ban1'), ('ban2', 'ban2'), ('ban3', 'ban3'), ('ban4', 'ban4'), ('ban5', 'ban5'), ('pick1', 'pick1'), ('pick2', 'pick2'), ('pick3', 'pick3'), ('pick4', 'pick4'), ('pick5', 'pick5'), ('top', 'top'), ('jgl', 'jgl'), ('mid', 'mid'), ('bot', 'bot'), ('sup', 'sup')], max_length=8)),
+                ('champion', models.CharField(max_length=24)),
+                ('gameID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dataPortal.game')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dataPortal.teams')),
+            ],
+            options={
+                'unique_together': {('gameID', 'side', 'slot')},
+                'indexes': [models.Index(fields=['gameID', 'slot', 'champion'], name='draftpick_game_slot_champion')],
+            },
+        ),
+        migrations.RunPython(backfillDraftPicks, clearDraftPicks),
+    ]
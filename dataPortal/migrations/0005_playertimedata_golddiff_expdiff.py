@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0004_draftpick'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playertimedata',
+            name='goldDiff',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playertimedata',
+            name='expDiff',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0005_playertimedata_golddiff_expdiff'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['patch', 'date'], name='game_patch_date'),
+        ),
+        migrations.AddIndex(
+            model_name='playerendgamestats',
+            index=models.Index(fields=['gameID', 'role', 'team', 'side', 'player'], name='endstats_game_role_team_side'),
+        ),
+        migrations.AddIndex(
+            model_name='playertimedata',
+            index=models.Index(fields=['gameID', 'role', 'time'], name='timedata_game_role_time'),
+        ),
+    ]
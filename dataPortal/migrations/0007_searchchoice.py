@@ -0,0 +1,46 @@
+import json
+from django.db import migrations, models
+
+
+def fillSearchChoices(apps, schema_editor):
+    Game = apps.get_model('dataPortal', 'Game')
+    Teams = apps.get_model('dataPortal', 'Teams')
+    Player = apps.get_model('dataPortal', 'Player')
+    SearchChoice = apps.get_model('dataPortal', 'SearchChoice')
+
+    competitions = set()
+    for competition in Game.objects.exclude(competition=None).values_list('competition', flat=True).distinct():
+        competitions.add(competition if isinstance(competition, str) else json.dumps(competition, sort_keys=True))
+
+    choices = {
+        'patch': set(Game.objects.values_list('patch', flat=True).distinct()),
+        'competition': competitions,
+        'team': set(Teams.objects.values_list('triCode', flat=True).distinct()),
+        'player': set(Player.objects.values_list('summonerName', flat=True).distinct()),
+    }
+    SearchChoice.objects.bulk_create([SearchChoice(field=field, value=value, label=value)
+                                      for field, values in choices.items() for value in values])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0006_aggregation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchChoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('patch', 'patch'), ('competition', 'competition'), ('team', 'team'), ('player', 'player')], max_length=16)),
+                ('value', models.CharField(max_length=255)),
+                ('label', models.CharField(max_length=255)),
+            ],
+            options={
+                'ordering': ['field', 'label'],
+                'unique_together': {('field', 'value')},
+            },
+        ),
+        migrations.RunPython(fillSearchChoices, migrations.RunPython.noop),
+    ]
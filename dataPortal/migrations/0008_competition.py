@@ -0,0 +1,93 @@
+import re
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 2000
+
+
+def parseCompetition(competition):
+    # frozen copy of matchIngest.parseCompetition
+    if not competition:
+        return None
+    if isinstance(competition, dict):
+        given = {field: str(competition[field]) for field in ('name', 'season', 'split', 'region')
+                 if competition.get(field)}
+        fields = parseCompetition(given.get('name') or ' '.join(given[field] for field in ('region', 'season', 'split')
+                                                                 if field in given))
+        return {**fields, **given} if fields else None
+    if isinstance(competition, (list, tuple)):
+        competition = ' '.join(str(part) for part in competition)
+
+    name = ' '.join(str(competition).split())
+    if not name:
+        return None
+    words = name.split(' ')
+    seasons = [word for word in words if re.fullmatch(r'(19|20)\d\d', word)]
+    season = seasons[0] if seasons else ''
+    rest = [word for word in words if word != season]
+    return {'name': name, 'season': season, 'region': rest[0] if rest else '', 'split': ' '.join(rest[1:])}
+
+
+def backfillCompetitions(apps, schema_editor):
+    Competition = apps.get_model('dataPortal', 'Competition')
+    Game = apps.get_model('dataPortal', 'Game')
+
+    competitions = {}
+    batch = []
+    for game in Game.objects.exclude(competition=None).only('pk', 'competition').iterator(chunk_size=BATCH_SIZE):
+        fields = parseCompetition(game.competition)
+        if fields is None:
+            continue
+        if fields['name'] not in competitions:
+            competitions[fields['name']] = Competition.objects.get_or_create(name=fields['name'], defaults=fields)[0].pk
+        game.competitionID_id = competitions[fields['name']]
+        batch.append(game)
+        if len(batch) >= BATCH_SIZE:
+            Game.objects.bulk_update(batch, ['competitionID'])
+            batch = []
+    Game.objects.bulk_update(batch, ['competitionID'])
+
+    # the competition filter of the search form now offers Competition keys
+    SearchChoice = apps.get_model('dataPortal', 'SearchChoice')
+    SearchChoice.objects.filter(field='competition').delete()
+    SearchChoice.objects.bulk_create([SearchChoice(field='competition', value=str(pk), label=name)
+                                      for name, pk in competitions.items()])
+
+
+def clearCompetitions(apps, schema_editor):
+    apps.get_model('dataPortal', 'Game').objects.update(competitionID=None)
+    apps.get_model('dataPortal', 'Competition').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0007_searchchoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Competition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('season', models.CharField(blank=True, max_length=16)),
+                ('split', models.CharField(blank=True, max_length=32)),
+                ('region', models.CharField(blank=True, max_length=32)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['region', 'season', 'split'], name='competition_region_season')],
+            },
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='competitionID',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dataPortal.competition'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['competitionID', 'patch', 'date'], name='game_competition_patch_date'),
+        ),
+        migrations.RunPython(backfillCompetitions, clearCompetitions),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0008_competition'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='game',
+            old_name='jlgR',
+            new_name='jglR',
+        ),
+        migrations.AddIndex(
+            model_name='playerendgamestats',
+            index=models.Index(fields=['player', 'gameID', 'side'], name='endstats_player_game_side'),
+        ),
+    ]
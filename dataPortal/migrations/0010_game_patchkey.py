@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+def patchKey(patch):
+    # frozen copy of models.patchKey
+    parts = [int(part) if part.isdigit() else 0 for part in str(patch or '').split('.')[:3]]
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 1000000 + parts[1] * 1000 + parts[2]
+
+
+def backfillPatchKeys(apps, schema_editor):
+    Game = apps.get_model('dataPortal', 'Game')
+    for patch in Game.objects.values_list('patch', flat=True).distinct():
+        Game.objects.filter(patch=patch).update(patchKey=patchKey(patch))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0009_player_game_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='patchKey',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfillPatchKeys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['patchKey', 'date'], name='game_patchkey_date'),
+        ),
+    ]
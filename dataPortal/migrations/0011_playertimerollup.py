@@ -0,0 +1,71 @@
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Sum, When
+import django.db.models.deletion
+
+
+def fillRollups(apps, schema_editor):
+    # same cells as rollups.rebuildRollups, computed with the historical models; the game's teamB and teamR are the
+    # Teams foreign keys since 0002_reconcile_models
+    PlayerTimeData = apps.get_model('dataPortal', 'PlayerTimeData')
+    PlayerTimeRollup = apps.get_model('dataPortal', 'PlayerTimeRollup')
+
+    rows = PlayerTimeData.objects.values(
+        'time', 'side', 'role', 'champ', 'team', 'player', patchKey=F('gameID__patchKey'),
+        competitionID=F('gameID__competitionID'),
+        opponentTeam=Case(When(side='B', then=F('gameID__teamR')), default=F('gameID__teamB')),
+    ).annotate(
+        sum_rows=Count('id'), sum_kills=Sum('kills'), sum_deaths=Sum('deaths'), sum_assists=Sum('assists'),
+        sum_gold=Sum('gold'), sum_minions=Sum('minions'), sum_exp=Sum('exp'), sum_goldDiff=Sum('goldDiff'),
+        sum_goldDiffRows=Count('goldDiff'), sum_expDiff=Sum('expDiff'), sum_expDiffRows=Count('expDiff'),
+    ).order_by()
+
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(PlayerTimeRollup(
+            patchKey=row['patchKey'], competitionID_id=row['competitionID'], side=row['side'], team_id=row['team'],
+            opponentTeam_id=row['opponentTeam'], role=row['role'], player_id=row['player'], champ=row['champ'],
+            time=row['time'], **{field[4:]: value or 0 for field, value in row.items() if field.startswith('sum_')}))
+        if len(batch) >= 2000:
+            PlayerTimeRollup.objects.bulk_create(batch)
+            batch = []
+    PlayerTimeRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0010_game_patchkey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerTimeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patchKey', models.IntegerField()),
+                ('side', models.CharField(choices=[('B', 'blue'), ('R', 'red')], max_length=1)),
+                ('role', models.CharField(blank=True, choices=[('top', 'toplaner'), ('jgl', 'jungler'), ('mid', 'midlaner'), ('bot', 'botlaner'), ('sup', 'support')], max_length=16)),
+                ('champ', models.CharField(max_length=24)),
+                ('time', models.IntegerField()),
+                ('rows', models.IntegerField(default=0)),
+                ('kills', models.BigIntegerField(default=0)),
+                ('deaths', models.BigIntegerField(default=0)),
+                ('assists', models.BigIntegerField(default=0)),
+                ('gold', models.FloatField(default=0)),
+                ('minions', models.BigIntegerField(default=0)),
+                ('exp', models.FloatField(default=0)),
+                ('goldDiff', models.FloatField(default=0)),
+                ('goldDiffRows', models.IntegerField(default=0)),
+                ('expDiff', models.FloatField(default=0)),
+                ('expDiffRows', models.IntegerField(default=0)),
+                ('competitionID', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='dataPortal.competition')),
+                ('opponentTeam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dataPortal.teams')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dataPortal.player')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dataPortal.teams')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patchKey', 'competitionID', 'role'], name='timerollup_patch_comp_role'), models.Index(fields=['team', 'patchKey'], name='timerollup_team_patch'), models.Index(fields=['opponentTeam', 'patchKey'], name='timerollup_opponent_patch')],
+            },
+        ),
+        migrations.RunPython(fillRollups, migrations.RunPython.noop),
+    ]
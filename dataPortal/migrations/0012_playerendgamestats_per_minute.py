@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+def backfillPerMinuteStats(apps, schema_editor):
+    PlayerEndGameStats = apps.get_model('dataPortal', 'PlayerEndGameStats')
+
+    batch = []
+    stats = PlayerEndGameStats.objects.select_related('gameID').only(
+        'gold', 'minions', 'visionScore', 'DMGtoChamps', 'gameID__gameLength')
+    for row in stats.iterator(chunk_size=BATCH_SIZE):
+        row.gameSeconds = int(row.gameID.gameLength.total_seconds())
+        minutes = row.gameSeconds / 60
+        if minutes:
+            row.gpm = row.gold / minutes
+            row.cspm = row.minions / minutes
+            row.vspm = row.visionScore / minutes
+            row.dpm = row.DMGtoChamps / minutes
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            PlayerEndGameStats.objects.bulk_update(batch, ['gameSeconds', 'gpm', 'cspm', 'vspm', 'dpm'])
+            batch = []
+    PlayerEndGameStats.objects.bulk_update(batch, ['gameSeconds', 'gpm', 'cspm', 'vspm', 'dpm'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0011_playertimerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerendgamestats',
+            name='gameSeconds',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerendgamestats',
+            name='gpm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerendgamestats',
+            name='cspm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerendgamestats',
+            name='vspm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerendgamestats',
+            name='dpm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfillPerMinuteStats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,166 @@
+import math
+from django.db import migrations, models
+from django.db.models import Case, F, When
+import django.db.models.deletion
+
+
+BATCH_SIZE = 2000
+# the sketches of the cells of this many players are computed, written and dropped together
+PLAYERS_PER_GROUP = 100
+
+CELL_KEY = {
+    'cellPatchKey': F('gameID__patchKey'),
+    'cellCompetition': F('gameID__competitionID'),
+    'cellSide': F('side'),
+    'cellTeam': F('team'),
+    'cellOpponentTeam': Case(When(side='B', then=F('gameID__teamR')), default=F('gameID__teamB')),
+    'cellRole': F('role'),
+    'cellPlayer': F('player'),
+}
+KEY_COLUMNS = ('patchKey', 'competitionID_id', 'side', 'team_id', 'opponentTeam_id', 'role', 'player_id')
+
+
+class TDigest:
+    '''
+    Frozen copy of the parts of dataPortal.sketches.TDigest this migration writes, so that the sketches it stores keep
+    the format of this point in the history whatever later becomes of the live class
+    '''
+    compression = 100
+
+    def __init__(self):
+        self.centroids = []
+        self.buffer = []
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        if value is None:
+            return
+        self.buffer.append([float(value), 1])
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        if len(self.buffer) > 5 * self.compression:
+            self.compress()
+
+    def scale(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def compress(self):
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        if not points:
+            self.centroids = []
+            return
+        total = sum(weight for _, weight in points)
+        merged = [list(points[0])]
+        before = 0
+        kLeft = self.scale(0)
+        for mean, weight in points[1:]:
+            last = merged[-1]
+            if self.scale((before + last[1] + weight) / total) - kLeft <= 1:
+                last[1] += weight
+                last[0] += (mean - last[0]) * weight / last[1]
+            else:
+                before += last[1]
+                kLeft = self.scale(before / total)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def toJSON(self):
+        self.compress()
+        return {'c': self.centroids, 'min': self.minimum, 'max': self.maximum}
+
+
+def fillTimeSketches(PlayerTimeData, PlayerTimeRollup, players):
+    timeSketches = {}
+    rows = PlayerTimeData.objects.filter(player__in=players).annotate(
+        **CELL_KEY, cellChamp=F('champ'), cellTime=F('time')).values_list(
+        *CELL_KEY, 'cellChamp', 'cellTime', 'goldDiff', 'expDiff')
+    for *key, goldDiff, expDiff in rows.iterator(chunk_size=BATCH_SIZE):
+        goldDigest, expDigest = timeSketches.setdefault(tuple(key), (TDigest(), TDigest()))
+        goldDigest.add(goldDiff)
+        expDigest.add(expDiff)
+
+    batch = []
+    for cell in PlayerTimeRollup.objects.filter(player__in=players).iterator(chunk_size=BATCH_SIZE):
+        digests = timeSketches.get(tuple(getattr(cell, column) for column in KEY_COLUMNS + ('champ', 'time')))
+        if digests:
+            cell.goldDiffSketch, cell.expDiffSketch = (digest.toJSON() for digest in digests)
+            batch.append(cell)
+        if len(batch) >= BATCH_SIZE:
+            PlayerTimeRollup.objects.bulk_update(batch, ['goldDiffSketch', 'expDiffSketch'])
+            batch = []
+    PlayerTimeRollup.objects.bulk_update(batch, ['goldDiffSketch', 'expDiffSketch'])
+
+
+def fillEndSketches(PlayerEndGameStats, PlayerEndGameRollup, players):
+    endCells = {}
+    rows = PlayerEndGameStats.objects.filter(player__in=players).annotate(**CELL_KEY).values_list(
+        *CELL_KEY, 'kills', 'deaths', 'assists', 'gpm', 'cspm', 'vspm', 'dpm')
+    for *key, kills, deaths, assists, gpm, cspm, vspm, dpm in rows.iterator(chunk_size=BATCH_SIZE):
+        cell = endCells.setdefault(tuple(key), [0] + [TDigest() for _ in range(5)])
+        cell[0] += 1
+        for digest, value in zip(cell[1:], ((kills + assists) / max(deaths, 1), gpm, cspm, vspm, dpm)):
+            digest.add(value)
+    PlayerEndGameRollup.objects.bulk_create([
+        PlayerEndGameRollup(**dict(zip(KEY_COLUMNS, key)), games=games, kdaSketch=kda.toJSON(), gpmSketch=gpm.toJSON(),
+                            cspmSketch=cspm.toJSON(), vspmSketch=vspm.toJSON(), dpmSketch=dpm.toJSON())
+        for key, (games, kda, gpm, cspm, vspm, dpm) in endCells.items()
+    ], batch_size=BATCH_SIZE)
+
+
+def fillSketches(apps, schema_editor):
+    # same cells as rollups.rebuildRollups, computed with the historical models; the game's teamB and teamR are the
+    # Teams foreign keys since 0002_reconcile_models. Every cell belongs to one player, so the cells are filled a group
+    # of players at a time and only the sketches of one group are ever held
+    Player = apps.get_model('dataPortal', 'Player')
+    players = list(Player.objects.order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(players), PLAYERS_PER_GROUP):
+        group = players[i:i + PLAYERS_PER_GROUP]
+        fillTimeSketches(apps.get_model('dataPortal', 'PlayerTimeData'),
+                         apps.get_model('dataPortal', 'PlayerTimeRollup'), group)
+        fillEndSketches(apps.get_model('dataPortal', 'PlayerEndGameStats'),
+                        apps.get_model('dataPortal', 'PlayerEndGameRollup'), group)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0012_playerendgamestats_per_minute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playertimerollup',
+            name='goldDiffSketch',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playertimerollup',
+            name='expDiffSketch',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='PlayerEndGameRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patchKey', models.IntegerField()),
+                ('side', models.CharField(choices=[('B', 'blue'), ('R', 'red')], max_length=1)),
+                ('role', models.CharField(blank=True, choices=[('top', 'toplaner'), ('jgl', 'jungler'), ('mid', 'midlaner'), ('bot', 'botlaner'), ('sup', 'support')], max_length=16)),
+                ('games', models.IntegerField(default=0)),
+                ('kdaSketch', models.JSONField(blank=True, null=True)),
+                ('gpmSketch', models.JSONField(blank=True, null=True)),
+                ('cspmSketch', models.JSONField(blank=True, null=True)),
+                ('vspmSketch', models.JSONField(blank=True, null=True)),
+                ('dpmSketch', models.JSONField(blank=True, null=True)),
+                ('competitionID', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='dataPortal.competition')),
+                ('opponentTeam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dataPortal.teams')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dataPortal.player')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dataPortal.teams')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patchKey', 'competitionID', 'role'], name='endrollup_patch_comp_role'), models.Index(fields=['team', 'patchKey'], name='endrollup_team_patch'), models.Index(fields=['opponentTeam', 'patchKey'], name='endrollup_opponent_patch')],
+            },
+        ),
+        migrations.RunPython(fillSketches, migrations.RunPython.noop),
+    ]
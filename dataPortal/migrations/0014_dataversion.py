@@ -0,0 +1,25 @@
+import time
+from django.db import migrations, models
+
+
+def seedDataVersion(apps, schema_editor):
+    # seeded from the clock, so it is above any stamp the former cache-held version handed out
+    apps.get_model('dataPortal', 'DataVersion').objects.create(pk=1, version=time.time_ns())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0013_rollup_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(seedDataVersion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+BATCH_SIZE = 2000
+
+SKETCHES = {
+    'playertimerollup': ('goldDiffSketch', 'expDiffSketch'),
+    'playerendgamerollup': ('kdaSketch', 'gpmSketch', 'cspmSketch', 'vspmSketch', 'dpmSketch'),
+}
+
+
+def addCounts(apps, schema_editor):
+    # sketches now store the number of values they hold as n, so that rollups.verifyRollups can read it in SQL
+    for modelName, sketches in SKETCHES.items():
+        model = apps.get_model('dataPortal', modelName)
+        batch = []
+        for cell in model.objects.only('pk', *sketches).iterator(chunk_size=BATCH_SIZE):
+            for sketch in sketches:
+                data = getattr(cell, sketch)
+                if data:
+                    data['n'] = sum(weight for _, weight in data['c'])
+            batch.append(cell)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, sketches)
+                batch = []
+        model.objects.bulk_update(batch, sketches)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataPortal', '0014_dataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(addCounts, migrations.RunPython.noop),
+    ]
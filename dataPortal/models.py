@@ -4,7 +4,7 @@ from django.core.validators import MinValueValidator
 
 class Teams(models.Model):
     triCode = models.CharField(max_length=16)
-    models.JSONField(blank=True, null=True)
+    competition = models.CharField(max_length=511, blank=True, default='')
 
     class Meta:
         unique_together = (("triCode", "competition"),)
@@ -20,25 +20,76 @@ class Player(models.Model):
         unique_together = (("summonerName", "playerCode", "team"),)
 
 
+def patchKey(patch):
+    '''
+    Sortable integer of a patch string: "13.10" gives 13010000 and "13.10.2" gives 13010002
+    '''
+    parts = [int(part) if part.isdigit() else 0 for part in str(patch or '').split('.')[:3]]
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 1000000 + parts[1] * 1000 + parts[2]
+
+
+def perMinuteStats(gameSeconds, gold, minions, visionScore, DMGtoChamps):
+    '''
+    The per minute columns of PlayerEndGameStats for a game lasting gameSeconds
+    '''
+    minutes = gameSeconds / 60 if gameSeconds else None
+    return {
+        'gameSeconds': gameSeconds,
+        'gpm': gold / minutes if minutes else None,
+        'cspm': minions / minutes if minutes else None,
+        'vspm': visionScore / minutes if minutes else None,
+        'dpm': DMGtoChamps / minutes if minutes else None,
+    }
+
+
+class Competition(models.Model):
+    name = models.CharField(max_length=128, unique=True)
+    season = models.CharField(max_length=16, blank=True)
+    split = models.CharField(max_length=32, blank=True)
+    region = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["region", "season", "split"], name="competition_region_season"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
 class Game(models.Model):
     gameID = models.CharField(max_length=30, unique=True)
     competition = models.JSONField(blank=True, null=True)
+    competitionID = models.ForeignKey(Competition, on_delete=models.SET_NULL, null=True, blank=True)
     date = models.DateField()
     patch = models.CharField(max_length=8)
+    patchKey = models.IntegerField(default=0)
     gameLength = models.DurationField()
-    winnerTeam = models.ForeignKey(Teams, on_delete=models.CASCADE)
-    teamB = models.ForeignKey(Teams, on_delete=models.CASCADE)
-    teamR = models.ForeignKey(Teams, on_delete=models.CASCADE)
-    topB = models.ForeignKey(Player, on_delete=models.CASCADE)
-    jglB = models.ForeignKey(Player, on_delete=models.CASCADE)
-    midB = models.ForeignKey(Player, on_delete=models.CASCADE)
-    botB = models.ForeignKey(Player, on_delete=models.CASCADE)
-    supB = models.ForeignKey(Player, on_delete=models.CASCADE)
-    topR = models.ForeignKey(Player, on_delete=models.CASCADE)
-    jlgR = models.ForeignKey(Player, on_delete=models.CASCADE)
-    midR = models.ForeignKey(Player, on_delete=models.CASCADE)
-    botR = models.ForeignKey(Player, on_delete=models.CASCADE)
-    supR = models.ForeignKey(Player, on_delete=models.CASCADE)
+    winnerTeam = models.ForeignKey(Teams, on_delete=models.CASCADE, related_name='+')
+    teamB = models.ForeignKey(Teams, on_delete=models.CASCADE, related_name='+')
+    teamR = models.ForeignKey(Teams, on_delete=models.CASCADE, related_name='+')
+    topB = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    jglB = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    midB = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    botB = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    supB = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    topR = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    jglR = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    midR = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    botR = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    supR = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patch", "date"], name="game_patch_date"),
+            models.Index(fields=["competitionID", "patch", "date"], name="game_competition_patch_date"),
+            models.Index(fields=["patchKey", "date"], name="game_patchkey_date"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.patchKey = patchKey(self.patch)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return "Match: " + self.teamB + " vs " + self.teamR
@@ -60,9 +111,19 @@ class PlayerEndGameStats(models.Model):
     visionScore = models.IntegerField()
     DMGtoChamps = models.FloatField()
     DMGtoTowers = models.FloatField()
+    # per minute stats, stored at ingest from the game length (see perMinuteStats)
+    gameSeconds = models.IntegerField(null=True, blank=True)
+    gpm = models.FloatField(null=True, blank=True)
+    cspm = models.FloatField(null=True, blank=True)
+    vspm = models.FloatField(null=True, blank=True)
+    dpm = models.FloatField(null=True, blank=True)
 
     class Meta:
         unique_together = (("gameID", "player"),)
+        indexes = [
+            models.Index(fields=["gameID", "role", "team", "side", "player"], name="endstats_game_role_team_side"),
+            models.Index(fields=["player", "gameID", "side"], name="endstats_player_game_side"),
+        ]
 
 
 class Draft(models.Model):
@@ -88,6 +149,28 @@ class Draft(models.Model):
         unique_together = (("gameID", "side"),)
 
 
+DRAFT_SLOTS = ('ban1', 'ban2', 'ban3', 'ban4', 'ban5', 'pick1', 'pick2', 'pick3', 'pick4', 'pick5', 'top', 'jgl', 'mid', 'bot',
+               'sup')
+
+
+class DraftPick(models.Model):
+    '''
+    One row per champion of a Draft (bans, picks in order and the champion played in each role), so that draft
+    statistics are a GROUP BY instead of a loop over the 15 Draft columns
+    '''
+    gameID = models.ForeignKey(Game, on_delete=models.CASCADE)
+    side = models.CharField(max_length=1, choices=(("B", "blue"), ("R", "red"),))
+    team = models.ForeignKey(Teams, on_delete=models.CASCADE)
+    slot = models.CharField(max_length=8, choices=[(slot, slot) for slot in DRAFT_SLOTS])
+    champion = models.CharField(max_length=24)
+
+    class Meta:
+        unique_together = (("gameID", "side", "slot"),)
+        indexes = [
+            models.Index(fields=["gameID", "slot", "champion"], name="draftpick_game_slot_champion"),
+        ]
+
+
 class PlayerTimeData(models.Model):
     gameID = models.ForeignKey(Game, on_delete=models.CASCADE)
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
@@ -103,9 +186,77 @@ class PlayerTimeData(models.Model):
     minions = models.IntegerField(validators=[MinValueValidator(0)])
     exp = models.FloatField()
     opponent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True)
+    goldDiff = models.FloatField(null=True, blank=True)  # gold - opponent's gold, filled when lane opponents are paired
+    expDiff = models.FloatField(null=True, blank=True)
 
     class Meta:
         unique_together = (("gameID", "player", "time"),)
+        indexes = [
+            models.Index(fields=["gameID", "role", "time"], name="timedata_game_role_time"),
+        ]
+
+
+class PlayerTimeRollup(models.Model):
+    '''
+    Sums and counts of PlayerTimeData per patch, competition, side, team, opponent team, role, player, champion and
+    time, kept up to date at ingest and on game deletion, so timestamp averages are sums divided by counts
+    '''
+    patchKey = models.IntegerField()
+    competitionID = models.ForeignKey(Competition, on_delete=models.CASCADE, null=True, blank=True)
+    side = models.CharField(max_length=1, choices=(("B", "blue"), ("R", "red"),))
+    team = models.ForeignKey(Teams, on_delete=models.CASCADE, related_name='+')
+    opponentTeam = models.ForeignKey(Teams, on_delete=models.CASCADE, related_name='+')
+    role = models.CharField(max_length=16, choices=(("top", "toplaner"), ("jgl", "jungler"), ("mid", "midlaner"), ("bot", "botlaner"), ("sup", "support"),), blank=True)
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    champ = models.CharField(max_length=24)
+    time = models.IntegerField()
+    rows = models.IntegerField(default=0)
+    kills = models.BigIntegerField(default=0)
+    deaths = models.BigIntegerField(default=0)
+    assists = models.BigIntegerField(default=0)
+    gold = models.FloatField(default=0)
+    minions = models.BigIntegerField(default=0)
+    exp = models.FloatField(default=0)
+    goldDiff = models.FloatField(default=0)
+    goldDiffRows = models.IntegerField(default=0)  # goldDiff and expDiff are only summed over paired rows
+    expDiff = models.FloatField(default=0)
+    expDiffRows = models.IntegerField(default=0)
+    goldDiffSketch = models.JSONField(blank=True, null=True)  # sketches.TDigest of the goldDiff values
+    expDiffSketch = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patchKey", "competitionID", "role"], name="timerollup_patch_comp_role"),
+            models.Index(fields=["team", "patchKey"], name="timerollup_team_patch"),
+            models.Index(fields=["opponentTeam", "patchKey"], name="timerollup_opponent_patch"),
+        ]
+
+
+class PlayerEndGameRollup(models.Model):
+    '''
+    Sketches (sketches.TDigest) of the per game KDA and per minute stats of PlayerEndGameStats per patch, competition,
+    side, team, opponent team, role and player, maintained like PlayerTimeRollup
+    '''
+    patchKey = models.IntegerField()
+    competitionID = models.ForeignKey(Competition, on_delete=models.CASCADE, null=True, blank=True)
+    side = models.CharField(max_length=1, choices=(("B", "blue"), ("R", "red"),))
+    team = models.ForeignKey(Teams, on_delete=models.CASCADE, related_name='+')
+    opponentTeam = models.ForeignKey(Teams, on_delete=models.CASCADE, related_name='+')
+    role = models.CharField(max_length=16, choices=(("top", "toplaner"), ("jgl", "jungler"), ("mid", "midlaner"), ("bot", "botlaner"), ("sup", "support"),), blank=True)
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    games = models.IntegerField(default=0)
+    kdaSketch = models.JSONField(blank=True, null=True)
+    gpmSketch = models.JSONField(blank=True, null=True)
+    cspmSketch = models.JSONField(blank=True, null=True)
+    vspmSketch = models.JSONField(blank=True, null=True)
+    dpmSketch = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patchKey", "competitionID", "role"], name="endrollup_patch_comp_role"),
+            models.Index(fields=["team", "patchKey"], name="endrollup_team_patch"),
+            models.Index(fields=["opponentTeam", "patchKey"], name="endrollup_opponent_patch"),
+        ]
 
 
 class Drakes(models.Model):
@@ -161,3 +312,46 @@ class Towers(models.Model):
     first = models.BooleanField()
     time = models.DurationField()
 
+
+
+class ObjectiveEvent(models.Model):
+    '''
+    Every drake, herald, baron, first blood, plate and tower of a game in one table, told apart by type, so that
+    cross-objective questions and whole-game timelines are a single indexed scan instead of six
+    '''
+    gameID = models.ForeignKey(Game, on_delete=models.CASCADE)
+    type = models.CharField(max_length=16, choices=(("drake", "drake"), ("herald", "herald"), ("baron", "baron"), ("firstBlood", "first blood"), ("plate", "plate"), ("tower", "tower"),))
+    team = models.ForeignKey(Teams, on_delete=models.CASCADE)
+    side = models.CharField(max_length=1, choices=(("B", "blue"), ("R", "red"),))
+    detail = models.CharField(max_length=24, blank=True)  # drakeType for drakes, lane for plates and towers
+    killer = models.ForeignKey(Player, on_delete=models.SET_NULL, null=True, blank=True)
+    assistants = models.JSONField(blank=True, null=True)
+    first = models.BooleanField(default=False)
+    time = models.DurationField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["gameID", "type", "team", "side"], name="objective_game_type_team_side"),
+        ]
+
+
+class SearchChoice(models.Model):
+    '''
+    Values offered by the filters of CommonDataSearchForm, materialized at ingest so that rendering the form never
+    runs a DISTINCT over the match tables
+    '''
+    field = models.CharField(max_length=16, choices=(("patch", "patch"), ("competition", "competition"), ("team", "team"), ("player", "player"),))
+    value = models.CharField(max_length=255)
+    label = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = (("field", "value"),)
+        ordering = ["field", "label"]
+
+
+class DataVersion(models.Model):
+    '''
+    Single row counting the changes to the game data. Cached search results are keyed on its value, and every process
+    reads it from the database, so a change made by any process invalidates the caches of all of them
+    '''
+    version = models.BigIntegerField()
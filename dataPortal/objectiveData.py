@@ -0,0 +1,91 @@
+from datetime import timedelta
+from django.db.models import QuerySet, Q, Count, Sum
+from .models import ObjectiveEvent
+from .instrumentation import timedStage
+
+'''
+Every objective lives in ObjectiveEvent, so all the per-team/per-side counts, first counts and first times are one
+GROUP BY over (type, team, side, detail), served by the (gameID, type, team, side) index. The sections keep the
+shape of the former per-objective queries: a first-objective key only appears when the team took that first.
+'''
+
+OBJECTIVE_KINDS = ('drakes', 'heralds', 'barons', 'firstBlood', 'towers', 'plates')
+
+# section of the search results: ObjectiveEvent.type
+OBJECTIVE_TYPES = {
+    'drakes': 'drake',
+    'heralds': 'herald',
+    'barons': 'baron',
+    'firstBlood': 'firstBlood',
+    'towers': 'tower',
+    'plates': 'plate',
+}
+
+
+@timedStage
+def getObjectiveData(games: QuerySet, totalGames: int, kinds=OBJECTIVE_KINDS):
+    '''
+    Computes counts, first rates and average first times of every requested objective in one query and returns
+    them keyed by kind, each one in the nested team/side shape the view expects
+    '''
+    objectiveData = {kind: {} for kind in kinds}
+    if not kinds:
+        return objectiveData
+
+    kindOfType = {OBJECTIVE_TYPES[kind]: kind for kind in kinds}
+    rows = ObjectiveEvent.objects.filter(gameID__in=games, type__in=list(kindOfType)).values('type', 'team__triCode', 'side',
+                                                                                      'detail').annotate(
+        total=Count('id'),
+        firstCount=Count('id', filter=Q(first=True)),
+        firstTime=Sum('time', filter=Q(first=True)),
+    ).values_list('type', 'team__triCode', 'side', 'detail', 'total', 'firstCount', 'firstTime')
+
+    for objectiveType, team, side, detail, total, firstCount, firstTime in rows:
+        kind = kindOfType[objectiveType]
+        sideData = objectiveData[kind].setdefault(team, {}).setdefault(side, {})
+        avgFirstTime = firstTime / firstCount if firstCount else None
+
+        if kind == 'drakes':
+            sideData[detail] = total
+            if firstCount:
+                firstDrake = sideData.setdefault('firstDrake', {})
+                firstDrake[detail] = firstCount
+                # the first drake average is per team and side, so it is re-weighted over the drake types
+                firstDrake['firstCount'] = firstDrake.get('firstCount', 0) + firstCount
+                firstDrake['firstTime'] = firstDrake.get('firstTime', timedelta()) + firstTime
+        elif kind == 'heralds':
+            sideData['heralds'] = total
+            if firstCount:
+                sideData['firstHeralds'] = firstCount
+                sideData['avgTimeToFirstHerald'] = avgFirstTime
+        elif kind == 'barons':
+            objectiveData[kind][team][side] = total
+        elif kind == 'firstBlood':
+            sideData['firstBloodRate'] = (total/totalGames)*100
+            sideData['avgTime'] = avgFirstTime
+        elif kind == 'towers':
+            sideData[detail] = {
+                'towerCount': total,
+                'firstTowerStats': {'firstTowerRate': firstCount/total},
+            }
+            if firstCount:
+                sideData[detail]['firstTowerStats']['avgTime'] = avgFirstTime
+        elif kind == 'plates':
+            sideData[detail] = total/totalGames #plates per game per lane
+            sideData['avgCountPerGame'] = sideData.get('avgCountPerGame', 0) + total/totalGames #plates per game
+
+    for team in objectiveData.get('drakes', {}).values():
+        for sideData in team.values():
+            firstDrake = sideData.get('firstDrake', {})
+            if 'firstCount' in firstDrake:
+                firstDrake['avgTime'] = firstDrake.pop('firstTime') / firstDrake.pop('firstCount')
+
+    return objectiveData
+
+
+def getGameObjectiveTimeline(game):
+    '''
+    Returns every objective of a game in chronological order with a single range scan on the gameID index
+    '''
+    return list(ObjectiveEvent.objects.filter(gameID=game).order_by('time').values(
+        'type', 'team__triCode', 'side', 'detail', 'killer__summonerName', 'first', 'time'))
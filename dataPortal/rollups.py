@@ -0,0 +1,359 @@
+import time
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, When
+from .models import DataVersion, Game, PlayerEndGameStats, PlayerEndGameRollup, PlayerTimeData, PlayerTimeRollup, \
+    patchKey
+from .sketches import TDigest
+
+'''
+PlayerTimeRollup holds one cell of sums, counts and goldDiff/expDiff sketches per (patch, competition, side, team,
+opponent team, role, player, champion, time), and PlayerEndGameRollup the sketches of the end of game stats per (patch,
+competition, side, team, opponent team, role, player). applyGames adds or subtracts the rows of some games, which
+MatchImporter does after every batch and the pre_delete signal of Game does before the rows are gone, and
+recomputeCells rebuilds the cells a saved game moved its rows out of and into; rebuildRollups and verifyRollups
+recompute every cell from the raw tables.
+
+The fact tables are only written through MatchImporter (and the Game signals) for the cells to follow them: rows saved,
+updated or deleted any other way leave the cells behind. Searches whose filters are all rollup dimensions are therefore
+only answered from the cells once verifyRollups passed at the current data version (rollupsVerified); until
+rebuildRollups is run after such a write, they read the raw rows.
+
+Sums can be subtracted but sketches cannot, so after games are removed refreshSketches rebuilds the sketches of the
+cells they touched from the remaining rows.
+
+Cells are read, changed and written back, so every writer first locks the DataVersion row (lockRollups) in its
+transaction: concurrent imports and deletions queue up instead of overwriting each other's sums and sketches or
+creating the same cell twice.
+'''
+
+ROLLUP_COLUMNS = ('patchKey', 'competitionID_id', 'side', 'team_id', 'opponentTeam_id', 'role', 'player_id', 'champ',
+                  'time')
+END_ROLLUP_COLUMNS = ROLLUP_COLUMNS[:7]
+ROLLUP_AGGREGATES = {
+    'rows': Count('id'), 'kills': Sum('kills'), 'deaths': Sum('deaths'), 'assists': Sum('assists'), 'gold': Sum('gold'),
+    'minions': Sum('minions'), 'exp': Sum('exp'), 'goldDiff': Sum('goldDiff'), 'goldDiffRows': Count('goldDiff'),
+    'expDiff': Sum('expDiff'), 'expDiffRows': Count('expDiff'),
+}
+ROLLUP_SUMS = tuple(ROLLUP_AGGREGATES)
+TIME_SKETCHES = ('goldDiffSketch', 'expDiffSketch')
+END_SKETCHES = ('kdaSketch', 'gpmSketch', 'cspmSketch', 'vspmSketch', 'dpmSketch')
+
+# filters of CommonDataSearchForm that select whole rollup cells
+ROLLUP_FILTERS = ('patch', 'patchFrom', 'patchTo', 'competition', 'team', 'role')
+
+# the key columns of a raw row, named so they do not clash with the fields of the raw models
+CELL_KEY = {
+    'cellPatchKey': F('gameID__patchKey'),
+    'cellCompetition': F('gameID__competitionID'),
+    'cellSide': F('side'),
+    'cellTeam': F('team'),
+    'cellOpponentTeam': Case(When(side='B', then=F('gameID__teamR')), default=F('gameID__teamB')),
+    'cellRole': F('role'),
+    'cellPlayer': F('player'),
+}
+
+
+def gameKDA(kills, deaths, assists):
+    '''
+    KDA of one game, counting a deathless game as one death so it stays finite
+    '''
+    return (kills + assists) / max(deaths, 1)
+
+
+def computeCells(timeData):
+    '''
+    Sums the given PlayerTimeData rows into rollup cells, returned as {key: {sum: value}} keyed in ROLLUP_COLUMNS order
+    '''
+    rows = timeData.values(**CELL_KEY, cellChamp=F('champ'), cellTime=F('time')).\
+        annotate(**{'sum_' + field: aggregate for field, aggregate in ROLLUP_AGGREGATES.items()}).order_by()
+
+    cells = {}
+    for row in rows:
+        key = tuple(row[column] for column in (*CELL_KEY, 'cellChamp', 'cellTime'))
+        cells[key] = {field: row['sum_' + field] or 0 for field in ROLLUP_SUMS}
+    return cells
+
+
+def computeTimeSketches(timeData):
+    '''
+    Sketches of goldDiff and expDiff per rollup cell of the given PlayerTimeData rows, keyed like computeCells
+    '''
+    sketches = {}
+    rows = timeData.annotate(**CELL_KEY, cellChamp=F('champ'), cellTime=F('time')).values_list(
+        *CELL_KEY, 'cellChamp', 'cellTime', 'goldDiff', 'expDiff')
+    for *key, goldDiff, expDiff in rows.iterator(chunk_size=5000):
+        goldDigest, expDigest = sketches.setdefault(tuple(key), (TDigest(), TDigest()))
+        goldDigest.add(goldDiff)
+        expDigest.add(expDiff)
+    return {key: dict(zip(TIME_SKETCHES, digests)) for key, digests in sketches.items()}
+
+
+def computeEndSketches(endStats):
+    '''
+    Games played and sketches of the per game KDA and per minute stats per PlayerEndGameRollup cell, keyed in
+    END_ROLLUP_COLUMNS order
+    '''
+    cells = {}
+    rows = endStats.annotate(**CELL_KEY).values_list(*CELL_KEY, 'kills', 'deaths', 'assists', 'gpm', 'cspm', 'vspm',
+                                                     'dpm')
+    for *key, kills, deaths, assists, gpm, cspm, vspm, dpm in rows.iterator(chunk_size=5000):
+        cell = cells.setdefault(tuple(key), {'games': 0, **{sketch: TDigest() for sketch in END_SKETCHES}})
+        cell['games'] += 1
+        for sketch, value in zip(END_SKETCHES, (gameKDA(kills, deaths, assists), gpm, cspm, vspm, dpm)):
+            cell[sketch].add(value)
+    return cells
+
+
+ROLLUPS_VERIFIED_KEY = 'rollupsVerified'
+
+
+def lockRollups():
+    '''
+    Takes the lock serializing the writers of the rollup cells, held until the current transaction ends
+    '''
+    DataVersion.objects.select_for_update().get_or_create(pk=1, defaults={'version': time.time_ns()})
+
+
+def _storedCells(model, columns, keys):
+    stored = model.objects.filter(patchKey__in={key[0] for key in keys}, player__in={key[6] for key in keys})
+    return {tuple(getattr(cell, column) for column in columns): cell for cell in stored}
+
+
+def _rawRowsOf(model, keys):
+    # a superset of the raw rows of the cells of the given keys
+    return model.objects.filter(gameID__patchKey__in={key[0] for key in keys}, player__in={key[6] for key in keys})
+
+
+def applyGames(games, sign=1):
+    '''
+    Adds (sign=1) or subtracts (sign=-1) the PlayerTimeData and PlayerEndGameStats rows of the given games to the
+    rollup cells and returns the keys of the cells touched, as (PlayerTimeRollup keys, PlayerEndGameRollup keys).
+    Subtracting leaves the sketches as they were: once the rows are gone, refreshSketches rebuilds them
+    '''
+    games = list(games)
+    with transaction.atomic():
+        lockRollups()
+        return _applyTimeRows(games, sign), _applyEndRows(games, sign)
+
+
+def _applyTimeRows(games, sign):
+    cells = computeCells(PlayerTimeData.objects.filter(gameID__in=games))
+    if not cells:
+        return set()
+    sketches = computeTimeSketches(PlayerTimeData.objects.filter(gameID__in=games)) if sign > 0 else {}
+
+    stored = _storedCells(PlayerTimeRollup, ROLLUP_COLUMNS, cells)
+    created, updated, emptied = [], [], []
+    for key, sums in cells.items():
+        cell = stored.get(key)
+        if cell is None:
+            if sign > 0:
+                created.append(PlayerTimeRollup(**dict(zip(ROLLUP_COLUMNS, key)), **sums,
+                                                **{sketch: digest.toJSON() for sketch, digest in sketches[key].items()}))
+            continue
+        for field, value in sums.items():
+            setattr(cell, field, getattr(cell, field) + sign * value)
+        for sketch, digest in sketches.get(key, {}).items():
+            setattr(cell, sketch, digest.merge(TDigest.fromJSON(getattr(cell, sketch))).toJSON())
+        (emptied if cell.rows <= 0 else updated).append(cell)
+
+    PlayerTimeRollup.objects.bulk_create(created, batch_size=1000)
+    PlayerTimeRollup.objects.bulk_update(updated, ROLLUP_SUMS + TIME_SKETCHES, batch_size=1000)
+    PlayerTimeRollup.objects.filter(pk__in=[cell.pk for cell in emptied]).delete()
+    return set(cells)
+
+
+def _applyEndRows(games, sign):
+    cells = computeEndSketches(PlayerEndGameStats.objects.filter(gameID__in=games))
+    if not cells:
+        return set()
+    # the end cells have no champion or time, so the player is the 7th column of their keys too
+    stored = _storedCells(PlayerEndGameRollup, END_ROLLUP_COLUMNS, cells)
+
+    created, updated, emptied = [], [], []
+    for key, cellSketches in cells.items():
+        cell = stored.get(key)
+        if cell is None:
+            if sign > 0:
+                created.append(PlayerEndGameRollup(**dict(zip(END_ROLLUP_COLUMNS, key)), games=cellSketches['games'],
+                                                   **{sketch: cellSketches[sketch].toJSON() for sketch in END_SKETCHES}))
+            continue
+        cell.games += sign * cellSketches['games']
+        if sign > 0:
+            for sketch in END_SKETCHES:
+                setattr(cell, sketch, cellSketches[sketch].merge(TDigest.fromJSON(getattr(cell, sketch))).toJSON())
+        (emptied if cell.games <= 0 else updated).append(cell)
+
+    PlayerEndGameRollup.objects.bulk_create(created, batch_size=1000)
+    PlayerEndGameRollup.objects.bulk_update(updated, ('games',) + END_SKETCHES, batch_size=1000)
+    PlayerEndGameRollup.objects.filter(pk__in=[cell.pk for cell in emptied]).delete()
+    return set(cells)
+
+
+def cellKeysOf(games):
+    '''
+    The keys of the cells the rows of the given games are summed in, as (PlayerTimeRollup keys, PlayerEndGameRollup
+    keys)
+    '''
+    timeRows = PlayerTimeData.objects.filter(gameID__in=games).annotate(
+        **CELL_KEY, cellChamp=F('champ'), cellTime=F('time')).values_list(*CELL_KEY, 'cellChamp', 'cellTime')
+    endRows = PlayerEndGameStats.objects.filter(gameID__in=games).annotate(**CELL_KEY).values_list(*CELL_KEY)
+    return set(timeRows.distinct().order_by()), set(endRows.distinct().order_by())
+
+
+def recomputeCells(timeKeys, endKeys):
+    '''
+    Recomputes the sums and sketches of the given cells from the raw rows they currently hold, creating the cells that
+    gained rows and deleting the ones left without any
+    '''
+    with transaction.atomic():
+        lockRollups()
+        if timeKeys:
+            rows = _rawRowsOf(PlayerTimeData, timeKeys)
+            cells, sketches = computeCells(rows), computeTimeSketches(rows)
+            _replaceCells(PlayerTimeRollup, ROLLUP_COLUMNS, ROLLUP_SUMS + TIME_SKETCHES, timeKeys, {key: {
+                **sums, **{sketch: digest.toJSON() for sketch, digest in sketches[key].items()}}
+                for key, sums in cells.items()})
+        if endKeys:
+            cells = computeEndSketches(_rawRowsOf(PlayerEndGameStats, endKeys))
+            _replaceCells(PlayerEndGameRollup, END_ROLLUP_COLUMNS, ('games',) + END_SKETCHES, endKeys, {key: {
+                'games': cell['games'], **{sketch: cell[sketch].toJSON() for sketch in END_SKETCHES}}
+                for key, cell in cells.items()})
+
+
+def _replaceCells(model, columns, fields, keys, values):
+    stored = _storedCells(model, columns, keys)
+    created, updated, emptied = [], [], []
+    for key in keys:
+        cell = stored.get(key)
+        if key not in values:
+            if cell is not None:
+                emptied.append(cell)
+        elif cell is None:
+            created.append(model(**dict(zip(columns, key)), **values[key]))
+        else:
+            for field, value in values[key].items():
+                setattr(cell, field, value)
+            updated.append(cell)
+    model.objects.bulk_create(created, batch_size=1000)
+    model.objects.bulk_update(updated, fields, batch_size=1000)
+    model.objects.filter(pk__in=[cell.pk for cell in emptied]).delete()
+
+
+def refreshSketches(timeKeys, endKeys):
+    '''
+    Rebuilds the sketches of the given cells from the raw rows they currently hold
+    '''
+    with transaction.atomic():
+        lockRollups()
+        if timeKeys:
+            sketches = computeTimeSketches(_rawRowsOf(PlayerTimeData, timeKeys))
+            cells = [cell for key, cell in _storedCells(PlayerTimeRollup, ROLLUP_COLUMNS, timeKeys).items()
+                     if key in timeKeys]
+            for cell in cells:
+                digests = sketches.get(tuple(getattr(cell, column) for column in ROLLUP_COLUMNS), {})
+                for sketch in TIME_SKETCHES:
+                    setattr(cell, sketch, digests[sketch].toJSON() if sketch in digests else None)
+            PlayerTimeRollup.objects.bulk_update(cells, TIME_SKETCHES, batch_size=1000)
+
+        if endKeys:
+            sketches = computeEndSketches(_rawRowsOf(PlayerEndGameStats, endKeys))
+            cells = [cell for key, cell in _storedCells(PlayerEndGameRollup, END_ROLLUP_COLUMNS, endKeys).items()
+                     if key in endKeys]
+            for cell in cells:
+                digests = sketches.get(tuple(getattr(cell, column) for column in END_ROLLUP_COLUMNS), {})
+                for sketch in END_SKETCHES:
+                    setattr(cell, sketch, digests[sketch].toJSON() if sketch in digests else None)
+            PlayerEndGameRollup.objects.bulk_update(cells, END_SKETCHES, batch_size=1000)
+
+
+def rebuildRollups(batchSize=1000):
+    '''
+    Replaces every rollup cell by a full recompute from the raw tables, one batch of games at a time
+    '''
+    gamePKs = list(Game.objects.order_by('pk').values_list('pk', flat=True))
+    with transaction.atomic():
+        lockRollups()
+        PlayerTimeRollup.objects.all().delete()
+        PlayerEndGameRollup.objects.all().delete()
+        for i in range(0, len(gamePKs), batchSize):
+            applyGames(gamePKs[i:i + batchSize])
+    return PlayerTimeRollup.objects.count() + PlayerEndGameRollup.objects.count()
+
+
+def verifyRollups(tolerance=1e-6):
+    '''
+    Compares the stored cells with a full recompute and returns the keys of the cells that differ. Both sides are
+    aggregated by the database, one row per cell. Sketches are approximate, so only the number of values they hold
+    (their n) is compared
+    '''
+    expected = computeCells(PlayerTimeData.objects.all())
+    for key, sums in expected.items():
+        sums['goldDiffSketch'], sums['expDiffSketch'] = sums['goldDiffRows'], sums['expDiffRows']
+    stored = {}
+    timeCounts = [sketch + '__n' for sketch in TIME_SKETCHES]
+    for row in PlayerTimeRollup.objects.values_list(*ROLLUP_COLUMNS, *ROLLUP_SUMS, *timeCounts):
+        stored[row[:len(ROLLUP_COLUMNS)]] = {field: value or 0 for field, value in
+                                             zip(ROLLUP_SUMS + TIME_SKETCHES, row[len(ROLLUP_COLUMNS):])}
+
+    # the KDA of every game is sketched, the per minute stats only where they are known
+    endRows = PlayerEndGameStats.objects.values(**CELL_KEY).annotate(
+        games=Count('id'), kdaSketch=Count('id'), gpmSketch=Count('gpm'), cspmSketch=Count('cspm'),
+        vspmSketch=Count('vspm'), dpmSketch=Count('dpm')).order_by()
+    for row in endRows:
+        expected[tuple(row[column] for column in CELL_KEY)] = {field: row[field] for field in ('games',) + END_SKETCHES}
+    endCounts = [sketch + '__n' for sketch in END_SKETCHES]
+    for row in PlayerEndGameRollup.objects.values_list(*END_ROLLUP_COLUMNS, 'games', *endCounts):
+        stored[row[:len(END_ROLLUP_COLUMNS)]] = {field: value or 0 for field, value in
+                                                 zip(('games',) + END_SKETCHES, row[len(END_ROLLUP_COLUMNS):])}
+
+    mismatched = []
+    for key in set(expected) | set(stored):
+        sums, cell = expected.get(key), stored.get(key)
+        if sums is None or cell is None or any(abs(value - cell[field]) > tolerance * max(1, abs(value))
+                                               for field, value in sums.items()):
+            mismatched.append(key)
+    return mismatched
+
+
+def rollupsVerified():
+    '''
+    Whether the cells matched the raw tables when last verified at the current data version. verifyRollups runs once
+    per data version, its outcome being cached under it in the search cache
+    '''
+    from .searchCache import getDataVersion, getSearchCache
+    key = '%s:%s' % (ROLLUPS_VERIFIED_KEY, getDataVersion())
+    verified = getSearchCache().get(key)
+    if verified is None:
+        verified = not verifyRollups()
+        getSearchCache().set(key, verified)
+    return verified
+
+
+def isRollupSearch(cleaned_data: dict):
+    '''
+    Whether every filter of the search is a rollup dimension, so that it can be answered from the rollup cells
+    '''
+    return all(value in ('', None) for field, value in cleaned_data.items() if field not in ROLLUP_FILTERS)
+
+
+def getRollupCells(cleaned_data: dict, model=PlayerTimeRollup):
+    '''
+    Returns the cells of a rollup model matching the search, or None when it filters on something the cells cannot
+    express
+    '''
+    if not isRollupSearch(cleaned_data):
+        return None
+
+    cells = model.objects.all()
+    if cleaned_data.get('patch'):
+        cells = cells.filter(patchKey=patchKey(cleaned_data['patch']))
+    if cleaned_data.get('patchFrom'):
+        cells = cells.filter(patchKey__gte=patchKey(cleaned_data['patchFrom']))
+    if cleaned_data.get('patchTo'):
+        cells = cells.filter(patchKey__lte=patchKey(cleaned_data['patchTo']))
+    if cleaned_data.get('competition'):
+        cells = cells.filter(competitionID=cleaned_data['competition'])
+    if cleaned_data.get('team'):
+        cells = cells.filter(Q(team__triCode=cleaned_data['team']) | Q(opponentTeam__triCode=cleaned_data['team']))
+    return cells
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import date
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db.models import F, Model
+from .forms import CommonDataSearchForm
+from .draftSearch import draftIndexVersion
+from .models import DataVersion
+from .teamDataSearch import teamDataSearch, teamDataSearchAsync
+
+'''
+Results of teamDataSearch are cached under the normalized search parameters plus a global data version stamp.
+Saving or deleting a game, and every import batch, bumps the stamp, so every older entry simply stops being
+addressable and expires through the cache backend's own eviction (TIMEOUT and MAX_ENTRIES of the TEAM_SEARCH_CACHE
+alias). The stamp is the DataVersion row rather than a cache entry: every process reads the same value, whatever the
+cache backend, and a bump made inside a transaction becomes visible together with the data it stands for.
+'''
+
+# backends whose entries are private to one process: results stored by one worker are never hit by the others
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+_countersLock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0}
+
+
+def getSearchCache():
+    return caches[getattr(settings, 'TEAM_SEARCH_CACHE', 'default')]
+
+
+def getDataVersion():
+    version = DataVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+    if version is None:
+        # a lost stamp is re-seeded from the clock, so it can never fall back to a value older entries were stored with
+        version = DataVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})[0].version
+    return version
+
+
+def bumpDataVersion():
+    if not DataVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        DataVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def checkSearchCacheBackend(app_configs, **kwargs):
+    alias = getattr(settings, 'TEAM_SEARCH_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+        return [checks.Error(
+            'The %s cache (TEAM_SEARCH_CACHE) uses %s, which is not shared between processes.' % (alias, backend),
+            hint='Use a shared backend such as DatabaseCache, FileBasedCache or RedisCache in production.',
+            id='dataPortal.E001')]
+    return []
+
+
+def normalizeSearch(cleaned_data: dict):
+    normalized = {}
+    for field, value in cleaned_data.items():
+        if isinstance(value, Model):
+            value = value.pk
+        elif isinstance(value, date):
+            value = value.isoformat()
+        elif isinstance(value, str):
+            value = value.strip() or None
+        normalized[field] = value
+    if not normalized.get('role'):
+        normalized['role'] = 'any'
+    normalized['role'] = normalized['role'].lower()
+    return normalized
+
+
+def searchCacheKey(cleaned_data: dict, version, sections=None, fields=None, prefix='teamDataSearch'):
+    search = normalizeSearch(cleaned_data)
+    search['sections'] = sorted(sections) if sections is not None else None
+    search['fields'] = {section: sorted(sectionFields) for section, sectionFields in (fields or {}).items()}
+    search = json.dumps(search, sort_keys=True, default=str)
+    return '%s:%s:%s' % (prefix, version, hashlib.sha1(search.encode()).hexdigest())
+
+
+def _lookup(form: CommonDataSearchForm, sections=None, fields=None):
+    version = getDataVersion()
+    key = searchCacheKey(form.cleaned_data, version, sections, fields)
+    teamData = getSearchCache().get(key)
+    with _countersLock:
+        _counters['hits' if teamData is not None else 'misses'] += 1
+    return key, version, teamData
+
+
+def cacheable(cleaned_data: dict, version):
+    # a draft query answered by a stale index (getDraftIndex(stale=True)) must not be stored under the new version
+    return not cleaned_data.get('draftQuery') or (draftIndexVersion() or 0) >= version
+
+
+def _store(form: CommonDataSearchForm, key, version, teamData):
+    if cacheable(form.cleaned_data, version):
+        getSearchCache().set(key, teamData)
+
+
+def cachedTeamDataSearch(form: CommonDataSearchForm, sections=None, fields=None):
+    key, version, teamData = _lookup(form, sections, fields)
+    if teamData is None:
+        teamData = teamDataSearch(form, sections, fields)
+        _store(form, key, version, teamData)
+    return teamData
+
+
+async def cachedTeamDataSearchAsync(form: CommonDataSearchForm, sections=None, fields=None):
+    key, version, teamData = await sync_to_async(_lookup)(form, sections, fields)
+    if teamData is None:
+        teamData = await teamDataSearchAsync(form, sections, fields)
+        await sync_to_async(_store)(form, key, version, teamData)
+    return teamData
+
+
+def getCacheStats():
+    with _countersLock:
+        hits, misses = _counters['hits'], _counters['misses']
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses, 'hitRate': hits/lookups if lookups else None}
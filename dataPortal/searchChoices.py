@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.db import transaction
+from .models import Competition, Game, Teams, Player, SearchChoice, patchKey
+
+'''
+The choice lists of CommonDataSearchForm. They are recomputed from the match tables only by refreshSearchChoices (run
+after every import), stored in SearchChoice and cached under the data version, so building the form costs at most
+one small indexed read, and a refresh made by another process (an import command) is seen by every process.
+'''
+
+SEARCH_CHOICES_KEY = 'searchChoices'
+SEARCH_CHOICES_TIMEOUT = 60 * 5
+
+
+def computeSearchChoices():
+    return {
+        'patch': [(patch, patch) for patch in Game.objects.values_list('patch', flat=True).distinct()],
+        'competition': [(str(pk), name) for pk, name in
+                        Competition.objects.filter(game__isnull=False).distinct().values_list('pk', 'name')],
+        'team': [(triCode, triCode) for triCode in Teams.objects.values_list('triCode', flat=True).distinct()],
+        'player': [(name, name) for name in Player.objects.values_list('summonerName', flat=True).distinct()],
+    }
+
+
+def refreshSearchChoices():
+    from .searchCache import bumpDataVersion
+    with transaction.atomic():
+        SearchChoice.objects.all().delete()
+        SearchChoice.objects.bulk_create([
+            SearchChoice(field=field, value=value, label=label)
+            for field, choices in computeSearchChoices().items() for value, label in choices
+        ])
+        # the import's own bumps may have been seen before the refresh: the refreshed choices need a version of their own
+        bumpDataVersion()
+
+
+def getSearchChoices():
+    from .searchCache import getDataVersion
+    key = '%s:%s' % (SEARCH_CHOICES_KEY, getDataVersion())
+    choices = cache.get(key)
+    if choices is None:
+        choices = {}
+        for field, value, label in SearchChoice.objects.values_list('field', 'value', 'label'):
+            choices.setdefault(field, []).append((value, label))
+        choices.get('patch', []).sort(key=lambda choice: patchKey(choice[0]))
+        cache.set(key, choices, SEARCH_CHOICES_TIMEOUT)
+    return choices
+
+
+def searchChoiceLabel(field, value):
+    return dict(getSearchChoices().get(field, [])).get(value, value)
+
+
+def searchChoicesFor(field):
+    '''
+    Returns a callable giving the current choices of a form field, with an empty choice first
+    '''
+    return lambda: [('', '---------')] + getSearchChoices().get(field, [])
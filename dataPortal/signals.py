@@ -0,0 +1,81 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import Game, Draft, DraftPick, PlayerEndGameStats, PlayerTimeData, ObjectiveEvent, Drakes, Heralds, \
+    Barons, FirstBlood, Plates, Towers, DRAFT_SLOTS
+from .rollups import applyGames, cellKeysOf, recomputeCells, refreshSketches
+from .searchCache import bumpDataVersion
+
+'''
+The search cache is invalidated (bumpDataVersion) once per saved or deleted game, once per saved row of a game, and by
+MatchImporter once per batch. The fact tables only have save receivers: a delete receiver on them would turn off
+Django's fast delete of the game's rows (one DELETE per table instead of fetching and signalling every row), so code
+deleting their rows directly, or writing them with bulk_create or update, calls bumpDataVersion itself. Draft, two rows
+per game, has a delete receiver removing its picks.
+'''
+
+FACT_MODELS = [PlayerEndGameStats, PlayerTimeData, DraftPick, ObjectiveEvent, Drakes, Heralds, Barons, FirstBlood,
+               Plates, Towers]
+
+
+def draftPicksOf(draft: Draft):
+    game = draft.gameID
+    team = game.teamB_id if draft.side == 'B' else game.teamR_id
+    return [DraftPick(gameID_id=draft.gameID_id, side=draft.side, team_id=team, slot=slot,
+                      champion=getattr(draft, slot)) for slot in DRAFT_SLOTS]
+
+
+@receiver(post_save, sender=Draft)
+def syncDraftPicks(sender, instance, **kwargs):
+    DraftPick.objects.filter(gameID=instance.gameID_id, side=instance.side).delete()
+    DraftPick.objects.bulk_create(draftPicksOf(instance))
+    bumpDataVersion()
+
+
+@receiver(post_delete, sender=Draft)
+def deleteDraftPicks(sender, instance, origin=None, **kwargs):
+    # the picks of a deleted game go with it, and the game's own receiver bumps the version
+    if isinstance(origin, Game) or getattr(origin, 'model', None) is Game:
+        return
+    DraftPick.objects.filter(gameID=instance.gameID_id, side=instance.side).delete()
+    bumpDataVersion()
+
+
+def invalidateOnRowSave(sender, instance, **kwargs):
+    bumpDataVersion()
+
+
+for factModel in FACT_MODELS:
+    post_save.connect(invalidateOnRowSave, sender=factModel)
+
+
+@receiver(pre_delete, sender=Game)
+def subtractGameRollups(sender, instance, **kwargs):
+    # runs while the game's rows still exist; a queryset delete sends every pre_delete before deleting anything
+    instance.rollupKeys = applyGames([instance.pk], sign=-1)
+
+
+@receiver(post_delete, sender=Game)
+def refreshGameSketches(sender, instance, **kwargs):
+    # runs once the rows of every deleted game are gone
+    refreshSketches(*getattr(instance, 'rollupKeys', ((), ())))
+    bumpDataVersion()
+
+
+@receiver(pre_save, sender=Game)
+def rememberGameCells(sender, instance, **kwargs):
+    # a game whose patch, competition or teams change moves its rows to other rollup cells: the ones they leave are
+    # only known before the save
+    instance.movedCellKeys = None
+    if instance.pk is not None and Game.objects.filter(pk=instance.pk).exclude(
+            patchKey=instance.patchKey, competitionID=instance.competitionID_id, teamB=instance.teamB_id,
+            teamR=instance.teamR_id).exists():
+        instance.movedCellKeys = cellKeysOf([instance.pk])
+
+
+@receiver(post_save, sender=Game)
+def invalidateSearchCache(sender, instance, **kwargs):
+    moved = getattr(instance, 'movedCellKeys', None)
+    if moved:
+        timeKeys, endKeys = cellKeysOf([instance.pk])
+        recomputeCells(moved[0] | timeKeys, moved[1] | endKeys)
+    bumpDataVersion()
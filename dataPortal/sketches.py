@@ -0,0 +1,118 @@
+import math
+
+'''
+A mergeable t-digest (the merging variant of Dunning's t-digest): values are kept as centroids (mean, weight) whose
+size shrinks towards both tails, so extreme quantiles stay accurate while a digest never holds more than about
+2 * compression centroids. Two digests merge into one describing the union of their values, which is what lets the
+rollup cells answer quantiles of any combination of games.
+'''
+
+DEFAULT_COMPRESSION = 100
+
+
+class TDigest:
+    def __init__(self, compression=DEFAULT_COMPRESSION, centroids=None, minimum=None, maximum=None):
+        self.compression = compression
+        self.centroids = [list(centroid) for centroid in centroids or []]
+        self.buffer = []
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return sum(weight for _, weight in self.centroids) + sum(weight for _, weight in self.buffer)
+
+    def add(self, value, weight=1):
+        if value is None:
+            return
+        self.buffer.append([float(value), weight])
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        if len(self.buffer) > 5 * self.compression:
+            self.compress()
+
+    def merge(self, other):
+        if other.minimum is not None:
+            self.buffer += [list(centroid) for centroid in other.centroids + other.buffer]
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+            self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+            self.compress()
+        return self
+
+    def _scale(self, q):
+        # k1 scale function: centroids near q=0 and q=1 may only hold a few values
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def compress(self):
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        if not points:
+            self.centroids = []
+            return
+
+        total = sum(weight for _, weight in points)
+        merged = [list(points[0])]
+        before = 0
+        kLeft = self._scale(0)
+        for mean, weight in points[1:]:
+            last = merged[-1]
+            if self._scale((before + last[1] + weight) / total) - kLeft <= 1:
+                last[1] += weight
+                last[0] += (mean - last[0]) * weight / last[1]
+            else:
+                before += last[1]
+                kLeft = self._scale(before / total)
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q):
+        if self.buffer:
+            self.compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        total = sum(weight for _, weight in self.centroids)
+        target = q * total
+        # each centroid is centred on the middle of its weight, the extremes sit at both ends
+        points = [(0.0, self.minimum)]
+        cumulative = 0
+        for mean, weight in self.centroids:
+            points.append((cumulative + weight / 2, mean))
+            cumulative += weight
+        points.append((float(total), self.maximum))
+
+        for (leftRank, leftValue), (rightRank, rightValue) in zip(points, points[1:]):
+            if target <= rightRank:
+                if rightRank == leftRank:
+                    return rightValue
+                return leftValue + (rightValue - leftValue) * (target - leftRank) / (rightRank - leftRank)
+        return self.maximum
+
+    def toJSON(self):
+        # n is only read by the database (rollups.verifyRollups), fromJSON ignores it
+        self.compress()
+        return {'c': self.centroids, 'min': self.minimum, 'max': self.maximum, 'n': self.count}
+
+    @classmethod
+    def fromJSON(cls, data, compression=DEFAULT_COMPRESSION):
+        if not data:
+            return cls(compression)
+        return cls(compression, data['c'], data['min'], data['max'])
+
+
+def mergeSketches(sketches, compression=DEFAULT_COMPRESSION):
+    '''
+    Merges stored (JSON) sketches into a single TDigest
+    '''
+    digest = TDigest(compression)
+    for sketch in sketches:
+        if sketch:
+            digest.buffer += [list(centroid) for centroid in sketch['c']]
+            digest.minimum = sketch['min'] if digest.minimum is None else min(digest.minimum, sketch['min'])
+            digest.maximum = sketch['max'] if digest.maximum is None else max(digest.maximum, sketch['max'])
+            if len(digest.buffer) > 5 * compression:
+                digest.compress()
+    digest.compress()
+    return digest
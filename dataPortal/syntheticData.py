@@ -0,0 +1,107 @@
+import random
+from datetime import date, timedelta
+
+'''
+Deterministic synthetic leagues, produced as match dicts in the import_matches format so that MatchImporter fills
+every table exactly as a real import would. The same arguments and seed always produce the same league.
+'''
+
+ROLES = ('top', 'jgl', 'mid', 'bot', 'sup')
+LANES = ('top', 'mid', 'bot')
+DRAKE_TYPES = ('infernal', 'mountain', 'ocean', 'cloud', 'hextech', 'chemtech', 'elder')
+CHAMPIONS = ('Aatrox', 'Ahri', 'Akali', 'Alistar', 'Aphelios', 'Ashe', 'Azir', 'Bard', 'Braum', 'Caitlyn', 'Camille',
+             'Corki', 'Draven', 'Elise', 'Ezreal', 'Fiora', 'Gnar', 'Gragas', 'Gwen', 'Hecarim', 'Jarvan IV', 'Jax',
+             'Jayce', 'Jinx', 'Kaisa', 'Kalista', 'Karma', 'Kennen', 'KSante', 'LeBlanc', 'Lee Sin', 'Leona', 'Lucian',
+             'Lulu', 'Maokai', 'Nami', 'Nautilus', 'Neeko', 'Orianna', 'Poppy', 'Rakan', 'Rell', 'Renekton', 'Renata',
+             'Rumble', 'Ryze', 'Sejuani', 'Syndra', 'Taliyah', 'Thresh', 'Tristana', 'Varus', 'Vi', 'Viego', 'Xayah',
+             'Xin Zhao', 'Yone', 'Zeri', 'Ziggs', 'Zoe')
+
+
+def syntheticLeague(games=1000, teams=10, playersPerTeam=5, timestampsPerGame=4, seed=0,
+                    competition='Synthetic League 2023', startDate=date(2023, 1, 1), patches=24):
+    '''
+    Yields the matches of a season of `games` games between `teams` teams, each with a roster of `playersPerTeam`
+    players (at least one per role), a timeline snapshot every 5 minutes `timestampsPerGame` times and the patch
+    moving forward across `patches` patches over the season
+    '''
+    rng = random.Random(seed)
+    triCodes = ['T%02d' % team for team in range(teams)]
+    rosters = {
+        triCode: [('%s_%s%d' % (triCode, ROLES[p % 5], p // 5), ROLES[p % 5]) for p in range(max(playersPerTeam, 5))]
+        for triCode in triCodes
+    }
+
+    for i in range(games):
+        blue, red = rng.sample(triCodes, 2)
+        champions = rng.sample(CHAMPIONS, 20)
+        lengthSeconds = rng.randint(1500, 2700)
+
+        players = []
+        for s, (side, triCode) in enumerate((('B', blue), ('R', red))):
+            for r, role in enumerate(ROLES):
+                summonerName = rng.choice([name for name, rosterRole in rosters[triCode] if rosterRole == role])
+                players.append({
+                    'summonerName': summonerName,
+                    'playerCode': summonerName.lower(),
+                    'side': side,
+                    'role': role,
+                    'champ': champions[s * 5 + r],
+                    'stats': {
+                        'kills': rng.randint(0, 10),
+                        'deaths': rng.randint(0, 8),
+                        'assists': rng.randint(0, 15),
+                        'gold': float(rng.randint(7000, 18000)),
+                        'minions': rng.randint(20 if role in ('jgl', 'sup') else 180, 60 if role == 'sup' else 380),
+                        'wardPlaced': rng.randint(5, 80),
+                        'wardKilled': rng.randint(0, 30),
+                        'visionScore': rng.randint(15, 120),
+                        'DMGtoChamps': float(rng.randint(3000, 35000)),
+                        'DMGtoTowers': float(rng.randint(0, 9000)),
+                    },
+                    'timeline': [{
+                        'time': minute,
+                        'kills': rng.randint(0, minute // 5),
+                        'deaths': rng.randint(0, minute // 6),
+                        'assists': rng.randint(0, minute // 4),
+                        'gold': float(500 + minute * rng.randint(300, 450)),
+                        'minions': rng.randint(0, minute * 9),
+                        'exp': float(minute * rng.randint(350, 500)),
+                    } for minute in range(5, 5 * timestampsPerGame + 1, 5)],
+                })
+
+        sideTeams = {'B': blue, 'R': red}
+        objectives = [{'type': 'firstBlood', 'side': rng.choice('BR'), 'time': rng.randint(90, 600)}]
+        objectives[0]['killer'] = rng.choice([p['summonerName'] for p in players if p['side'] == objectives[0]['side']])
+        for d, drakeTime in enumerate(sorted(rng.sample(range(300, lengthSeconds), rng.randint(1, 5)))):
+            objectives.append({'type': 'drake', 'side': rng.choice('BR'), 'time': drakeTime, 'first': d == 0,
+                               'drakeType': rng.choice(DRAKE_TYPES[:-1])})
+        for h, heraldTime in enumerate(sorted(rng.sample(range(480, 1200), rng.randint(0, 2)))):
+            objectives.append({'type': 'herald', 'side': rng.choice('BR'), 'time': heraldTime, 'first': h == 0})
+        for baronTime in sorted(rng.sample(range(1200, lengthSeconds), rng.randint(0, 2))):
+            objectives.append({'type': 'baron', 'side': rng.choice('BR'), 'time': baronTime})
+        for lane in LANES:
+            for _ in range(rng.randint(0, 5)):
+                side = rng.choice('BR')
+                objectives.append({'type': 'plate', 'side': side, 'time': rng.randint(240, 840), 'lane': lane,
+                                   'killer': rng.choice([p['summonerName'] for p in players if p['side'] == side])})
+        firstTower = rng.randint(0, 2)
+        for t, towerTime in enumerate(sorted(rng.sample(range(600, lengthSeconds), rng.randint(1, 9)))):
+            side = rng.choice('BR')
+            objectives.append({'type': 'tower', 'side': side, 'time': towerTime, 'first': t == 0,
+                               'lane': LANES[(firstTower + t) % 3], 'assistants': [],
+                               'killer': rng.choice([p['summonerName'] for p in players if p['side'] == side])})
+
+        yield {
+            'gameID': 'SYN%d_%07d' % (seed, i),
+            'competition': competition,
+            'date': (startDate + timedelta(days=i * 180 // games)).isoformat(),
+            'patch': '13.%d' % (1 + i * patches // games),
+            'gameLength': lengthSeconds,
+            'teams': sideTeams,
+            'winner': rng.choice('BR'),
+            'players': players,
+            'draft': {side: {'bans': champions[10 + s * 5:15 + s * 5],
+                             'picks': [player['champ'] for player in players if player['side'] == side]}
+                      for s, side in enumerate('BR')},
+            'objectives': objectives,
+        }
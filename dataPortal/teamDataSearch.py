@@ -1,456 +1,432 @@
-from collections import defaultdict
-from .models import Game, PlayerEndGameStats, PlayerTimeData, Draft, Drakes, Heralds, Barons, FirstBlood, Plates, Towers
-from django.db.models import Q, Count, Avg, ExpressionWrapper, F, FloatField
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, close_old_connections
+from .models import patchKey, Teams, Player, Game, PlayerEndGameStats, PlayerTimeData, DraftPick
+from .objectiveData import getObjectiveData, OBJECTIVE_KINDS
+from django.db.models import QuerySet, Q, Exists, OuterRef, Count, Sum, Avg, ExpressionWrapper, FloatField
+from django.db.models.functions import NullIf
 from .forms import CommonDataSearchForm
-
-def teamDataSearch(form:CommonDataSearchForm):
+from .instrumentation import timedStage
+from .distributions import getDistributions, DISTRIBUTION_SECTIONS, DISTRIBUTION_FIELDS
+from .draftSearch import draftQueryGames, gamePKsSubquery
+from .flatSection import FlatSection
+from .rollups import getRollupCells, isRollupSearch, rollupsVerified
+from .searchChoices import searchChoiceLabel
+
+# independent stages of a search and the sections of teamData each one fills
+SEARCH_STAGES = {
+    'draft': ('draft',),
+    'end': ('end',),
+    'timeStamp': ('timeStamp',),
+    'objectives': OBJECTIVE_KINDS,
+    'distributions': DISTRIBUTION_SECTIONS,
+}
+# stages only run when one of their sections is asked for explicitly
+OPT_IN_STAGES = ('distributions',)
+# stages answered from the rollup cells when the search allows it
+ROLLUP_STAGES = ('timeStamp', 'distributions')
+SEARCH_SECTIONS = tuple(section for sections in SEARCH_STAGES.values() for section in sections)
+
+# fields a section can be projected on
+TIMESTAMP_FIELDS = ('avg_kills', 'avg_deaths', 'avg_assists', 'avg_gold', 'avg_minions', 'avg_exp', 'goldDiff', 'expDiff')
+END_GAME_FIELDS = ('KDA', 'GPM', 'CSPM', 'VSPM', 'DPM', 'avg_kills', 'avg_deaths', 'avg_assists', 'avg_gold',
+                   'avg_minions', 'avg_wardPlaced', 'avg_wardKilled', 'avg_visionScore', 'avg_DMGtoChamps',
+                   'avg_DMGtoTowers')
+SECTION_FIELDS = {'timeStamp': TIMESTAMP_FIELDS, 'end': END_GAME_FIELDS, **DISTRIBUTION_FIELDS}
+
+# rows fetched at a time by the aggregators, which never hold a whole result set
+ITERATOR_CHUNK_SIZE = 5000
+
+
+def playerGames(players):
+    '''
+    The games any of the players took part in, read from PlayerEndGameStats through its (player, gameID, side) index
+    '''
+    return PlayerEndGameStats.objects.filter(player__in=players).values('gameID')
+
+
+def playerPairGames(players, others, together=True):
+    '''
+    The games where one of the players met one of the others, on the same side (together) or on opposite sides
+    '''
+    other = PlayerEndGameStats.objects.filter(gameID=OuterRef('gameID'), player__in=others)
+    other = other.filter(side=OuterRef('side')) if together else other.exclude(side=OuterRef('side'))
+    return PlayerEndGameStats.objects.filter(player__in=players).filter(Exists(other)).values('gameID')
+
+
+def getSearchedGames(form: CommonDataSearchForm):
     patch = form.cleaned_data['patch']
     competition = form.cleaned_data['competition']
     team = form.cleaned_data['team']
-    role = form.cleaned_data['role']
     player = form.cleaned_data['player']
+    teammate = form.cleaned_data.get('teammate')
+    opponent = form.cleaned_data.get('opponent')
+    patchFrom, patchTo = form.cleaned_data.get('patchFrom'), form.cleaned_data.get('patchTo')
+    dateFrom, dateTo = form.cleaned_data.get('dateFrom'), form.cleaned_data.get('dateTo')
+    draftQuery = form.cleaned_data.get('draftQuery')
 
     matches = Game.objects.all()
 
     if patch:
         matches = matches.filter(patch=patch)
+    if patchFrom:
+        matches = matches.filter(patchKey__gte=patchKey(patchFrom))
+    if patchTo:
+        matches = matches.filter(patchKey__lte=patchKey(patchTo))
+    if dateFrom:
+        matches = matches.filter(date__gte=dateFrom)
+    if dateTo:
+        matches = matches.filter(date__lte=dateTo)
     if competition:
-        matches = matches.filter(competition__contains=competition)
+        matches = matches.filter(competitionID=competition)
     if team:
-        matches = matches.filter(Q(teamB=team) | Q(teamR=team))
+        teams = Teams.objects.filter(triCode=team).values('pk')
+        matches = matches.filter(Q(teamB__in=teams) | Q(teamR__in=teams))
     if player:
-        matches = matches.filter(Q(topB=player) | Q(jglB=player) | Q(midB=player) | Q(botB=player) | Q(supB=player) |
-                                 Q(topR=player) | Q(jglR=player) | Q(midR=player) | Q(botR=player) | Q(supR=player))
-
-    gameIDs = []
-    for game in matches:
-        gameIDs.append(game.gameID)
-
-    draftData = getDraftData(gameIDs, role)
-    endData = getEndGameDataStats(gameIDs, role)
-    timeStampData = getTeamTimestampData(gameIDs, role)
-    drakeData = getTeamDrakeInfo(gameIDs)
-    heraldData = getTeamHeraldInfo(gameIDs)
-    baronData = getBaronInfo(gameIDs)
-    firstBloodData = getTeamFirstBloodInfo(gameIDs)
-    towersData = getTeamTowersInfo(gameIDs)
-    platesData = getTeamPlatesInfo(gameIDs)
-
-    teamData = {
-        'yourSearch': {'patchSearched': patch, 'competitionSearched': competition, 'teamSearched': team,
-                       'roleSearched': role, 'playerSearched': player},
-        'draft': draftData,
-        'end': endData,
-        'timeStamp': timeStampData,
-        'drakes': drakeData,
-        'heralds': heraldData,
-        'barons': baronData,
-        'firstBlood': firstBloodData,
-        'towers': towersData,
-        'plates': platesData,
-    }
+        players = Player.objects.filter(summonerName=player).values('pk')
+        matches = matches.filter(pk__in=playerGames(players))
+        # a teammate or an opponent only narrows the games of the searched player
+        if teammate:
+            teammates = Player.objects.filter(summonerName=teammate).values('pk')
+            matches = matches.filter(pk__in=playerPairGames(players, teammates, together=True))
+        if opponent:
+            opponents = Player.objects.filter(summonerName=opponent).values('pk')
+            matches = matches.filter(pk__in=playerPairGames(players, opponents, together=False))
+    if draftQuery:
+        matches = matches.filter(pk__in=gamePKsSubquery(draftQueryGames(draftQuery, team)))
+
+    return matches
+
+
+def getYourSearch(form: CommonDataSearchForm):
+    competition = form.cleaned_data['competition']
+    return {'patchSearched': form.cleaned_data['patch'],
+            'competitionSearched': searchChoiceLabel('competition', competition) if competition else competition,
+            'teamSearched': form.cleaned_data['team'], 'roleSearched': form.cleaned_data['role'],
+            'playerSearched': form.cleaned_data['player'], 'teammateSearched': form.cleaned_data.get('teammate'),
+            'opponentSearched': form.cleaned_data.get('opponent'), 'patchFromSearched': form.cleaned_data.get('patchFrom'),
+            'patchToSearched': form.cleaned_data.get('patchTo'), 'dateFromSearched': form.cleaned_data.get('dateFrom'),
+            'dateToSearched': form.cleaned_data.get('dateTo'), 'draftQuerySearched': form.cleaned_data.get('draftQuery')}
+
+
+def getSearchStages(sections=None):
+    '''
+    Returns the stages needed to compute the requested sections (every section outside OPT_IN_STAGES when None), in
+    SEARCH_STAGES order
+    '''
+    if sections is None:
+        return [stage for stage in SEARCH_STAGES if stage not in OPT_IN_STAGES]
+    return [stage for stage, stageSections in SEARCH_STAGES.items() if set(stageSections) & set(sections)]
+
+
+def getRollupSearch(cleaned_data: dict, stages):
+    '''
+    The search when its rollup stages among stages can be answered from the rollup cells: every filter is a rollup
+    dimension and the cells are verified at the current data version. None otherwise
+    '''
+    if not set(stages) & set(ROLLUP_STAGES) or not isRollupSearch(cleaned_data) or not rollupsVerified():
+        return None
+    return cleaned_data
+
+
+def runSearchStage(stage: str, games: QuerySet, role: str, sections=None, fields=None, rollupSearch=None):
+    '''
+    Runs one stage of the search over the filtered games and returns the requested sections of teamData it computed.
+    fields optionally maps a section to the only fields it has to compute, and rollupSearch is the search when it can
+    be answered from the rollup cells
+    '''
+    fields = fields or {}
+    if stage == 'draft':
+        return {'draft': getDraftData(games, role).nested()}
+    if stage == 'end':
+        return {'end': getEndGameDataStats(games, role, fields.get('end')).nested()}
+    if stage == 'timeStamp':
+        if rollupSearch is not None:
+            return {'timeStamp': getRollupTimestampData(getRollupCells(rollupSearch), role,
+                                                        fields.get('timeStamp')).nested()}
+        return {'timeStamp': getTeamTimestampData(games, role, fields.get('timeStamp')).nested()}
+    if stage == 'distributions':
+        return {section: distribution.nested() for section, distribution in
+                getDistributions(games, role, sections, fields, rollupSearch).items()}
+    if stage == 'objectives':
+        kinds = [kind for kind in OBJECTIVE_KINDS if sections is None or kind in sections]
+        return getObjectiveData(games, games.count(), kinds)
+    raise ValueError("Unknown search stage: %s" % stage)
+
+
+@timedStage
+def teamDataSearch(form:CommonDataSearchForm, sections=None, fields=None):
+    '''
+    Computes the requested sections of the team data (every one when sections is None) for the games matching the form
+    '''
+    # the filtered games stay a subquery: every getter joins on it in the database
+    games = getSearchedGames(form).values('pk')
+    rollupSearch = getRollupSearch(form.cleaned_data, getSearchStages(sections))
+    role = form.cleaned_data['role'] or 'any'
+
+    teamData = {'yourSearch': getYourSearch(form)}
+    stagePool = getStagePool()
+    if stagePool is None or _mustRunSerially():
+        for stage in getSearchStages(sections):
+            teamData.update(runSearchStage(stage, games, role, sections, fields, rollupSearch))
+    else:
+        futures = [stagePool.submit(contextvars.copy_context().run, _runSearchStageInThread, stage, games, role,
+                                    sections, fields, rollupSearch) for stage in getSearchStages(sections)]
+        for future in futures:
+            teamData.update(future.result())
 
     return teamData
 
 
-def getDraftData(gameIDs: list, roleSearched: str):
-    draft_stats = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int))))
-    if roleSearched.lower() == 'any':
-        '''
-        Gets draft data of all the roles and teams involved in the games, divided by side and by team
-        '''
-        drafts = Draft.objects.filter(gameID__gameID__in=gameIDs)
-        for draft in drafts:
-            side = draft['side']
-            team = draft['team']
-            for i in range(1, 6):  # Itera su ban1, ban2, ban3, ban4, ban5
-                champion = draft[f'ban{i}']
-                draft_stats[side][team][f'ban{i}'][champion] += 1
-            for i in range(1, 6):
-                champion = draft[f'pick{i}']
-                draft_stats[side][team][f'pick{i}'][champion] += 1
-            for i in ['top', 'jgl', 'mid', 'bot', 'sup']:
-                champion = draft[i]
-                draft_stats[side][team][i][champion] += 1
-    else:
-        drafts = Draft.objects.filter(gameID__gameID__in=gameIDs)
-        for draft in drafts:
-            side = draft['side']
-            team = draft['team']
-            champion = draft[roleSearched]
-            draft_stats[side][team][roleSearched][champion] += 1
+def iterTeamDataSearch(form:CommonDataSearchForm, sections=None, fields=None):
+    '''
+    Yields the (section, data) pairs of teamDataSearch as soon as each stage finishes, so that a caller can send and
+    release every section without waiting for, or holding, the whole result
+    '''
+    games = getSearchedGames(form).values('pk')
+    rollupSearch = getRollupSearch(form.cleaned_data, getSearchStages(sections))
+    role = form.cleaned_data['role'] or 'any'
+
+    yield 'yourSearch', getYourSearch(form)
+
+    stages = getSearchStages(sections)
+    stagePool = getStagePool()
+    if stagePool is None or _mustRunSerially():
+        for stage in stages:
+            yield from runSearchStage(stage, games, role, sections, fields, rollupSearch).items()
+        return
+
+    # results travel through the queue only, so nothing keeps a section alive once it has been yielded
+    finished = queue.Queue()
+
+    def runStage(stage):
+        try:
+            finished.put(_runSearchStageInThread(stage, games, role, sections, fields, rollupSearch))
+        except Exception as error:
+            finished.put(error)
+
+    for stage in stages:
+        stagePool.submit(contextvars.copy_context().run, runStage, stage)
+    for _ in stages:
+        stageSections = finished.get()
+        if isinstance(stageSections, Exception):
+            raise stageSections
+        for section in list(stageSections):
+            yield section, stageSections.pop(section)
+
+
+def _runSearchStageInThread(stage: str, games: QuerySet, role: str, sections=None, fields=None, rollupSearch=None):
+    # worker threads keep their own connection from one stage to the next, like request threads do: it is only dropped
+    # once it is broken or older than CONN_MAX_AGE
+    close_old_connections()
+    try:
+        return runSearchStage(stage, games, role, sections, fields, rollupSearch)
+    finally:
+        close_old_connections()
+
+
+_stagePool = None
+_stagePoolLock = threading.Lock()
+
+
+def getStagePool():
+    '''
+    Returns the process-wide pool the stages of teamDataSearch are handed to, or None when
+    TEAM_SEARCH_THREAD_POOL_SIZE asks for serial execution
+    '''
+    global _stagePool
+    poolSize = getattr(settings, 'TEAM_SEARCH_THREAD_POOL_SIZE', 0)
+    if poolSize < 2:
+        return None
+    with _stagePoolLock:
+        if _stagePool is None:
+            _stagePool = ThreadPoolExecutor(max_workers=poolSize, thread_name_prefix='teamDataSearch')
+    return _stagePool
+
+
+def _mustRunSerially():
+    # other connections cannot see the rows of an open transaction (every TestCase runs in one) nor an in-memory database
+    return connection.in_atomic_block or (connection.vendor == 'sqlite' and connection.is_in_memory_db())
+
+
+async def teamDataSearchAsync(form:CommonDataSearchForm, sections=None, fields=None):
+    '''
+    Same result as teamDataSearch, with the stages running concurrently in worker threads, at most
+    TEAM_SEARCH_ASYNC_CONCURRENCY of them at a time, so the latency tends to the one of the slowest stage
+    '''
+    # both read the database (searched games through the draft index, labels of the search)
+    games = (await sync_to_async(getSearchedGames)(form)).values('pk')
+    rollupSearch = await sync_to_async(getRollupSearch)(form.cleaned_data, getSearchStages(sections))
+    role = form.cleaned_data['role'] or 'any'
+
+    semaphore = asyncio.Semaphore(getattr(settings, 'TEAM_SEARCH_ASYNC_CONCURRENCY', 4))
+
+    async def runStage(stage):
+        async with semaphore:
+            return await sync_to_async(_runSearchStageInThread, thread_sensitive=False)(stage, games, role, sections,
+                                                                                        fields, rollupSearch)
+
+    teamData = {'yourSearch': await sync_to_async(getYourSearch)(form)}
+    for stageSections in await asyncio.gather(*(runStage(stage) for stage in getSearchStages(sections))):
+        teamData.update(stageSections)
 
-    return draft_stats
+    return teamData
 
 
-def getEndGameDataStats(gameIDs: list, roleSearched: str):
-    endGameStats = {}
-    if roleSearched.lower() == 'any':
-        endgameAvgData = (
-            PlayerEndGameStats.objects.filters(gameID__gameID__in=gameIDs).values('team__triCode', 'side', 'role',
-                                                                                  'player__summonerName')
-            .annotate(
-                avg_kills=Avg('kills'),
-                avg_deaths=Avg('deaths'),
-                avg_assists=Avg('assists'),
-                avg_gold=Avg('gold'),
-                avg_minions=Avg('minions'),
-                avg_wardPlaced=Avg('wardPlaced'),
-                avg_wardKilled=Avg('wardKilled'),
-                avg_visionScore=Avg('visionScore'),
-                avg_DMGtoChamps=Avg('DMGtoChamps'),
-                avg_DMGtoTowers=Avg('DMGtoTowers'),
-            )
-        )
+@timedStage
+def getDraftData(games: QuerySet, roleSearched: str):
+    '''
+    Counts how many times each champion was banned, picked in each pick slot and played in each role, keyed by
+    (side, team, slot, champion). With a role searched only that role's champions are counted
+    '''
+    draft_stats = FlatSection()
 
-        endgameAvgData = endgameAvgData.annotate(
-            KDA=ExpressionWrapper(
-                (F('avg_kills') + F('avg_assists')) / F('avg_deaths'),
-                output_field=FloatField()
-            ),
-            GPM=ExpressionWrapper(
-                F('avg_gold') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            ),
-            CSPM=ExpressionWrapper(
-                F('avg_minions') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            ),
-            VSPM=ExpressionWrapper(
-                F('avg_visionScore') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            ),
-            DPM=ExpressionWrapper(
-                F('avg_DMGtoChamps') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            )
-        )
-    else:
-        endgameAvgData = (
-            PlayerEndGameStats.objects.filters(gameID__gameID__in=gameIDs, role=roleSearched.lower()).values('team__triCode',
-                                                                                 'side', 'role', 'player__summonerName')
-            .annotate(
-                avg_kills=Avg('kills'),
-                avg_deaths=Avg('deaths'),
-                avg_assists=Avg('assists'),
-                avg_gold=Avg('gold'),
-                avg_minions=Avg('minions'),
-                avg_wardPlaced=Avg('wardPlaced'),
-                avg_wardKilled=Avg('wardKilled'),
-                avg_visionScore=Avg('visionScore'),
-                avg_DMGtoChamps=Avg('DMGtoChamps'),
-                avg_DMGtoTowers=Avg('DMGtoTowers'),
-            )
-        )
+    picks = DraftPick.objects.filter(gameID__in=games)
+    if roleSearched.lower() != 'any':
+        picks = picks.filter(slot=roleSearched.lower())
+
+    draftCounts = picks.values_list('side', 'team__triCode', 'slot', 'champion').annotate(count=Count('id'))
+    for side, team, slot, champion, count in draftCounts.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        draft_stats[side, team, slot, champion] = count
+
+    return draft_stats
 
-        endgameAvgData = endgameAvgData.annotate(
-            KDA=ExpressionWrapper(
-                (F('avg_kills') + F('avg_assists')) / F('avg_deaths'),
-                output_field=FloatField()
-            ),
-            GPM=ExpressionWrapper(
-                F('avg_gold') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            ),
-            CSPM=ExpressionWrapper(
-                F('avg_minions') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            ),
-            VSPM=ExpressionWrapper(
-                F('avg_visionScore') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            ),
-            DPM=ExpressionWrapper(
-                F('avg_DMGtoChamps') / (F('gameID__gameLength').total_seconds() / 60),
-                output_field=FloatField()
-            )
-        )
-    for stats in endgameAvgData:
-        team = stats['team__triCode']
-        side = stats['side']
-        role = stats['role']
-        player = stats['player__summonerName']
-
-        if team not in endGameStats:
-            endGameStats[team] = {}
-        if side not in endGameStats[team]:
-            endGameStats[team][side] = {}
-        if role not in endGameStats[team][side]:
-            endGameStats[team][side][role] = {}
-        endGameStats[team][side][role][player] = {
-            "KDA": stats['KDA'],
-            "GPM": stats['GPM'],
-            "CSPM": stats['CSPM'],
-            "VSPM": stats['VSPM'],
-            "DPM": stats['DPM'],
-            "avg_kills": stats['avg_kills'],
-            "avg_deaths": stats['avg_deaths'],
-            "avg_assists": stats['avg_assists'],
-            "avg_gold": stats['avg_gold'],
-            "avg_minions": stats['avg_minions'],
-            "avg_wardPlaced": stats['avg_wardPlaced'],
-            "avg_wardKilled": stats['avg_wardKilled'],
-            "avg_visionScore": stats['avg_visionScore'],
-            "avg_DMGtoChamps": stats['avg_DMGtoChamps'],
-            "avg_DMGtoTowers": stats['avg_DMGtoTowers'],
-        }
 
+@timedStage
+def getEndGameDataStats(games: QuerySet, roleSearched: str, fields=None):
+    '''
+    Averages of every player's end of game stats, and of their per minute stats stored at ingest, keyed by
+    (team, side, role, player). KDA is the ratio of the averages and is None for a player who never died. fields
+    restricts the averages computed to the given END_GAME_FIELDS
+    '''
+    aggregates = {
+        'GPM': Avg('gpm'),
+        'CSPM': Avg('cspm'),
+        'VSPM': Avg('vspm'),
+        'DPM': Avg('dpm'),
+        'avg_kills': Avg('kills'),
+        'avg_deaths': Avg('deaths'),
+        'avg_assists': Avg('assists'),
+        'avg_gold': Avg('gold'),
+        'avg_minions': Avg('minions'),
+        'avg_wardPlaced': Avg('wardPlaced'),
+        'avg_wardKilled': Avg('wardKilled'),
+        'avg_visionScore': Avg('visionScore'),
+        'avg_DMGtoChamps': Avg('DMGtoChamps'),
+        'avg_DMGtoTowers': Avg('DMGtoTowers'),
+    }
+    kda = ExpressionWrapper((Avg('kills') + Avg('assists')) / NullIf(Avg('deaths'), 0), output_field=FloatField())
+    if not fields or 'KDA' in fields:
+        aggregates = {'KDA': kda, **aggregates}
+    if fields:
+        aggregates = {field: aggregate for field, aggregate in aggregates.items() if field in fields}
+
+    player_stats = PlayerEndGameStats.objects.filter(gameID__in=games)
+    if roleSearched.lower() != 'any':
+        player_stats = player_stats.filter(role=roleSearched.lower())
+
+    endgameAvgData = player_stats.values_list('team__triCode', 'side', 'role', 'player__summonerName').\
+        annotate(**aggregates)
+    endGameStats = FlatSection(aggregates)
+
+    for stats in endgameAvgData.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        endGameStats[stats[:4]] = stats[4:]
     return endGameStats
 
 
-def getTeamTimestampData(gameIDs:list, roleSearched: str):
-    player_data = PlayerTimeData.objects.filter(gameID__gameID__in=gameIDs).values('side', 'team__triCode', 'role',
-                                                                                'player__summonerName', 'champ', 'time')
-
-    average_data = player_data.values('side', 'team__triCode', 'role', 'player__summonerName', 'champ', 'time').\
-        annotate(
-            avg_kills=Avg('kills'),
-            avg_deaths=Avg('deaths'),
-            avg_assists=Avg('assists'),
-            avg_gold=Avg('gold'),
-            avg_minions=Avg('minions'),
-            avg_exp=Avg('exp'),
-            goldDiff=Avg(F('gold') - F('opponent__gold'), output_field=FloatField()),
-            expDiff=Avg(F('exp') - F('opponent__exp'), output_field=FloatField())
+@timedStage
+def getTeamTimestampData(games: QuerySet, roleSearched: str, fields=None):
+    '''
+    Averages of every player's stats at each timestamp, keyed by (side, team, role, player, champ, time). fields
+    restricts the averages computed to the given TIMESTAMP_FIELDS
+    '''
+    aggregates = {
+        'avg_kills': Avg('kills'),
+        'avg_deaths': Avg('deaths'),
+        'avg_assists': Avg('assists'),
+        'avg_gold': Avg('gold'),
+        'avg_minions': Avg('minions'),
+        'avg_exp': Avg('exp'),
+        'goldDiff': Avg('goldDiff'),
+        'expDiff': Avg('expDiff'),
+    }
+    if fields:
+        aggregates = {field: aggregate for field, aggregate in aggregates.items() if field in fields}
+
+    player_data = PlayerTimeData.objects.filter(gameID__in=games)
+    if roleSearched.lower() != 'any':
+        player_data = player_data.filter(role=roleSearched.lower())
+
+    average_data = player_data.values_list('side', 'team__triCode', 'role', 'player__summonerName', 'champ', 'time').\
+        annotate(**aggregates)
+    timeStampData = FlatSection(aggregates, suffixed=('goldDiff', 'expDiff'))
+
+    for entry in average_data.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        timeStampData[entry[:6]] = entry[6:]
+    return timeStampData
+
+
+@timedStage
+def getRollupTimestampData(cells: QuerySet, roleSearched: str, fields=None):
+    '''
+    Same result as getTeamTimestampData, read from the PlayerTimeRollup cells of the search (see rollups.getRollupCells)
+    instead of the raw rows
+    '''
+    averages = {
+        'avg_kills': ('kills', 'rows'),
+        'avg_deaths': ('deaths', 'rows'),
+        'avg_assists': ('assists', 'rows'),
+        'avg_gold': ('gold', 'rows'),
+        'avg_minions': ('minions', 'rows'),
+        'avg_exp': ('exp', 'rows'),
+        'goldDiff': ('goldDiff', 'goldDiffRows'),
+        'expDiff': ('expDiff', 'expDiffRows'),
+    }
+    if fields:
+        averages = {field: average for field, average in averages.items() if field in fields}
+    sums = {column for average in averages.values() for column in average}
+
+    if roleSearched.lower() != 'any':
+        cells = cells.filter(role=roleSearched.lower())
+
+    sums = sorted(sums)
+    totals = cells.values_list('side', 'team__triCode', 'role', 'player__summonerName', 'champ', 'time').\
+        annotate(**{'sum_' + column: Sum(column) for column in sums}).order_by()
+    timeStampData = FlatSection(averages, suffixed=('goldDiff', 'expDiff'))
+    positions = {column: 6 + i for i, column in enumerate(sums)}
+
+    for entry in totals.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        timeStampData[entry[:6]] = tuple(
+            entry[positions[total]] / entry[positions[rows]] if entry[positions[rows]] else None
+            for total, rows in averages.values()
         )
-    timeStampData = defaultdict(
-        lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict())))))
-
-    for entry in average_data:
-        side = entry['side']
-        team = entry['team__triCode']
-        role = entry['role']
-        if roleSearched.lower() != 'any':
-            if role.lower() != roleSearched.lower():
-                continue
-        player = entry['player__summonerName']
-        champ = entry['champ']
-        time = entry['time']
-
-        timeStampData[side][team][role][player][champ][time] = {
-            'avg_kills': entry['avg_kills'],
-            'avg_deaths': entry['avg_deaths'],
-            'avg_assists': entry['avg_assists'],
-            'avg_gold': entry['avg_gold'],
-            'avg_minions': entry['avg_minions'],
-            'avg_exp': entry['avg_exp'],
-            f'goldDiff@{time}': entry['goldDiff'],
-            f'expDiff@{time}': entry['expDiff']
-        }
     return timeStampData
 
 
-def getTeamDrakeInfo(gameIDs:list):
-    drakeData = {}
-
-    drakeTypeCountData = Drakes.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side', 'drakeType'). \
-        annotate(count=Count('id'))
-    avgTimeDrakeData = Drakes.objects.filter(gameID__gameID__in=gameIDs, first=True).values('team__triCode', 'side'). \
-        annotate(avgFirst=Avg('time'))
-    firstDrakeInfo = Drakes.objects.filter(gameID__gameID__in=gameIDs, first=True).values('team__triCode', 'side',
-                                                                                          'drakeType').annotate(
-        count=Count('id'))
-
-    for drake in drakeTypeCountData:
-        team = drake['team__triCode']
-        side = drake['side']
-        drake_type = drake['drakeType']
-        count = drake['count']
-
-        if team not in drakeData:
-            drakeData[team] = {}
-        if side not in drakeData[team]:
-            drakeData[team][side] = {}
-        drakeData[team][side][drake_type] = count;
-
-    for avgTime in avgTimeDrakeData:
-        team = avgTime['team__triCode']
-        side = avgTime['side']
-        avgFirst = avgTime['avgFirst']
-
-        if team not in drakeData:
-            drakeData[team] = {}
-        if side not in drakeData[team]:
-            drakeData[team][side] = {}
-        drakeData[team][side]['firstDrake']['avgTime'] = avgFirst
-
-    for drake in firstDrakeInfo:
-        team = drake['team__triCode']
-        side = drake['side']
-        drake_type = drake['drakeType']
-        count = drake['count']
-
-        if team not in drakeData:
-            drakeData[team] = {}
-        if side not in drakeData[team]:
-            drakeData[team][side] = {}
-        drakeData[team][side]['firstDrake'][drake_type] = count
-
-    return drakeData
-
-
-def getTeamHeraldInfo(gameIDs:list):
-    heraldData = {}
-
-    heraldCount = Heralds.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side').annotate(count=Count('id'))
-    firstHeraldCount = Heralds.objects.filter(gameID__gameID__in=gameIDs, first=True).values('team__triCode', 'side')\
-        .annotate(first_count=Count('id'))
-    avgFirstHeraldTime = Heralds.objects.filter(gameID__gameID__in=gameIDs, first=True).values('team__triCode', 'side')\
-        .annotate(avg_time=Avg('time'))
-    for herald in heraldCount:
-        team = herald['team__triCode']
-        side = herald['side']
-        count = herald['count']
-
-        if team not in heraldData:
-            heraldData[team] = {}
-        if side not in heraldData[team]:
-            heraldData[team][side] = {}
-        heraldData[team][side]['heralds'] = count
-
-    for first_herald in firstHeraldCount:
-        team = first_herald['team__triCode']
-        side = first_herald['side']
-        first_count = first_herald['first_count']
-
-        if team not in heraldData:
-            heraldData[team] = {}
-        if side not in heraldData[team]:
-            heraldData[team][side] = {}
-        heraldData[team][side]['firstHeralds'] = first_count
-
-    for avg_time in avgFirstHeraldTime:
-        team = avg_time['team__triCode']
-        side = avg_time['side']
-        avg_time_value = avg_time['avg_time']
-
-        if team not in heraldData:
-            heraldData[team] = {}
-        if side not in heraldData[team]:
-            heraldData[team][side] = {}
-        heraldData[team][side]['avgTimeToFirstHerald'] = avg_time_value
-
-    return heraldData
-
-
-def getBaronInfo(gameIDs:list):
-    baronData = {}
-    baronCount = Barons.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side').annotate(barons=Count('id'))
-
-    for baron in baronCount:
-        team = baron['team__triCode']
-        side = baron['side']
-        count = baron['count']
-
-        if team not in baronData:
-            baronData[team] = {}
-        if side not in baronData[team]:
-            baronData[team][side] = count
-
-    return baronData
-
-
-def getTeamFirstBloodInfo(gameIDs:list):
-    firstBloodData = {}
-
-    firstBloodCount = FirstBlood.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side').annotate(
-        totalFirstBlood=Count('id'))
-    firstBloodAvgTime = FirstBlood.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side').annotate(
-        avgTime=Avg('time'))
-    for fb in firstBloodCount:
-        team = fb['team__triCode']
-        side = fb['side']
-        totalFirstBlood = fb['totalFirstBlood']
-
-        totalGames = len(gameIDs)
-        firstBloodRate = (totalFirstBlood/totalGames)*100
-
-        if team not in firstBloodData:
-            firstBloodData[team]={}
-        if side not in firstBloodData[team]:
-            firstBloodData[team][side]['firstBloodRate']=firstBloodRate
-
-    for fb in firstBloodAvgTime:
-        team = fb['team__triCode']
-        side = fb['side']
-
-        if team not in firstBloodData:
-            firstBloodData[team] = {}
-        if side not in firstBloodData[team]:
-            firstBloodData[team][side]['avgTime'] = fb['avgTime']
-
-    return firstBloodData
-
-
-def getTeamTowersInfo(gameIDs:list):
-    turretData = {}
-
-    towerCounts = Towers.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side', 'lane').annotate(towerCount=Count('id'))
-    firstTowerTime = Towers.objects.filter(gameID__gameID__in=gameIDs, first=True).values('team__triCode', 'side', 'lane').annotate(avgTime=Avg('time'))
-
-    result = towerCounts.values('team__triCode', 'side', 'lane', 'towerCount').annotate(
-        firstTowerRate=F(Count('first'))/F('towerCount')
-    )
-
-    for entry in result:
-        team = entry['team__triCode']
-        side = entry['side']
-        lane = entry['lane']
-
-        if team not in turretData:
-            turretData[team]={}
-        if side not in turretData[team]:
-            turretData[team][side]={}
-        if lane not in turretData[team][side]:
-            turretData[team][side][lane] = {}
-            turretData[team][side][lane]['firstTowerStats'] = {}
-        if lane in turretData[team][side]:
-            turretData[team][side][lane]['towerCount'] = entry['towerCount']
-            turretData[team][side][lane]['firstTowerStats']['firstTowerRate'] = entry['firstTowerRate']
-
-    for entry in firstTowerTime:
-        team = entry['team__triCode']
-        side = entry['side']
-        lane = entry['lane']
-
-        if team not in turretData:
-            turretData[team] = {}
-        if side not in turretData[team]:
-            turretData[team][side] = {}
-        if lane not in turretData[team][side]:
-            turretData[team][side][lane] = {}
-            turretData[team][side][lane]['firstTowerStats'] = {}
-        if lane in turretData[team][side]:
-            turretData[team][side][lane]['firstTowerStats']['avgTime'] = entry['avgTime']
-
-    return turretData
-
-
-def getTeamPlatesInfo(gameIDs:list):
-    platesData = {}
-
-    platesCountLane = Plates.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side', 'lane').annotate(count=Count('id'))
-    platesCountSide = Plates.objects.filter(gameID__gameID__in=gameIDs).values('team__triCode', 'side').annotate(count=Count('id'))
-    for entry in platesCountLane:
-        team = entry['team__triCode']
-        side = entry['side']
-        lane = entry['lane']
-
-        if team not in platesData:
-            platesData[team] = {}
-        if side not in platesData[team]:
-            platesData[team][side] = {}
-        if lane not in platesData[team][side]:
-            platesData[team][side][lane] = entry['count']/len(gameIDs) #plates per game per lane
-
-    for entry in platesCountSide:
-        team = entry['team__triCode']
-        side = entry['side']
-
-        if team not in platesData:
-            platesData[team] = {}
-        if side not in platesData[team]:
-            platesData[team][side] = {}
-            platesData[team][side]['avgCountPerGame'] = entry['count']/len(gameIDs) #plates per game
-
-    return platesData
+def getTeamDrakeInfo(games: QuerySet, totalGames: int):
+    return getObjectiveData(games, totalGames, ['drakes'])['drakes']
+
+
+def getTeamHeraldInfo(games: QuerySet, totalGames: int):
+    return getObjectiveData(games, totalGames, ['heralds'])['heralds']
+
+
+def getBaronInfo(games: QuerySet, totalGames: int):
+    return getObjectiveData(games, totalGames, ['barons'])['barons']
+
+
+def getTeamFirstBloodInfo(games: QuerySet, totalGames: int):
+    return getObjectiveData(games, totalGames, ['firstBlood'])['firstBlood']
+
+
+def getTeamTowersInfo(games: QuerySet, totalGames: int):
+    return getObjectiveData(games, totalGames, ['towers'])['towers']
+
+
+def getTeamPlatesInfo(games: QuerySet, totalGames: int):
+    return getObjectiveData(games, totalGames, ['plates'])['plates']
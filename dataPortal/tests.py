@@ -1,3 +1,1064 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import tracemalloc
+from collections import Counter
+from importlib import import_module
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import NotSupportedError, connection
+from django.db.models import Avg, Count, F, Q
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .matchIngest import MatchImporter, END_GAME_STATS, readMatches
+from .benchmarks import SearchParameters
+from .forms import CommonDataSearchForm
+from .championStats import getChampionStats
+from .dataExport import iterExport
+from .draftSearch import gamePKsSubquery, getDraftIndex
+from .distributions import getTimestampDistributions, getEndGameDistributions
+from .models import patchKey, Competition, Draft, DraftPick, Game, ObjectiveEvent, Player, PlayerEndGameRollup, \
+    PlayerEndGameStats, PlayerTimeData, PlayerTimeRollup, SearchChoice, Teams, Drakes, Heralds, Barons, FirstBlood, \
+    Plates, Towers
+from .syntheticData import syntheticLeague
+from .objectiveData import getObjectiveData, getGameObjectiveTimeline
+from .rollups import getRollupCells, rebuildRollups, verifyRollups
+from .searchCache import bumpDataVersion, cacheable, cachedTeamDataSearch, checkSearchCacheBackend, getCacheStats, \
+    getDataVersion, getSearchCache
+from .sketches import TDigest, mergeSketches
+from .teamDataSearch import getSearchedGames, getDraftData, getEndGameDataStats, getTeamTimestampData, \
+    getRollupSearch, getRollupTimestampData, getSearchStages, iterTeamDataSearch, teamDataSearch, teamDataSearchAsync, \
+    SEARCH_STAGES, _mustRunSerially, _runSearchStageInThread
 
-# Create your tests here.
+FACT_TABLES = ('dataPortal_game', 'dataPortal_playerendgamestats', 'dataPortal_playertimedata', 'dataPortal_draftpick',
+               'dataPortal_objectiveevent')
+
+def fullTableScans(sql):
+    '''
+    Returns the fact tables the database plans to read in full for a query
+    '''
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+            scanned = [re.match(r'SCAN (\w+)', detail) for detail in plan]
+            tables = [match.group(1) for match in scanned if match]
+        elif connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql)
+            columns = [column[0] for column in cursor.description]
+            tables = [row['table'] for row in (dict(zip(columns, values)) for values in cursor.fetchall())
+                      if row['type'] == 'ALL']
+        else:
+            cursor.execute('EXPLAIN ' + sql)
+            tables = [table for (line,) in cursor.fetchall() for table in re.findall(r'Seq Scan on "?(\w+)', line)]
+    return [table for table in tables if table in FACT_TABLES]
+
+
+def referenceEndGameStats(games, role):
+    '''
+    getEndGameDataStats computed in Python from the raw rows and the game lengths
+    '''
+    stats = PlayerEndGameStats.objects.filter(gameID__in=games).values(
+        'team__triCode', 'side', 'role', 'player__summonerName', 'gameID__gameLength', *END_GAME_STATS)
+    games = {}
+    for row in stats:
+        if role == 'any' or row['role'] == role:
+            key = (row['team__triCode'], row['side'], row['role'], row['player__summonerName'])
+            games.setdefault(key, []).append(row)
+
+    reference = {}
+    for (team, side, playerRole, player), rows in games.items():
+        averages = {'avg_' + stat: sum(row[stat] for row in rows) / len(rows) for stat in END_GAME_STATS}
+        perMinute = {name: sum(row[stat] / (row['gameID__gameLength'].total_seconds() / 60) for row in rows) / len(rows)
+                     for name, stat in (('GPM', 'gold'), ('CSPM', 'minions'), ('VSPM', 'visionScore'),
+                                        ('DPM', 'DMGtoChamps'))}
+        kda = (averages['avg_kills'] + averages['avg_assists']) / averages['avg_deaths'] if averages['avg_deaths'] \
+            else None
+        reference.setdefault(team, {}).setdefault(side, {}).setdefault(playerRole, {})[player] = {
+            'KDA': kda, **perMinute, **averages}
+    return reference
+
+
+def referenceObjectiveData(games):
+    '''
+    The objective sections as the per-objective getters computed them before ObjectiveEvent: one set of queries per
+    legacy objective table, a key only appearing when there is a row to compute it from
+    '''
+    totalGames = games.count()
+    byTeamSide = lambda model, *fields, **filters: model.objects.filter(gameID__in=games, **filters).values(
+        'team__triCode', 'side', *fields)
+    sideData = lambda data, row: data.setdefault(row['team__triCode'], {}).setdefault(row['side'], {})
+
+    drakes = {}
+    for row in byTeamSide(Drakes, 'drakeType').annotate(count=Count('id')):
+        sideData(drakes, row)[row['drakeType']] = row['count']
+    for row in byTeamSide(Drakes, 'drakeType', first=True).annotate(count=Count('id')):
+        sideData(drakes, row).setdefault('firstDrake', {})[row['drakeType']] = row['count']
+    for row in byTeamSide(Drakes, first=True).annotate(avgFirst=Avg('time')):
+        sideData(drakes, row).setdefault('firstDrake', {})['avgTime'] = row['avgFirst']
+
+    heralds = {}
+    for row in byTeamSide(Heralds).annotate(count=Count('id')):
+        sideData(heralds, row)['heralds'] = row['count']
+    for row in byTeamSide(Heralds, first=True).annotate(count=Count('id'), avgTime=Avg('time')):
+        sideData(heralds, row).update({'firstHeralds': row['count'], 'avgTimeToFirstHerald': row['avgTime']})
+
+    barons = {}
+    for row in byTeamSide(Barons).annotate(count=Count('id')):
+        barons.setdefault(row['team__triCode'], {})[row['side']] = row['count']
+
+    firstBlood = {}
+    for row in byTeamSide(FirstBlood).annotate(count=Count('id'), avgTime=Avg('time')):
+        sideData(firstBlood, row).update({'firstBloodRate': row['count'] / totalGames * 100, 'avgTime': row['avgTime']})
+
+    towers = {}
+    firstTowers = {(row['team__triCode'], row['side'], row['lane']): row for row in byTeamSide(
+        Towers, 'lane', first=True).annotate(count=Count('id'), avgTime=Avg('time'))}
+    for row in byTeamSide(Towers, 'lane').annotate(count=Count('id')):
+        first = firstTowers.get((row['team__triCode'], row['side'], row['lane']))
+        firstTowerStats = {'firstTowerRate': first['count'] / row['count'] if first else 0}
+        if first:
+            firstTowerStats['avgTime'] = first['avgTime']
+        sideData(towers, row)[row['lane']] = {'towerCount': row['count'], 'firstTowerStats': firstTowerStats}
+
+    plates = {}
+    for row in byTeamSide(Plates, 'lane').annotate(count=Count('id')):
+        sideData(plates, row)[row['lane']] = row['count'] / totalGames
+    for row in byTeamSide(Plates).annotate(count=Count('id')):
+        sideData(plates, row)['avgCountPerGame'] = row['count'] / totalGames
+
+    return {'drakes': drakes, 'heralds': heralds, 'barons': barons, 'firstBlood': firstBlood, 'towers': towers,
+            'plates': plates}
+
+
+class SyntheticLeagueTestCase(TestCase):
+    '''
+    Base of the tests running on an imported synthetic league of GAMES games
+    '''
+    GAMES = 120
+
+    @classmethod
+    def setUpTestData(cls):
+        MatchImporter(batchSize=100).importMatches(syntheticLeague(games=cls.GAMES, teams=8, seed=8))
+
+    def assertNestedAlmostEqual(self, first, second):
+        if isinstance(second, dict):
+            self.assertEqual(set(first), set(second))
+            for key in second:
+                self.assertNestedAlmostEqual(first[key], second[key])
+        elif second is None:
+            self.assertIsNone(first)
+        elif isinstance(second, timedelta):
+            self.assertAlmostEqual(first.total_seconds(), second.total_seconds(), places=3)
+        else:
+            self.assertAlmostEqual(first, second)
+
+
+class AggregationQueryPlanTests(SyntheticLeagueTestCase):
+    '''
+    Every aggregator of teamDataSearch must reach the fact tables through an index when the games are filtered
+    '''
+    GAMES = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        MatchImporter(batchSize=100).importMatches(syntheticLeague(games=100, teams=8, seed=9,
+                                                                   competition='Synthetic Cup 2023'))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE TABLE ' + ', '.join(FACT_TABLES) if connection.vendor == 'mysql' else 'ANALYZE')
+
+    def setUp(self):
+        self.games = Game.objects.filter(patch='13.7').values('pk')
+        self.assertTrue(self.games.exists())
+
+    def assertNoFullTableScan(self, aggregate):
+        with CaptureQueriesContext(connection) as queries:
+            aggregate()
+        self.assertTrue(queries.captured_queries)
+        for query in queries.captured_queries:
+            self.assertEqual(fullTableScans(query['sql']), [], query['sql'])
+
+    def test_game_filter(self):
+        self.assertNoFullTableScan(lambda: list(Game.objects.filter(patch='13.7', date__gte='2023-03-01')))
+
+    def test_competition_filter(self):
+        competition = Competition.objects.get(name='Synthetic Cup 2023')
+        self.assertEqual((competition.region, competition.season, competition.split), ('Synthetic', '2023', 'Cup'))
+        search = SearchParameters(competition=str(competition.pk), patch='13.7')
+        self.assertEqual(getSearchedGames(search).count(), Game.objects.filter(gameID__startswith='SYN9_',
+                                                                               patch='13.7').count())
+        self.assertNoFullTableScan(lambda: list(getSearchedGames(search)))
+
+    def test_player_filters(self):
+        mid, jungler, opponent = 'T01_mid0', 'T01_jgl0', 'T02_mid0'
+        stats = PlayerEndGameStats.objects.values_list('gameID', 'side', 'player__summonerName')
+        sides = {}
+        for game, side, summonerName in stats:
+            sides.setdefault(game, {})[summonerName] = side
+        searches = [
+            (SearchParameters(player=mid), {game for game, players in sides.items() if mid in players}),
+            (SearchParameters(player=mid, teammate=jungler), {
+                game for game, players in sides.items() if players.get(mid) and players.get(mid) == players.get(jungler)}),
+            (SearchParameters(player=mid, opponent=opponent), {
+                game for game, players in sides.items() if players.get(mid) and players.get(opponent) and
+                players[mid] != players[opponent]}),
+        ]
+        for search, games in searches:
+            self.assertTrue(games)
+            self.assertEqual(set(getSearchedGames(search).values_list('pk', flat=True)), games)
+            self.assertNoFullTableScan(lambda: list(getSearchedGames(search)))
+
+    def test_patch_and_date_ranges(self):
+        search = SearchParameters(patchFrom='13.9', patchTo='13.12', dateFrom=date(2023, 3, 1))
+        games = [game for game in Game.objects.values('pk', 'patch', 'date')
+                 if (13, 9) <= tuple(map(int, game['patch'].split('.'))) <= (13, 12) and game['date'] >= date(2023, 3, 1)]
+        self.assertTrue(games)
+        self.assertEqual(set(getSearchedGames(search).values_list('pk', flat=True)), {game['pk'] for game in games})
+        self.assertNoFullTableScan(lambda: list(getSearchedGames(search)))
+
+    def test_draft(self):
+        self.assertNoFullTableScan(lambda: getDraftData(self.games, 'any'))
+        self.assertNoFullTableScan(lambda: getDraftData(self.games, 'mid'))
+
+    def test_end_game_stats(self):
+        for role in ('any', 'mid'):
+            self.assertNoFullTableScan(lambda: getEndGameDataStats(self.games, role))
+
+    def test_timestamp(self):
+        self.assertNoFullTableScan(lambda: getTeamTimestampData(self.games, 'any'))
+
+    def test_objectives(self):
+        self.assertNoFullTableScan(lambda: getObjectiveData(self.games, self.games.count()))
+
+    def test_objective_timeline(self):
+        game = Game.objects.first()
+        self.assertNoFullTableScan(lambda: getGameObjectiveTimeline(game))
+
+
+class EndGameStatsTests(SyntheticLeagueTestCase):
+    '''
+    End of game averages per team, side, role and player against a recompute in Python
+    '''
+
+    def setUp(self):
+        self.games = Game.objects.filter(patchKey__lte=patchKey('13.9')).values('pk')
+        self.assertTrue(self.games.exists())
+
+    def test_end_game_stats(self):
+        for role in ('any', 'mid'):
+            self.assertNestedAlmostEqual(getEndGameDataStats(self.games, role).nested(),
+                                         referenceEndGameStats(self.games, role))
+        projected = getEndGameDataStats(self.games, 'any', ['KDA', 'DPM']).nested()
+        self.assertEqual(set(projected['T01']['B']['mid']['T01_mid0']), {'KDA', 'DPM'})
+
+
+class ObjectiveDataTests(SyntheticLeagueTestCase):
+    '''
+    The single GROUP BY over ObjectiveEvent gives the sections the per-objective getters gave
+    '''
+
+    def setUp(self):
+        self.games = getSearchedGames(SearchParameters(patchFrom='13.3', patchTo='13.12')).values('pk')
+
+    def test_matches_per_objective_getters(self):
+        # the fixture has every objective on both sides, with and without the first flag
+        events = ObjectiveEvent.objects.filter(gameID__in=self.games)
+        for objectiveType in ('drake', 'herald', 'tower'):
+            self.assertEqual(set(events.filter(type=objectiveType).values_list('side', 'first').distinct()),
+                             {('B', True), ('B', False), ('R', True), ('R', False)}, objectiveType)
+        self.assertEqual(set(events.values_list('side', flat=True).distinct()), {'B', 'R'})
+
+        self.assertNestedAlmostEqual(getObjectiveData(self.games, self.games.count()),
+                                     referenceObjectiveData(self.games))
+        self.assertNestedAlmostEqual(getObjectiveData(self.games, self.games.count(), ('barons', 'plates')),
+                                     {kind: section for kind, section in referenceObjectiveData(self.games).items()
+                                      if kind in ('barons', 'plates')})
+
+
+class LaneDiffTests(SyntheticLeagueTestCase):
+    '''
+    goldDiff and expDiff are stored against the lane opponent: same game, role and time on the other side
+    '''
+    GAMES = 30
+
+    def assertLaneDiffs(self):
+        rows = {row['pk']: row for row in PlayerTimeData.objects.values(
+            'pk', 'gameID', 'role', 'time', 'side', 'gold', 'exp', 'opponent', 'goldDiff', 'expDiff')}
+        self.assertTrue(rows)
+        for row in rows.values():
+            opponent = rows[row['opponent']]
+            self.assertEqual((opponent['gameID'], opponent['role'], opponent['time']),
+                             (row['gameID'], row['role'], row['time']))
+            self.assertNotEqual(opponent['side'], row['side'])
+            self.assertEqual(opponent['opponent'], row['pk'])
+            self.assertAlmostEqual(row['goldDiff'], row['gold'] - opponent['gold'])
+            self.assertAlmostEqual(row['expDiff'], row['exp'] - opponent['exp'])
+
+    def test_paired_at_ingest(self):
+        self.assertLaneDiffs()
+
+    def test_backfill(self):
+        unpaired = Game.objects.order_by('pk')[:5]
+        PlayerTimeData.objects.filter(gameID__in=unpaired).update(opponent=None, goldDiff=None, expDiff=None)
+        call_command('backfill_lane_diffs', batch_size=2, stdout=io.StringIO())
+        self.assertLaneDiffs()
+        self.assertEqual(verifyRollups(), [])
+
+
+class TimestampRollupTests(SyntheticLeagueTestCase):
+    '''
+    Timestamp averages read from the rollup cells match the ones aggregated from the raw rows, before and after deletes
+    '''
+
+    def setUp(self):
+        # the verification of the cells is cached under the data version, which every TestCase starts from
+        getSearchCache().clear()
+        self.search = SearchParameters(patchFrom='13.5', patchTo='13.9', team='T03', role='bot')
+
+    def test_timestamp_rollups(self):
+        self.assertEqual(verifyRollups(), [])
+        raw = getTeamTimestampData(getSearchedGames(self.search).values('pk'), 'bot').nested()
+        rolledUp = getRollupTimestampData(getRollupCells(self.search.cleaned_data), 'bot').nested()
+        self.assertTrue(raw)
+        self.assertNestedAlmostEqual(rolledUp, raw)
+
+        self.assertIsNone(getRollupCells(SearchParameters(player='T03_bot0').cleaned_data))
+        Game.objects.filter(patch='13.6').delete()
+        self.assertEqual(verifyRollups(), [])
+
+    def test_moved_game(self):
+        game = Game.objects.filter(patch='13.6').order_by('pk').first()
+        game.patch = '13.7'
+        game.save()
+        self.assertEqual(verifyRollups(), [])
+        game.teamB, game.teamR = game.teamR, game.teamB
+        game.competitionID = None
+        game.save()
+        self.assertEqual(verifyRollups(), [])
+
+    def test_bypassed_writes(self):
+        self.assertEqual(getRollupSearch(self.search.cleaned_data, ['timeStamp']), self.search.cleaned_data)
+        PlayerTimeData.objects.filter(team__triCode='T03', role='bot').update(gold=F('gold') + 1000)
+        bumpDataVersion()
+        # the cells no longer match the rows, so the raw rows answer
+        self.assertIsNone(getRollupSearch(self.search.cleaned_data, ['timeStamp']))
+        raw = getTeamTimestampData(getSearchedGames(self.search).values('pk'), 'bot').nested()
+        self.assertNestedAlmostEqual(teamDataSearch(self.search, ['timeStamp'])['timeStamp'], raw)
+
+        rebuildRollups()
+        bumpDataVersion()
+        self.assertEqual(getRollupSearch(self.search.cleaned_data, ['timeStamp']), self.search.cleaned_data)
+
+    def test_verify_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(verifyRollups(), [])
+        # one aggregate per side and rollup model, no raw row read one by one
+        self.assertEqual(len(queries.captured_queries), 4)
+
+        timeCell = PlayerTimeRollup.objects.exclude(goldDiffSketch=None).first()
+        timeCell.goldDiffSketch['n'] += 1
+        timeCell.save()
+        endCell = PlayerEndGameRollup.objects.first()
+        endCell.games -= 1
+        endCell.save()
+        columns = ('patchKey', 'competitionID_id', 'side', 'team_id', 'opponentTeam_id', 'role', 'player_id')
+        self.assertEqual(sorted(verifyRollups(), key=str), sorted([
+            tuple(getattr(timeCell, column) for column in columns + ('champ', 'time')),
+            tuple(getattr(endCell, column) for column in columns),
+        ], key=str))
+
+
+class DistributionTests(SyntheticLeagueTestCase):
+    '''
+    Quantiles merged from the rollup sketches match the ones computed from the raw rows
+    '''
+
+    def setUp(self):
+        self.search = SearchParameters(patchFrom='13.5', patchTo='13.9', team='T03')
+
+    def test_distributions(self):
+        search = self.search
+        games = getSearchedGames(search).values('pk')
+        for getDistribution in (getTimestampDistributions, getEndGameDistributions):
+            merged = getDistribution(games, 'any', None, search.cleaned_data).nested()
+            self.assertTrue(merged)
+            # few enough values per player for the sketches to be exact, so merging cells must match the raw rows
+            self.assertNestedAlmostEqual(merged, getDistribution(games, 'any', None, None).nested())
+
+        Game.objects.filter(patch='13.6').delete()
+        self.assertEqual(verifyRollups(), [])
+        self.assertNestedAlmostEqual(getEndGameDistributions(games, 'mid', ['KDA'], search.cleaned_data).nested(),
+                                     getEndGameDistributions(games, 'mid', ['KDA'], None).nested())
+
+
+class ChampionStatsTests(SyntheticLeagueTestCase):
+    '''
+    Pick, ban, win and matchup counts of the champion engine against the drafts
+    '''
+
+    def setUp(self):
+        self.games = getSearchedGames(SearchParameters(patchFrom='13.5', patchTo='13.9')).values('pk')
+
+    def test_champion_stats(self):
+        games = self.games
+        stats = getChampionStats(games, 'mid')
+        champions = {champion: i for i, champion in enumerate(stats['champions'])}
+
+        picks, wins = {}, {}
+        for champion, side, winner, blue in DraftPick.objects.filter(gameID__in=games, slot='mid').values_list(
+                'champion', 'side', 'gameID__winnerTeam', 'gameID__teamB'):
+            picks[champion] = picks.get(champion, 0) + 1
+            wins[champion] = wins.get(champion, 0) + ((winner == blue) == (side == 'B'))
+        self.assertEqual(stats['games'], games.count())
+        self.assertEqual({champion: stats['picks'][i] for champion, i in champions.items() if stats['picks'][i]}, picks)
+        self.assertEqual({champion: stats['wins'][i] for champion, i in champions.items() if stats['picks'][i]}, wins)
+        self.assertEqual(sum(matchup[2] for matchup in stats['matchups']), 2 * games.count())
+        self.assertEqual(sum(matchup[3] for matchup in stats['matchups']), games.count())
+
+
+class DraftQueryTests(SyntheticLeagueTestCase):
+    '''
+    Draft queries resolved on the inverted index against the drafts of the searched team's games
+    '''
+
+    def setUp(self):
+        self.team = 'T03'
+        self.drafts = {}
+        for game, side, slot, champion, blue in DraftPick.objects.values_list('gameID', 'side', 'slot', 'champion',
+                                                                              'gameID__teamB__triCode'):
+            scope = 'us' if (side == 'B') == (blue == self.team) else 'enemy'
+            self.drafts.setdefault(game, set()).add((scope, slot, champion))
+
+    def test_draft_query(self):
+        team, drafts = self.team, self.drafts
+        teamGames = set(getSearchedGames(SearchParameters(team=team)).values_list('pk', flat=True))
+        picked = lambda draft, scope, champion, slots=('pick1', 'pick2', 'pick3', 'pick4', 'pick5'): any(
+            (scope, slot, champion) in draft for slot in slots)
+        enemyPicks = lambda game: {champion for scope, slot, champion in drafts[game] if scope == 'enemy' and
+                                   slot.startswith('pick')}
+        first = Counter(champion for game in teamGames for champion in enemyPicks(game)).most_common(1)[0][0]
+        second = Counter(champion for game in teamGames if first in enemyPicks(game) for champion in enemyPicks(game)
+                         if champion != first).most_common(1)[0][0]
+
+        searches = [
+            ('enemy:%s AND enemy:%s' % (first, second), lambda draft: picked(draft, 'enemy', first) and
+             picked(draft, 'enemy', second)),
+            ('(enemy:%s OR us.pick1:%s) AND NOT ban:%s' % (first.upper(), second, first), lambda draft: (
+                picked(draft, 'enemy', first) or picked(draft, 'us', second, ('pick1',))) and not (
+                picked(draft, 'us', first, ('ban1', 'ban2', 'ban3', 'ban4', 'ban5')) or
+                picked(draft, 'enemy', first, ('ban1', 'ban2', 'ban3', 'ban4', 'ban5')))),
+        ]
+        for query, matches in searches:
+            games = {game for game in teamGames if matches(drafts[game])}
+            self.assertTrue(games, query)
+            self.assertEqual(set(getSearchedGames(SearchParameters(team=team, draftQuery=query)).values_list(
+                'pk', flat=True)), games, query)
+
+        # matched games reach the database as one parameter, however many there are
+        self.assertEqual(Game.objects.filter(pk__in=gamePKsSubquery(list(range(1, 100001)))).count(),
+                         Game.objects.count())
+        with mock.patch.object(connection, 'vendor', 'oracle'), self.assertRaises(NotSupportedError):
+            gamePKsSubquery([1, 2])
+
+        self.assertFalse(CommonDataSearchForm({'draftQuery': 'enemy:%s' % first}).is_valid())
+        self.assertFalse(CommonDataSearchForm({'draftQuery': '(%s AND' % first}).is_valid())
+
+
+class ExportTests(SyntheticLeagueTestCase):
+    '''
+    CSV exports hold every row of the searched games, across chunks
+    '''
+
+    def setUp(self):
+        self.search = SearchParameters(team='T03', role='mid')
+
+    def test_export(self):
+        search = self.search
+        games = getSearchedGames(search)
+        for table, rows in (('endGameStats', PlayerEndGameStats.objects.filter(gameID__in=games, role='mid')),
+                            ('objectives', ObjectiveEvent.objects.filter(gameID__in=games))):
+            exported = list(csv.DictReader(io.StringIO(''.join(iterExport(search, table, 'csv', chunkSize=37)))))
+            self.assertTrue(exported)
+            self.assertEqual(len(exported), rows.count())
+            self.assertEqual({row['game'] for row in exported}, set(rows.values_list('gameID__gameID', flat=True)))
+
+        exported = list(csv.DictReader(io.StringIO(''.join(iterExport(search, 'games', 'csv', chunkSize=37)))))
+        self.assertEqual({(row['game'], float(row['gameLength'])) for row in exported},
+                         {(game.gameID, game.gameLength.total_seconds()) for game in games})
+
+
+class MatchImportTests(TestCase):
+    '''
+    Importing a match file twice must leave the database as the first import did, rollups included
+    '''
+    MODELS = (Teams, Player, Competition, Game, PlayerEndGameStats, PlayerTimeData, Draft, DraftPick, ObjectiveEvent,
+              PlayerTimeRollup, PlayerEndGameRollup)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'matches.ndjson')
+        with open(self.path, 'w', encoding='utf-8') as matchFile:
+            for match in syntheticLeague(games=30, teams=4, seed=3):
+                matchFile.write(json.dumps(match, default=str) + '\n')
+
+    def tableCounts(self):
+        return {model.__name__: model.objects.count() for model in self.MODELS}
+
+    def test_reimport_is_noop(self):
+        MatchImporter(batchSize=7).importMatches(readMatches(self.path))
+        counts = self.tableCounts()
+        rollups = list(PlayerTimeRollup.objects.order_by('pk').values_list('pk', 'rows', 'kills', 'gold', 'goldDiff'))
+        self.assertEqual(counts['Game'], 30)
+
+        importer = MatchImporter(batchSize=7)
+        with CaptureQueriesContext(connection) as queries:
+            importer.importMatches(readMatches(self.path))
+        self.assertEqual((importer.gamesImported, importer.gamesSkipped, importer.rowsWritten), (0, 30, 0))
+        self.assertEqual([query['sql'] for query in queries.captured_queries
+                          if re.match(r'\s*(INSERT|UPDATE|DELETE)', query['sql'])], [])
+        self.assertEqual(self.tableCounts(), counts)
+        self.assertEqual(list(PlayerTimeRollup.objects.order_by('pk').values_list(
+            'pk', 'rows', 'kills', 'gold', 'goldDiff')), rollups)
+        self.assertEqual(verifyRollups(), [])
+
+    def test_duplicate_team_tricodes(self):
+        oldest = Teams.objects.create(triCode='T00')
+        Teams.objects.create(triCode='T00', competition='Synthetic Cup 2023')
+        MatchImporter().importMatches(readMatches(self.path))
+        self.assertTrue(Game.objects.filter(teamB=oldest).exists() or Game.objects.filter(teamR=oldest).exists())
+        self.assertEqual(Teams.objects.filter(triCode='T00').count(), 2)
+
+    def test_rows_per_second_report(self):
+        messages = []
+        importer = MatchImporter(batchSize=10, log=messages.append)
+        importer.importMatches(readMatches(self.path))
+        self.assertEqual(len(messages), 3)
+        for games, message in zip((10, 20, 30), messages):
+            self.assertRegex(message, r'^%d games imported, 0 skipped, \d+ rows/s$' % games)
+        self.assertGreater(importer.rowsPerSecond, 0)
+        # every inserted row plus the lane pairing updates of the time data
+        self.assertEqual(importer.rowsWritten, sum(model.objects.count() for model in (
+            Game, PlayerEndGameStats, PlayerTimeData, Draft, DraftPick, ObjectiveEvent)) + sum(
+            model.objects.count() for model in (Drakes, Heralds, Barons, FirstBlood, Plates, Towers)) +
+            PlayerTimeData.objects.exclude(opponent=None).count())
+
+        output = io.StringIO()
+        call_command('import_matches', self.path, stdout=output)
+        self.assertRegex(output.getvalue(), r'0 games imported, 30 already present, 0 rows in [\d.]+s \(0 rows/s\)')
+
+
+class SearchChoiceTests(TestCase):
+    '''
+    The form's choices are read from SearchChoice, never from the match tables, and follow every import
+    '''
+
+    def setUp(self):
+        # every TestCase starts from the same DataVersion row, so choices cached by another class would be hit
+        cache.clear()
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=10, teams=4, seed=4))
+
+    def formChoices(self, field):
+        return [value for value, _ in CommonDataSearchForm().fields[field].choices if value]
+
+    def test_no_match_table_reads(self):
+        self.formChoices('team')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sorted(self.formChoices('team')), ['T00', 'T01', 'T02', 'T03'])
+            self.formChoices('competition')
+            self.formChoices('patch')
+        matchTables = FACT_TABLES + ('dataPortal_teams', 'dataPortal_player')
+        self.assertEqual([query['sql'] for query in queries.captured_queries
+                          if any(table in query['sql'] for table in matchTables)], [])
+
+    def test_invalidated_on_import(self):
+        self.assertEqual(len(self.formChoices('competition')), 1)
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=10, teams=6, seed=6,
+                                                                  competition='Synthetic Cup 2024'))
+        self.assertIn('T05', self.formChoices('team'))
+        self.assertIn('Synthetic Cup 2024', [label for _, label in CommonDataSearchForm().fields['competition'].choices])
+        patches = self.formChoices('patch')
+        self.assertEqual(patches, sorted(patches, key=patchKey))
+
+    def test_refresh_by_another_process(self):
+        self.formChoices('team')
+        # what an import in another process leaves behind: the rows and a new data version, this process's cache intact
+        SearchChoice.objects.create(field='team', value='NEW', label='NEW')
+        bumpDataVersion()
+        self.assertIn('NEW', self.formChoices('team'))
+
+
+class SearchCacheTests(TestCase):
+    '''
+    Cached searches are hit until the data version is bumped, once per saved or deleted game and once per import batch
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=20, teams=4, seed=4))
+
+    def setUp(self):
+        getSearchCache().clear()
+
+    def assertLookups(self, search, hits, misses):
+        before = getCacheStats()
+        teamData = cachedTeamDataSearch(search)
+        after = getCacheStats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (hits, misses))
+        return teamData
+
+    def test_hit_miss_and_invalidation(self):
+        search = SearchParameters(team='T01')
+        teamData = self.assertLookups(search, 0, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.assertLookups(search, 1, 0), teamData)
+
+        Game.objects.order_by('pk').first().save()
+        self.assertLookups(search, 0, 1)
+        self.assertLookups(search, 1, 0)
+
+        Game.objects.filter(Q(teamB__triCode='T01') | Q(teamR__triCode='T01')).order_by('pk').first().delete()
+        self.assertNotEqual(self.assertLookups(search, 0, 1), teamData)
+
+    def test_bumps(self):
+        version = getDataVersion()
+        with CaptureQueriesContext(connection) as queries:
+            Game.objects.order_by('pk').first().delete()
+        self.assertEqual(getDataVersion(), version + 1)
+        # the fact tables are fast deleted: one DELETE by game each, their rows are never fetched one by one
+        fastDeleted = {re.match(r'DELETE FROM "dataPortal_(\w+)" WHERE .*"gameID_id" IN', query['sql'])
+                       for query in queries.captured_queries}
+        self.assertTrue({'playerendgamestats', 'draftpick', 'objectiveevent'} <= {
+            match.group(1) for match in fastDeleted if match})
+
+        # one bump per batch and one for the refreshed search choices
+        MatchImporter(batchSize=5).importMatches(syntheticLeague(games=10, teams=4, seed=5))
+        self.assertEqual(getDataVersion(), version + 4)
+
+    def test_row_saves(self):
+        search = SearchParameters(team='T01')
+        self.assertLookups(search, 0, 1)
+        for model in (PlayerEndGameStats, PlayerTimeData, ObjectiveEvent, DraftPick):
+            version = getDataVersion()
+            model.objects.filter(gameID__teamB__triCode='T01').order_by('pk').first().save()
+            self.assertEqual(getDataVersion(), version + 1)
+            self.assertLookups(search, 0, 1)
+
+    def test_draft_delete(self):
+        draft = Draft.objects.order_by('pk').first()
+        version = getDataVersion()
+        draft.delete()
+        self.assertFalse(DraftPick.objects.filter(gameID=draft.gameID_id, side=draft.side).exists())
+        self.assertTrue(DraftPick.objects.filter(gameID=draft.gameID_id).exists())
+        self.assertEqual(getDataVersion(), version + 1)
+
+    def test_last_days(self):
+        since = date.today() - timedelta(days=7)
+        form = CommonDataSearchForm({'team': 'T01', 'lastDays': 7})
+        self.assertTrue(form.is_valid())
+        self.assertNotIn('lastDays', form.cleaned_data)
+        self.assertEqual(form.cleaned_data['dateFrom'], since)
+
+        # the same date range, however it was asked for, is one cache entry
+        self.assertLookups(form, 0, 1)
+        dateForm = CommonDataSearchForm({'team': 'T01', 'dateFrom': since.isoformat()})
+        self.assertTrue(dateForm.is_valid())
+        self.assertLookups(dateForm, 1, 0)
+        self.assertLookups(SearchParameters(team='T01', dateFrom=since), 1, 0)
+
+    def test_shared_backend_check(self):
+        localCaches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        sharedCaches = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=localCaches, TEAM_SEARCH_CACHE='default'):
+            self.assertEqual([error.id for error in checkSearchCacheBackend(None)], ['dataPortal.E001'])
+        with override_settings(CACHES=sharedCaches, TEAM_SEARCH_CACHE='default'):
+            self.assertEqual(checkSearchCacheBackend(None), [])
+
+
+class SectionSearchAPITests(SyntheticLeagueTestCase):
+    '''
+    The JSON API only computes the sections and fields it is asked for
+    '''
+    GAMES = 20
+
+    def setUp(self):
+        # every TestCase starts from the same DataVersion row, so entries cached by another class would be hit
+        getSearchCache().clear()
+        self.url = reverse('teamDataSearchAPI')
+
+    def leaves(self, node):
+        if all(isinstance(value, dict) for value in node.values()):
+            return [leaf for value in node.values() for leaf in self.leaves(value)]
+        return [node]
+
+    def test_sections(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'team': 'T01', 'sections': 'draft'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'yourSearch', 'draft'})
+        self.assertTrue(response.json()['draft'])
+        touched = {table for query in queries.captured_queries for table in FACT_TABLES if table in query['sql']}
+        self.assertEqual(touched - {'dataPortal_game', 'dataPortal_draftpick'}, set())
+
+        sections = self.client.get(self.url, {'team': 'T01', 'sections': 'barons,drakes'}).json()
+        self.assertEqual(set(sections), {'yourSearch', 'barons', 'drakes'})
+
+    def test_fields(self):
+        response = self.client.get(self.url, {'team': 'T01', 'sections': 'timeStamp',
+                                              'fields': 'timeStamp.avg_gold,timeStamp.goldDiff'})
+        self.assertEqual(set(response.json()), {'yourSearch', 'timeStamp'})
+        for leaf in self.leaves(response.json()['timeStamp']):
+            self.assertEqual({field.split('@')[0] for field in leaf}, {'avg_gold', 'goldDiff'})
+
+    def test_unknown_selection(self):
+        response = self.client.get(self.url, {'sections': 'draft,bans', 'fields': 'timeStamp.avg_wards'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['selection'], ['Unknown section: bans',
+                                                                  'Unknown field: timeStamp.avg_wards'])
+
+
+class SearchStreamTests(SyntheticLeagueTestCase):
+    '''
+    The NDJSON stream sends one JSON line per section and ends with an explicit end or error record
+    '''
+    GAMES = 20
+
+    def setUp(self):
+        self.url = reverse('teamDataSearchStream')
+
+    def streamedRecords(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.endswith('\n'))
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_well_formed(self):
+        records = self.streamedRecords(self.client.get(self.url, {'team': 'T01'}))
+        sections = [record['section'] for record in records[:-1]]
+        self.assertEqual(sections[0], 'yourSearch')
+        self.assertEqual(sorted(sections[1:]), sorted(section for stage in getSearchStages() for section in
+                                                      SEARCH_STAGES[stage]))
+        self.assertEqual(records[-1], {'end': True, 'sections': len(sections)})
+
+    def test_error_record(self):
+        def failingSearch(form, sections=None, fields=None):
+            yield 'yourSearch', {}
+            raise RuntimeError('stage failed')
+
+        with mock.patch('dataPortal.views.iterTeamDataSearch', failingSearch), self.assertLogs('dataPortal.views'):
+            records = self.streamedRecords(self.client.get(self.url, {'team': 'T01'}))
+        self.assertEqual(records, [{'section': 'yourSearch', 'data': {}},
+                                   {'error': 'The search failed after 1 sections.'}])
+
+
+class InstrumentationTests(SyntheticLeagueTestCase):
+    '''
+    Searches report their stages in a Server-Timing header and in the Prometheus metrics
+    '''
+    GAMES = 20
+
+    def setUp(self):
+        getSearchCache().clear()
+
+    def metricValue(self, series):
+        text = self.client.get(reverse('metrics')).content.decode()
+        match = re.search(r'^%s (\S+)$' % re.escape(series), text, re.M)
+        return float(match.group(1)) if match else 0
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('teamDataSearchAPI'), {'team': 'T01', 'sections': 'draft'})
+        timings = response['Server-Timing'].split(', ')
+        self.assertRegex(timings[0], r'^getDraftData;dur=\d+\.\d;desc="[1-9]\d* queries"$')
+        self.assertRegex(timings[-2], r'^db;dur=\d+\.\d;desc="[1-9]\d* queries"$')
+        self.assertRegex(timings[-1], r'^total;dur=\d+\.\d$')
+
+    def test_metrics(self):
+        stage = 'dataportal_stage_duration_seconds_count{stage="getDraftData"}'
+        view = 'dataportal_request_duration_seconds_count{view="teamDataSearchAPI"}'
+        misses = 'dataportal_search_cache_misses_total'
+        before = [self.metricValue(series) for series in (stage, view, misses)]
+        self.client.get(reverse('teamDataSearchAPI'), {'team': 'T01', 'sections': 'draft'})
+        self.assertEqual([self.metricValue(series) for series in (stage, view, misses)],
+                         [before[0] + 1, before[1] + 1, before[2] + 1])
+
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE dataportal_stage_duration_seconds histogram', text)
+        buckets = [int(count) for count in re.findall(
+            r'^dataportal_stage_duration_seconds_bucket\{stage="getDraftData",le="[^"]+"\} (\d+)$', text, re.M)]
+        self.assertEqual(len(buckets), 13)
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[-1], self.metricValue(stage))
+
+    def test_streamed_request_duration(self):
+        view = 'dataportal_request_duration_seconds_count{view="teamDataSearchStream"}'
+        before = self.metricValue(view)
+        response = self.client.get(reverse('teamDataSearchStream'), {'team': 'T01'})
+        self.assertRegex(response['Server-Timing'], r'total;dur=\d+\.\d$')
+        self.assertEqual(self.metricValue(view), before)
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(self.metricValue(view), before + 1)
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code, 403)
+        self.client.force_login(User.objects.create_user('analyst', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.7').status_code, 200)
+
+
+class MatchSearchViewTests(TestCase):
+    '''
+    The search page renders the team data of the search
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=20, teams=4, seed=4))
+
+    def test_rendered_results(self):
+        response = self.client.post(reverse('teamDataSearch'), {'team': 'T01', 'role': 'mid'})
+        self.assertEqual(response.status_code, 200)
+        end = response.context['teamData']['end']
+        self.assertIn('T01', end)
+        self.assertContains(response, '<li>teamSearched: T01</li>', html=True)
+        stats = end['T01']['B']['mid']['T01_mid0']
+        self.assertContains(response, '<td>T01_mid0</td>', html=True)
+        self.assertContains(response, '<td>%.1f</td>' % stats['GPM'], html=True)
+        draft = response.context['teamData']['draft']
+        side = next(iter(draft))
+        team = next(iter(draft[side]))
+        champion = next(iter(draft[side][team]['mid']))
+        self.assertContains(response, '<td>%s</td>' % champion, html=True)
+
+    def test_empty_form(self):
+        response = self.client.get(reverse('teamDataSearch'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Results:')
+
+
+class StagePoolTests(TransactionTestCase):
+    '''
+    The thread pool runs the stages on the workers' own connections, so the rows are committed rather than held in the
+    transaction of a TestCase
+    '''
+
+    def setUp(self):
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=20, teams=4, seed=4))
+        getDraftIndex()
+        if _mustRunSerially():
+            self.skipTest('the worker threads cannot reach an in-memory database')
+
+    def test_pool_matches_serial(self):
+        searches = [SearchParameters(), SearchParameters(team='T01', role='mid'),
+                    SearchParameters(team='T02', draftQuery='ban:"%s"' % DraftPick.objects.filter(
+                        slot='ban1').values_list('champion', flat=True).first())]
+        for search in searches:
+            with override_settings(TEAM_SEARCH_THREAD_POOL_SIZE=0):
+                serial = teamDataSearch(search)
+            with override_settings(TEAM_SEARCH_THREAD_POOL_SIZE=4):
+                pooled = teamDataSearch(search)
+                streamed = dict(iterTeamDataSearch(search))
+            self.assertEqual(pooled, serial)
+            self.assertEqual(streamed, serial)
+        self.assertTrue(any(thread.name.startswith('teamDataSearch') for thread in threading.enumerate()))
+
+    def test_worker_connections_reused(self):
+        maxAge = connection.settings_dict['CONN_MAX_AGE']
+        self.addCleanup(connection.settings_dict.__setitem__, 'CONN_MAX_AGE', maxAge)
+        connection.settings_dict['CONN_MAX_AGE'] = 60
+
+        def stageConnection():
+            _runSearchStageInThread('draft', Game.objects.values('pk'), 'any')
+            return connection.connection
+
+        with ThreadPoolExecutor(max_workers=1) as worker:
+            first, second = (worker.submit(stageConnection).result() for _ in range(2))
+            worker.submit(lambda: connection.close()).result()
+        self.assertIsNotNone(first)
+        self.assertIs(first, second)
+
+
+class AsyncSearchTests(TransactionTestCase):
+    '''
+    The async search answers like the sync one; its rows are committed so that the worker threads can read them
+    '''
+
+    def setUp(self):
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=20, teams=4, seed=4))
+        getDraftIndex()
+        self.champion = DraftPick.objects.filter(slot='ban1').values_list('champion', flat=True).first()
+
+    def test_async_draft_search(self):
+        search = SearchParameters(team='T01', draftQuery='ban:"%s"' % self.champion)
+        self.assertTrue(getSearchedGames(search).exists())
+        self.assertEqual(async_to_sync(teamDataSearchAsync)(search), teamDataSearch(search))
+
+    async def test_async_view(self):
+        response = await self.async_client.post(reverse('teamDataSearchAsync'), {
+            'team': 'T01', 'draftQuery': 'ban:"%s"' % self.champion})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['teamData']['yourSearch']['draftQuerySearched'], 'ban:"%s"' % self.champion)
+        self.assertContains(response, '<li>teamSearched: T01</li>', html=True)
+
+    def test_index_follows_imports(self):
+        search = SearchParameters(draftQuery='ban:"%s"' % self.champion)
+        games = set(getSearchedGames(search).values_list('pk', flat=True))
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=20, teams=4, seed=5))
+        # the index is rebuilt before answering: the imported games are found at once
+        self.assertGreater(set(getSearchedGames(search).values_list('pk', flat=True)), games)
+        self.assertTrue(cacheable(search.cleaned_data, getDataVersion()))
+
+    def test_background_index_rebuild(self):
+        index = getDraftIndex()
+        search = SearchParameters(draftQuery='ban:"%s"' % self.champion)
+
+        MatchImporter(batchSize=50).importMatches(syntheticLeague(games=20, teams=4, seed=5))
+        self.assertIs(getDraftIndex(stale=True), index)
+        self.assertFalse(cacheable(search.cleaned_data, getDataVersion()))
+        for thread in threading.enumerate():
+            if thread.name == 'draftIndex':
+                thread.join()
+
+        self.assertIsNot(getDraftIndex(stale=True), index)
+        self.assertTrue(cacheable(search.cleaned_data, getDataVersion()))
+
+
+class MemoryBudgetTests(TestCase):
+    '''
+    The aggregators read their rows in chunks and build flat sections, so the Python memory a search allocates follows
+    the size of its result, not the number of games: it stays flat from the first to the last of SEASONS (reading whole
+    result sets into nested defaultdicts grew with every game)
+    '''
+    # games of the seasons compared. With two teams every player has drafted every champion on both sides by the
+    # first one, so the seasons only differ by their number of games, not by the size of the search result
+    SEASONS = (600, 3000)
+    GROWTH = 1.25
+
+    def importSeason(self, games):
+        # the games of a smaller season are skipped as already imported
+        MatchImporter(batchSize=500).importMatches(syntheticLeague(games=games, teams=2, seed=11))
+        self.assertEqual(Game.objects.count(), games)
+
+    def peakMemory(self, search):
+        teamDataSearch(search)
+        tracemalloc.start()
+        try:
+            teamData = teamDataSearch(search)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(teamData['timeStamp'])
+        return peak
+
+    def test_search_peak_memory(self):
+        # the raw tables (dateFrom is not a rollup dimension) and the rollup cells
+        searches = {'raw': SearchParameters(dateFrom=date(2023, 1, 1)), 'rollup': SearchParameters()}
+        peaks = {name: [] for name in searches}
+        for games in self.SEASONS:
+            self.importSeason(games)
+            for name, search in searches.items():
+                peaks[name].append(self.peakMemory(search))
+        for name, (smallest, largest) in peaks.items():
+            self.assertLess(largest, smallest * self.GROWTH, '%s: %s' % (name, peaks[name]))
+
+
+class LegacyMigrationTests(TransactionTestCase):
+    '''
+    A database filled by 0001_initial (text team and player columns, objectives without side or first) must migrate
+    forward to models.py
+    '''
+    ROLES = ('top', 'jgl', 'mid', 'bot', 'sup')
+    SLOTS = ('ban1', 'ban2', 'ban3', 'ban4', 'ban5', 'pick1', 'pick2', 'pick3', 'pick4', 'pick5') + ROLES
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('dataPortal', '0001_initial')])
+        self.fillLegacyTables(executor.loader.project_state(('dataPortal', '0001_initial')).apps)
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        # small player groups, so the sketches are filled over several of them
+        with mock.patch.object(import_module('dataPortal.migrations.0013_rollup_sketches'), 'PLAYERS_PER_GROUP', 3):
+            executor.migrate(executor.loader.graph.leaf_nodes('dataPortal'))
+
+    def fillLegacyTables(self, apps):
+        model = lambda name: apps.get_model('dataPortal', name)
+        teams = {triCode: model('Teams').objects.create(triCode=triCode, competition='LCK 2023 Spring')
+                 for triCode in ('T1', 'GEN')}
+        players = {(triCode, role): model('Player').objects.create(summonerName=triCode + role, playerCode=triCode + role,
+                                                                   role=role, team=team)
+                   for triCode, team in teams.items() for role in self.ROLES}
+        columns = {'B': {role: role + 'B' for role in self.ROLES}, 'R': {role: role + 'R' for role in self.ROLES}}
+        columns['R']['jgl'] = 'jlgR'
+        for i in range(2):
+            game = model('Game').objects.create(
+                gameID='G%d' % i, competition='LCK 2023 Spring', date=date(2023, 1, 1 + i), patch='13.%d' % (i + 1),
+                gameLength=timedelta(minutes=30), winnerTeam='GEN', teamB='T1', teamR='GEN',
+                **{column: ('T1' if side == 'B' else 'GEN') + role for side in 'BR'
+                   for role, column in columns[side].items()})
+            for side, triCode in (('B', 'T1'), ('R', 'GEN')):
+                model('Draft').objects.create(gameID=game, side=side, team=teams[triCode],
+                                              **{slot: triCode + slot for slot in self.SLOTS})
+                for role in self.ROLES:
+                    model('PlayerTimeData').objects.create(
+                        gameID=game, player=players[triCode, role], team=triCode, side=side, role=role, champ=role,
+                        time=10, kills=0, deaths=0, assists=0, gold=3000, minions=80, exp=4000)
+            model('Drakes').objects.create(gameID=game, team=teams['GEN'], drakeType='ocean', time=timedelta(minutes=9))
+            model('Drakes').objects.create(gameID=game, team=teams['T1'], drakeType='infernal', time=timedelta(minutes=6))
+            model('FirstBlood').objects.create(gameID=game, team=teams['GEN'], killer=players['GEN', 'jgl'],
+                                               assistants='["GENmid"]', time=timedelta(minutes=3))
+            model('Plates').objects.create(gameID=game, team=teams['T1'], lane='top', killer=players['T1', 'top'],
+                                           assistants='T1jgl, T1mid', time=timedelta(minutes=7))
+
+    def test_games_and_objectives(self):
+        game = Game.objects.get(gameID='G1')
+        self.assertEqual((game.teamB.triCode, game.teamR.triCode, game.winnerTeam.triCode), ('T1', 'GEN', 'GEN'))
+        self.assertEqual((game.topB.summonerName, game.jglR.summonerName), ('T1top', 'GENjgl'))
+        self.assertEqual(game.competitionID.name, 'LCK 2023 Spring')
+        self.assertEqual(set(game.playertimedata_set.values_list('team__triCode', 'side')), {('T1', 'B'), ('GEN', 'R')})
+
+        self.assertEqual(sorted(ObjectiveEvent.objects.filter(gameID=game).values_list(
+            'type', 'detail', 'team__triCode', 'side', 'first', 'assistants')), [
+            ('drake', 'infernal', 'T1', 'B', True, None),
+            ('drake', 'ocean', 'GEN', 'R', False, None),
+            ('firstBlood', '', 'GEN', 'R', True, ['GENmid']),
+            ('plate', 'top', 'T1', 'B', False, ['T1jgl', 'T1mid']),
+        ])
+        self.assertEqual(verifyRollups(), [])
+
+    def test_draft_picks_and_rollups(self):
+        game = Game.objects.get(gameID='G0')
+        self.assertEqual(set(DraftPick.objects.filter(gameID=game).values_list('side', 'team__triCode')),
+                         {('B', 'T1'), ('R', 'GEN')})
+        self.assertEqual(DraftPick.objects.get(gameID=game, side='R', slot='pick3').champion, 'GENpick3')
+        self.assertEqual(set(PlayerTimeRollup.objects.values_list('side', 'team__triCode', 'opponentTeam__triCode')),
+                         {('B', 'T1', 'GEN'), ('R', 'GEN', 'T1')})
+
+
+class SketchTests(SimpleTestCase):
+    def test_merged_quantiles(self):
+        rng = random.Random(3)
+        values = [rng.gauss(0, 1000) for _ in range(20000)]
+        parts = [TDigest() for _ in range(16)]
+        for i, value in enumerate(values):
+            parts[i % 16].add(value)
+        digest = mergeSketches(part.toJSON() for part in parts)
+
+        values.sort()
+        self.assertEqual(digest.count, len(values))
+        self.assertEqual((digest.quantile(0), digest.quantile(1)), (values[0], values[-1]))
+        for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+            rank = sum(value <= digest.quantile(q) for value in values) / len(values)
+            self.assertAlmostEqual(rank, q, delta=0.005)
+        self.assertLess(len(digest.centroids), 2 * digest.compression)
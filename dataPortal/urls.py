@@ -5,4 +5,10 @@ urlpatterns = [
     path("", views.index, name="index"),
     path('register/', views.register, name='register'),
     path('teamDataSearch/', views.match_search, name='teamDataSearch'),
+    path('teamDataSearch/api/', views.team_search_api, name='teamDataSearchAPI'),
+    path('teamDataSearch/stream/', views.team_search_stream, name='teamDataSearchStream'),
+    path('teamDataSearch/async/', views.match_search_async, name='teamDataSearchAsync'),
+    path('teamDataSearch/champions/', views.champion_stats, name='championStats'),
+    path('teamDataSearch/export/', views.export_data, name='teamDataExport'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
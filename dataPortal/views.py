@@ -1,8 +1,19 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+import json
+import logging
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.forms import UserCreationForm
 from .forms import CommonDataSearchForm
-from .teamDataSearch import *
+from .teamDataSearch import iterTeamDataSearch, SEARCH_SECTIONS, SECTION_FIELDS
+from asgiref.sync import sync_to_async
+from .searchCache import cachedTeamDataSearch, cachedTeamDataSearchAsync
+from .instrumentation import renderMetrics
+from .championStats import cachedChampionStats
+from .dataExport import iterExport, EXPORT_TABLES
+
+logger = logging.getLogger(__name__)
 
 def index(request):
     return HttpResponse("Hello world, you're at the data portal index.")
@@ -24,11 +35,132 @@ def match_search(request):
     if request.method == 'POST':
         form = CommonDataSearchForm(request.POST)
         if form.is_valid():
-            teamSearchData = teamDataSearch(form)
+            teamSearchData = cachedTeamDataSearch(form)
 
             '''
             ricerca dei match e passaggio dei risultati al template come variabili di contesto
             '''
-            return render(request=request, template_name='dataPortal/teamDataSearch.html', context={'form': form, 'matches': matches})
+            return render(request=request, template_name='dataPortal/teamDataSearch.html', context={'form': form, 'teamData': teamSearchData})
     return render(request, 'dataPortal/teamDataSearch.html', {'form': form})
 
+
+async def match_search_async(request):
+    '''
+    match_search for ASGI deployments: the aggregations of the search run concurrently
+    '''
+    form = CommonDataSearchForm()
+    if request.method == 'POST':
+        form = CommonDataSearchForm(request.POST)
+        if await sync_to_async(form.is_valid)():
+            teamSearchData = await cachedTeamDataSearchAsync(form)
+            return await sync_to_async(render)(request=request, template_name='dataPortal/teamDataSearch.html',
+                                               context={'form': form, 'teamData': teamSearchData})
+    return await sync_to_async(render)(request, 'dataPortal/teamDataSearch.html', {'form': form})
+
+
+def parseSearchSelection(query):
+    '''
+    Reads the sections (?sections=draft,timeStamp) and the per-section fields (?fields=timeStamp.avg_gold,
+    timeStamp.goldDiff) asked for by an API call. Returns (sections, fields, errors)
+    '''
+    errors = []
+
+    sections = None
+    requestedSections = [section for value in query.getlist('sections') for section in value.split(',') if section]
+    if requestedSections:
+        sections = [section for section in SEARCH_SECTIONS if section in requestedSections]
+        errors += ["Unknown section: %s" % section for section in requestedSections if section not in SEARCH_SECTIONS]
+
+    fields = {}
+    for value in query.getlist('fields'):
+        for projection in filter(None, value.split(',')):
+            section, _, field = projection.partition('.')
+            if field not in SECTION_FIELDS.get(section, ()):
+                errors.append("Unknown field: %s" % projection)
+            else:
+                fields.setdefault(section, []).append(field)
+
+    return sections, fields, errors
+
+
+def team_search_api(request):
+    '''
+    JSON version of the team search that only computes the sections asked for, e.g.
+    teamDataSearch/api/?team=T1&sections=draft or ?sections=timeStamp&fields=timeStamp.avg_gold,timeStamp.goldDiff
+    '''
+    form = CommonDataSearchForm(request.GET)
+    sections, fields, errors = parseSearchSelection(request.GET)
+    if not form.is_valid() or errors:
+        return JsonResponse({'errors': {**form.errors, 'selection': errors}}, status=400)
+
+    return JsonResponse(cachedTeamDataSearch(form, sections, fields))
+
+
+def team_search_stream(request):
+    '''
+    Streams the team search as NDJSON, one {"section": ..., "data": ...} line per section as soon as it is computed,
+    then {"end": true, "sections": n}, or {"error": ...} when the search failed midway. Takes the same parameters as
+    team_search_api
+    '''
+    form = CommonDataSearchForm(request.GET)
+    sections, fields, errors = parseSearchSelection(request.GET)
+    if not form.is_valid() or errors:
+        return JsonResponse({'errors': {**form.errors, 'selection': errors}}, status=400)
+
+    return StreamingHttpResponse(searchStreamLines(form, sections, fields), content_type='application/x-ndjson')
+
+
+def searchStreamLines(form, sections=None, fields=None):
+    # the status is sent before the first section, so the last line is what tells a client the stream is complete
+    sent = 0
+    try:
+        for section, data in iterTeamDataSearch(form, sections, fields):
+            yield json.dumps({'section': section, 'data': data}, cls=DjangoJSONEncoder) + '\n'
+            sent += 1
+    except Exception:
+        logger.exception('Streamed team search failed after %d sections', sent)
+        yield json.dumps({'error': 'The search failed after %d sections.' % sent}) + '\n'
+        return
+    yield json.dumps({'end': True, 'sections': sent}) + '\n'
+
+
+def champion_stats(request):
+    '''
+    Pick, ban and win rates of every champion and their lane matchups over the games matching the search, e.g.
+    teamDataSearch/champions/?patch=13.10&role=mid
+    '''
+    form = CommonDataSearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+
+    return JsonResponse(cachedChampionStats(form))
+
+
+def export_data(request):
+    '''
+    Streams one table of the games matching the search as CSV or Parquet, e.g.
+    teamDataSearch/export/?team=T1&table=endGameStats&format=parquet
+    '''
+    form = CommonDataSearchForm(request.GET)
+    table, exportFormat = request.GET.get('table', 'endGameStats'), request.GET.get('format', 'csv')
+    if not form.is_valid() or table not in EXPORT_TABLES:
+        return JsonResponse({'errors': {**form.errors, 'table': [] if table in EXPORT_TABLES else [
+            'Unknown table: %s' % table]}}, status=400)
+    try:
+        content = iterExport(form, table, exportFormat)
+    except ValueError as error:
+        return JsonResponse({'errors': {'format': [str(error)]}}, status=400)
+
+    response = StreamingHttpResponse(content, content_type='text/csv' if exportFormat == 'csv' else
+                                     'application/vnd.apache.parquet')
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (table, exportFormat)
+    return response
+
+
+def metrics(request):
+    '''
+    The Prometheus metrics of this process, for staff users and the addresses in METRICS_ALLOWED_IPS
+    '''
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return HttpResponseForbidden()
+    return HttpResponse(renderMetrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
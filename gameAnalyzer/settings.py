@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'dataPortal.instrumentation.StageTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,6 +85,9 @@ DATABASES = {
         'PORT': 3306,
         'USER': 'root',
         'PASSWORD': 'Dario5968457',
+        # connections (of requests and of the search worker threads) are reused for a minute instead of per request
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
         'OPTIONS': {
           'autocommit': True,
         },
@@ -91,6 +95,45 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# teamDataSearch results live in their own cache so that they can be moved to a shared backend
+# (django.core.cache.backends.filebased.FileBasedCache or django.core.cache.backends.db.DatabaseCache) when more than
+# one process serves the site; `manage.py check --deploy` reports a process-local backend (dataPortal.E001). Their
+# validity is tracked by the DataVersion row, not by the cache. TIMEOUT is the TTL of an entry, MAX_ENTRIES bounds the
+# cache (locmem evicts the least recently used entries first).
+# locmem is for development only: with DEBUG off the processes of the host share a file cache instead.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'teamDataSearch': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache' if DEBUG else
+        'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': 'teamDataSearch' if DEBUG else BASE_DIR / 'cache' / 'teamDataSearch',
+        'TIMEOUT': 60 * 30,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+}
+
+TEAM_SEARCH_CACHE = 'teamDataSearch'
+
+# Stages of a search run at the same time by the async view (dataPortal.views.match_search_async)
+TEAM_SEARCH_ASYNC_CONCURRENCY = 4
+
+# Size of the process-wide thread pool the WSGI search hands its stages to, each worker on its own DB connection (kept
+# for CONN_MAX_AGE).
+# 0 or 1 runs the stages serially; they always run serially inside a transaction (and therefore in tests).
+TEAM_SEARCH_THREAD_POOL_SIZE = 4
+
+# Addresses allowed to scrape /metrics/ besides logged-in staff (dataPortal.views.metrics)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 